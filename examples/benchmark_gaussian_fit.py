@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares the time per Gaussian fit of a simulated sweep,
+with curve_fit using finite differences on gaussian_ND (before) and with
+the analytic Jacobian and preallocated buffers of GaussianNDModel (after), as
+a function of dimension and grid size.
+"""
+
+import numpy as np
+import time
+from scipy.optimize import curve_fit
+from laser_calibration.grid_sweep_optimize_ND import gaussian_ND, GaussianNDModel
+
+def time_fit(fit, repeats):
+    start_time = time.perf_counter()
+    for repeat in range(repeats):
+        popt = fit()
+    return (time.perf_counter() - start_time)/repeats, popt
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    
+    print(f"{'dimension':>9} {'points':>9} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}")
+    for dimension, step in [(1, 0.01), (1, 0.001), (2, 0.1), (2, 0.02), (3, 0.1), (3, 0.05), (4, 0.1), (5, 0.2)]:
+        meshgrid_arg = [np.arange(-1, 1, step)]*dimension
+        grid = np.meshgrid(*meshgrid_arg, indexing="ij")
+        
+        centers = rng.uniform(-0.3, 0.3, dimension)
+        widths = rng.uniform(0.3, 0.5, dimension)
+        p_true = [100] + [value for pair in zip(centers, widths) for value in pair]
+        response = rng.poisson(gaussian_ND(grid, *p_true)).astype(float)
+        
+        # start away from the solution, as with a moment-based guess
+        p0 = [80] + [value for pair in zip(centers + 0.05, widths*1.2) for value in pair]
+        repeats = max(1, int(2e5/response.size))
+        
+        before, popt_before = time_fit(lambda: curve_fit(gaussian_ND, grid, response, p0)[0], repeats)
+        
+        def fit_after():
+            model = GaussianNDModel(grid)
+            return curve_fit(model, grid, response, p0, jac=model.jacobian)[0]
+        after, popt_after = time_fit(fit_after, repeats)
+        
+        assert np.allclose(popt_before, popt_after, rtol=1e-4, atol=1e-6)
+        print(f"{dimension:>9} {response.size:>9} {before*1e3:>12.3f} {after*1e3:>11.3f} {before/after:>8.2f}")
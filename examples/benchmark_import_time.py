@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark measures, in fresh interpreters, the time to import the
+calibration API for a headless sweep, compared with also importing the
+matplotlib and scipy.optimize modules it used to load at import time.
+"""
+
+import statistics
+import subprocess
+import sys
+
+if __name__ == "__main__":
+    # parameters
+    repeats = 5
+    
+    headless = "import laser_calibration; laser_calibration.LaserCalibrationSystem; import laser_calibration.grid_sweep_optimize_ND"
+    cases = {
+        "headless": headless,
+        "with matplotlib and scipy.optimize": headless + "; import scipy.optimize, scipy.special; from matplotlib import pyplot",
+    }
+    
+    for label, statement in cases.items():
+        code = "import time; start_time = time.perf_counter(); " + statement + "; print(time.perf_counter() - start_time)"
+        times = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout) for repeat in range(repeats)]
+        print(f"\33[0;49;36m{label}:\33[0;49;38m {1e3*statistics.median(times):.0f} ms")
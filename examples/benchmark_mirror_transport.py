@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares the time per point of moving three mirrors on a
+controller behind a link with 2 ms of latency (emulated on localhost by
+ControllerEmulator): with one request per axis (before), with the axes
+coalesced into one request by TransportMirror (after), and with requests
+pipelined without waiting for each acknowledgement.
+"""
+
+import numpy as np
+import time
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import Mirror
+from laser_calibration.mirror_transport import ControllerEmulator, MirrorController, TransportMirror
+
+if __name__ == "__main__":
+    # parameters
+    latency = 2e-3
+    number_of_points = 200
+    axes = ["x","y","z"]
+    
+    positions = np.random.default_rng(0).uniform(-1, 1, (number_of_points, len(axes)))
+    
+    with ControllerEmulator(latency=latency, axes=axes) as emulator, MirrorController(*emulator.address) as controller:
+        # one request per axis, as with a move_mirror_function per mirror
+        per_axis = LaserCalibrationSystem(ion_response_function=None)
+        for axis in axes:
+            per_axis.add_mirror(axis, Mirror(lambda position, axis=axis: controller.move({axis: position})))
+        
+        coalesced = LaserCalibrationSystem(ion_response_function=None)
+        for axis in axes:
+            coalesced.add_mirror(axis, TransportMirror(controller, axis))
+        
+        for label, syst in [("one request per axis", per_axis), ("coalesced", coalesced)]:
+            requests = emulator.requests_received
+            start_time = time.perf_counter()
+            for position in positions:
+                syst.move_mirrors_vector(position)
+            elapsed = time.perf_counter() - start_time
+            print(f"\33[0;49;36m{label}:\33[0;49;38m {1e3*elapsed/number_of_points:.2f} ms per point, {(emulator.requests_received - requests)/number_of_points:.0f} requests per point")
+        
+        # e.g. a scan path sent ahead, acknowledged as the mirrors get there
+        start_time = time.perf_counter()
+        futures = [controller.submit(dict(zip(axes, position.tolist()))) for position in positions]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - start_time
+        print(f"\33[0;49;36mpipelined:\33[0;49;38m {1e3*elapsed/number_of_points:.2f} ms per point")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares the per-point overhead of moving mirrors and
+measuring through the keyword-argument API (move_mirrors_and_measure) and
+through the positions vector (move_and_measure_vector), with mirrors and a
+measurement that do no work, so that only the bookkeeping is timed.
+"""
+
+import numpy as np
+import timeit
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+
+if __name__ == "__main__":
+    # parameters
+    number_of_points = 20000
+    mirror_names = ["x","y","z"]
+    
+    syst = LaserCalibrationSystem(ion_response_function=lambda x,y,z: 1.0)
+    for mirror_name in mirror_names:
+        syst.add_mirror(mirror_name, lambda position: None)
+    syst.simulation = True
+    syst.simulation_mirror_set = mirror_names
+    
+    positions = np.random.default_rng(0).uniform(-1, 1, (number_of_points, len(mirror_names)))
+    indices = syst.mirror_indices(mirror_names)
+    
+    measure_dict = lambda: [syst.move_mirrors_and_measure(**dict(zip(mirror_names, position))) for position in positions]
+    measure_vector = lambda: [syst.move_and_measure_vector(position, indices) for position in positions]
+    
+    for label, measure in [("move_mirrors_and_measure", measure_dict), ("move_and_measure_vector", measure_vector)]:
+        elapsed = min(timeit.repeat(measure, number=1, repeat=3))
+        print(f"\33[0;49;36m{label}:\33[0;49;38m {1e6*elapsed/number_of_points:.2f} us per point")
+    
+    print(f"\33[0;49;36mPositions:\33[0;49;38m {syst.positions}")
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark measures the throughput, in points per second, of the PSF
+models of psf_models evaluated on a whole 2D grid in one call, and of the
+Airy pattern evaluated with scipy.special.j1 per point for comparison.
+"""
+
+import numpy as np
+import timeit
+from scipy.special import j1
+from laser_calibration.psf_models import GaussianPSF, AiryPSF
+
+if __name__ == "__main__":
+    # parameters
+    grid_size = 500
+    
+    x, y = np.meshgrid(np.linspace(-1, 1, grid_size), np.linspace(-1, 1, grid_size), indexing="ij")
+    
+    def airy_bessel(x, y):
+        v = AiryPSF.FIRST_ZERO*np.hypot(x - 0.1, y - 0.2)/0.2
+        return 100*np.where(v > 0, (2*j1(v)/np.where(v > 0, v, 1))**2, 1)
+    
+    models = {
+        "Gaussian, axis-aligned": GaussianPSF.from_widths(100, [0.1, 0.2], [0.3, 0.2]),
+        "Gaussian, rotated": GaussianPSF.from_widths(100, [0.1, 0.2], [0.3, 0.2], rotation=0.5),
+        "Airy, table": AiryPSF(100, [0.1, 0.2], 0.2),
+        "Airy, scipy.special.j1": airy_bessel,
+        "2 Airy + Gaussian + background": AiryPSF(100, [0.1, 0.2], 0.2) + AiryPSF(50, [-0.3, 0.2], 0.2) + GaussianPSF.from_widths(20, [0, 0], 0.5) + 2,
+    }
+    
+    for label, model in models.items():
+        elapsed = min(timeit.repeat(lambda: model(x, y), number=5, repeat=3))/5
+        print(f"\33[0;49;36m{label}:\33[0;49;38m {x.size/elapsed/1e6:.1f} million points per second")
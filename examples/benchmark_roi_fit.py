@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares the fit time and center error of
+grid_sweep_optimize_ND when fitting the whole grid and when fitting a
+region of interest around the peak with Poisson weights, on 3D and 4D
+sweeps of simulated ions with random centers and widths over a background.
+"""
+
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+from laser_calibration.instrumentation import instrumentation
+import numpy as np
+import contextlib
+import io
+
+if __name__ == "__main__":
+    # parameters
+    photon_number = 50
+    background = 1
+    roi = 3
+    repeats = 5
+    
+    rng = np.random.default_rng(1)
+    instrumentation.enabled = True
+    for dimension, step in [(3, 0.05), (4, 0.1)]:
+        results = {None: [], roi: []}
+        for repeat in range(repeats):
+            center = rng.uniform(-0.4, 0.4, dimension)
+            width = rng.uniform(0.15, 0.3, dimension)
+            photon_distribution = lambda *r: photon_number*np.exp(-sum(((r[index]-center[index])/width[index])**2 for index in range(dimension))) + background
+            
+            for fit_roi in results:
+                sim = IonResponseSimulation(photon_distribution, seed=repeat)
+                syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+                mirror_names = ["x"+str(index) for index in range(dimension)]
+                for mirror_name in mirror_names:
+                    syst.add_mirror(mirror_name, None)
+                syst.simulation = True
+                syst.simulation_mirror_set = mirror_names
+                
+                instrumentation.reset()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    output, info = grid_sweep_optimize_ND(syst, step=step, plot=False, roi=fit_roi, full_output=True)
+                error = np.max(np.abs([output[mirror_name] - center[index] for index, mirror_name in enumerate(mirror_names)]))
+                results[fit_roi].append((instrumentation.data()["fit"]["total"], error, info["fit_points"]))
+        
+        for fit_roi, result in results.items():
+            fit_time, error, fit_points = np.mean(result, axis=0)
+            label = "whole grid" if fit_roi is None else "region of interest"
+            print(f"\33[0;49;36m{dimension}D, {label}:\33[0;49;38m fit time {1e3*fit_time:.1f} ms, {fit_points:.0f} points, mean center error {error:.4f}")
+    instrumentation.enabled = False
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares peak memory and time of the Gaussian fit of a
+simulated sweep in 4 to 6 dimensions, with the grid as dense np.meshgrid
+arrays (before) and as a SeparableGrid of 1D axes (after), on which
+GaussianNDModel is evaluated as an outer product of 1D factors.
+"""
+
+import numpy as np
+import time
+import tracemalloc
+from scipy.optimize import curve_fit
+from laser_calibration.grid_sweep_optimize_ND import gaussian_ND, GaussianNDModel, SeparableGrid
+
+def measure_fit(fit):
+    # timed and memory-traced separately, as tracing slows numpy down
+    start_time = time.perf_counter()
+    popt = fit()
+    elapsed = time.perf_counter() - start_time
+    
+    tracemalloc.start()
+    fit()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, popt
+
+def fit_dense(meshgrid_arg, response, p0):
+    grid = np.meshgrid(*meshgrid_arg, indexing="ij")
+    model = GaussianNDModel(grid)
+    return curve_fit(model, grid, response, p0, jac=model.jacobian)[0]
+
+def fit_separable(meshgrid_arg, response, p0):
+    grid = SeparableGrid(meshgrid_arg)
+    model = GaussianNDModel(grid)
+    return curve_fit(model, grid, response, p0, jac=model.jacobian)[0]
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    
+    print(f"{'dimension':>9} {'points':>9} {'before (MiB)':>13} {'after (MiB)':>12} {'before (s)':>11} {'after (s)':>10}")
+    for dimension, step in [(4, 0.1), (5, 0.2), (6, 0.25)]:
+        meshgrid_arg = [np.arange(-1, 1, step)]*dimension
+        
+        centers = rng.uniform(-0.3, 0.3, dimension)
+        widths = rng.uniform(0.3, 0.5, dimension)
+        p_true = [100] + [value for pair in zip(centers, widths) for value in pair]
+        response = rng.poisson(gaussian_ND(SeparableGrid(meshgrid_arg), *p_true)).astype(float)
+        
+        # start away from the solution, as with a moment-based guess
+        p0 = [80] + [value for pair in zip(centers + 0.05, widths*1.2) for value in pair]
+        
+        before, before_peak, popt_before = measure_fit(lambda: fit_dense(meshgrid_arg, response, p0))
+        after, after_peak, popt_after = measure_fit(lambda: fit_separable(meshgrid_arg, response, p0))
+        
+        assert np.allclose(popt_before, popt_after, rtol=1e-9, atol=1e-12)
+        print(f"{dimension:>9} {response.size:>9} {before_peak/2**20:>13.1f} {after_peak/2**20:>12.1f} {before:>11.3f} {after:>10.3f}")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This benchmark compares the per-call latency of single-point simulated
+measurements, drawing the photon number with scipy.stats.poisson.rvs and
+the noise with np.random.normal on every call (before), and with the
+per-instance numpy.random.Generator of IonResponseSimulation, with noise
+drawn in blocks (after).
+"""
+
+import numpy as np
+import timeit
+from scipy.stats import poisson
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+
+if __name__ == "__main__":
+    # parameters
+    number_of_calls = 20000
+    measurement_noise = 1
+    
+    photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y-0.2)**2/0.3**2)
+    
+    def measure_before(x, y):
+        photon_number = poisson.rvs(photon_distribution(x, y), size=1)[0]
+        return photon_number + int(np.random.normal(loc=0, scale=measurement_noise))
+    
+    sim = IonResponseSimulation(photon_distribution, measurement_noise=measurement_noise, seed=0)
+    
+    for label, measure in [("before", measure_before), ("after", sim.measure_ion_response)]:
+        elapsed = min(timeit.repeat(lambda: measure(0.1, 0.2), number=number_of_calls, repeat=3))
+        print(f"\33[0;49;36m{label}:\33[0;49;38m {1e6*elapsed/number_of_calls:.2f} us per call")
+    
+    # the same seed replays the same measurements
+    sim.reseed(0)
+    first = [sim.measure_ion_response(0.1, 0.2) for call in range(5)]
+    sim.reseed(0)
+    print(f"\33[0;49;36mReplay identical:\33[0;49;38m {first == [sim.measure_ion_response(0.1, 0.2) for call in range(5)]}")
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example compares grid sweeps with a fixed number of samples per point
+and with adaptive sampling, where points stop being sampled once their
+Poisson confidence interval shows they are background. It reports the
+total number of samples (i.e. integration time) and the center error.
+"""
+
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+import numpy as np
+import contextlib
+import io
+
+if __name__ == "__main__":
+    # parameters
+    photon_number = 20
+    width = 0.25
+    samples = 10
+    threshold = 2
+    repeats = 10
+    
+    rng = np.random.default_rng(0)
+    results = {None: [], threshold: []}
+    for repeat in range(repeats):
+        center = rng.uniform(-0.5, 0.5, 2)
+        photon_distribution = lambda x,y: photon_number*np.exp(-(x-center[0])**2/width**2-(y-center[1])**2/width**2)
+        
+        for sweep_threshold in results:
+            np.random.seed(repeat)
+            sim = IonResponseSimulation(photon_distribution)
+            syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+            syst.add_mirror("x", None)
+            syst.add_mirror("y", None)
+            syst.simulation = True
+            syst.simulation_mirror_set = ["x","y"]
+            
+            with contextlib.redirect_stdout(io.StringIO()):
+                output, info = grid_sweep_optimize_ND(syst, plot=False, samples=samples, threshold=sweep_threshold, full_output=True)
+            error = max(abs(output["x"] - center[0]), abs(output["y"] - center[1]))
+            results[sweep_threshold].append((info["number_of_samples"], error))
+    
+    for sweep_threshold, result in results.items():
+        number_of_samples, error = np.mean(result, axis=0)
+        label = "fixed" if sweep_threshold is None else "adaptive"
+        print(f"\33[0;49;36m{label}:\33[0;49;38m {number_of_samples:.0f} samples, mean center error {error:.4f}")
+    
+    saving = 1 - np.mean(results[threshold], axis=0)[0]/np.mean(results[None], axis=0)[0]
+    print(f"\33[0;49;36mIntegration saved:\33[0;49;38m {100*saving:.1f}%")
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates using bayesian_optimize routine for calibration,
+and compares its accuracy and number of measurements with grid_sweep_optimize.
+"""
+
+from laser_calibration.ion_response_simulation import GaussianIonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+
+from laser_calibration.bayesian_optimize import bayesian_optimize
+from laser_calibration.grid_sweep_optimize import grid_sweep_optimize
+
+if __name__ == "__main__":
+    # simulated response to be used
+    photon_number = 100
+    x_center = 0.1
+    y_center = 0.2
+    x_width = 0.3
+    y_width = 0.4
+    budget = 50
+    
+    print(f"\33[0;49;36mx and y location used in simulation:\33[0;49;38m ({x_center}, {y_center})")
+    sim = GaussianIonResponseSimulation(
+        photon_number=photon_number,
+        x_center=x_center,
+        y_center=y_center,
+        x_width=x_width,
+        y_width=y_width
+        )
+    
+    # instantiate a LaserCalibrationSystem class    
+    syst = LaserCalibrationSystem(
+        ion_response_function=sim.measure_ion_response
+        )
+
+    # add mirrors to the LaserCalibrationSystem object
+    syst.add_mirror("x", None)
+    syst.add_mirror("y", None)    
+    
+    # the following two lines are needed for simulation mode
+    syst.simulation = True
+    syst.simulation_mirror_set = ["x","y"]
+    
+    # perform optimization of ion response to calibrate the system
+    print("\nBAYESIAN OPTIMIZATION")
+    result = bayesian_optimize(laser_syst = syst, budget = budget)
+    print(f"\33[0;49;36mIon location found with deviation\33[0;49;38m ({x_center-result['x']}, {y_center-result['y']}) \33[0;49;36mwith {budget} measurements\33[0;49;38m")
+    
+    print("\nGRID SWEEP")
+    result = grid_sweep_optimize(laser_syst = syst, plot = False)
+    print(f"\33[0;49;36mIon location found with deviation\33[0;49;38m ({x_center-result['x']}, {y_center-result['y']}) \33[0;49;36mwith 400 measurements\33[0;49;38m")
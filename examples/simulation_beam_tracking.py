@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates drift tracking with BeamTracker, on a simulated ion
+whose center drifts at a constant velocity and simulated mirrors with a
+settle time. It reports the tracking error (the lag behind the drifting
+center) and the fraction of time spent tracking, for several duty cycles.
+"""
+
+from laser_calibration.ion_response_simulation import DriftingGaussianIonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import SimulatedMirror
+from laser_calibration.tracking import BeamTracker
+import numpy as np
+import time
+
+if __name__ == "__main__":
+    # parameters
+    photon_number = 100
+    width = 0.3
+    velocity = [0.05, -0.03]
+    latency = 0.001
+    duration = 4
+    
+    for duty_cycle in [0.05, 0.2, 0.5]:
+        np.random.seed(0)
+        sim = DriftingGaussianIonResponseSimulation(photon_number, [0.1, -0.1], width, velocity)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", SimulatedMirror(latency=latency))
+        syst.add_mirror("y", SimulatedMirror(latency=latency))
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        syst.batch_move_mirrors(x=0.1, y=-0.1)
+        
+        tracker = BeamTracker(syst, width=width, dither=0.1, duty_cycle=duty_cycle)
+        tracker.start()
+        
+        errors = []
+        start_time = time.perf_counter()
+        while time.perf_counter() - start_time < duration:
+            time.sleep(0.05)
+            # e.g. an experiment, run while the tracker holds the mirrors
+            with tracker.hold() as position:
+                errors.append(np.max(np.abs(np.array([position["x"], position["y"]]) - sim.center)))
+        tracker.stop()
+        
+        print(f"\33[0;49;36mduty_cycle={duty_cycle}:\33[0;49;38m {tracker.iterations} iterations, overhead {tracker.overhead:.3f}, mean error {np.mean(errors):.4f}, max error {np.max(errors):.4f} (drift {np.max(np.abs(velocity))*duration:.2f})")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates the CalibrationScheduler with three simulated
+laser calibration systems of one setup, two of which share a mirror. The
+first and third systems conflict and are calibrated one after the other,
+while the second one is calibrated concurrently with them.
+"""
+
+from laser_calibration.calibration_scheduler import CalibrationScheduler
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import SimulatedMirror
+from laser_calibration.spsa_optimize import spsa_optimize
+import numpy as np
+
+if __name__ == "__main__":
+    # parameters
+    latency = 0.002
+    centers = [(0.1, 0.2), (-0.2, 0.1), (0.3, -0.1)]
+    
+    # the second mirror of system 1 is the first mirror of system 3
+    shared_mirror = SimulatedMirror(latency=latency)
+    mirrors = [[SimulatedMirror(latency=latency), shared_mirror],
+               [SimulatedMirror(latency=latency), SimulatedMirror(latency=latency)],
+               [shared_mirror, SimulatedMirror(latency=latency)]]
+    
+    scheduler = CalibrationScheduler()
+    for index, (center, system_mirrors) in enumerate(zip(centers, mirrors)):
+        photon_distribution = lambda x,y,center=center: 100*np.exp(-(x-center[0])**2/0.3**2-(y-center[1])**2/0.3**2)
+        sim = IonResponseSimulation(photon_distribution)
+        
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", system_mirrors[0])
+        syst.add_mirror("y", system_mirrors[1])
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        scheduler.add_job(syst, spsa_optimize, ["x","y"], name="system "+str(index+1), budget=400, x0=[0,0], seed=index)
+    
+    print("\33[0;49;36mConflicts:\33[0;49;38m", scheduler.conflicts())
+    report = scheduler.run()
+    
+    for name, result in report["results"].items():
+        print(f"\33[0;49;36m{name}:\33[0;49;38m {report['durations'][name]:.3f} s, center found at {result}")
+    print(f"\33[0;49;36mSpeedup over serial:\33[0;49;38m {report['serial_time']/report['makespan']:.2f}")
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates concurrent mirror actuation, using simulated mirrors
+with a settle time, and compares the time taken by a sequence of batch moves
+with and without concurrent moves.
+"""
+
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import SimulatedMirror
+import numpy as np
+import time
+
+if __name__ == "__main__":
+    # parameters
+    latency = 0.01
+    number_of_mirrors = 4
+    number_of_moves = 20
+    
+    mirror_names = ["x"+str(index+1) for index in range(number_of_mirrors)]
+    positions = np.random.uniform(-1, 1, (number_of_moves, number_of_mirrors))
+
+    for concurrent_moves in [False, True]:
+        # instantiate a LaserCalibrationSystem class; the ion response is
+        # irrelevant here
+        syst = LaserCalibrationSystem(
+            ion_response_function=lambda: 0,
+            concurrent_moves=concurrent_moves
+            )
+        
+        # add simulated mirrors with a settle time
+        for mirror_name in mirror_names:
+            syst.add_mirror(mirror_name, SimulatedMirror(latency=latency))
+    
+        start_time = time.perf_counter()
+        for position in positions:
+            syst.batch_move_mirrors(**dict(zip(mirror_names, position)))
+        elapsed = time.perf_counter() - start_time
+        
+        print(f"\33[0;49;36mconcurrent_moves={concurrent_moves}:\33[0;49;38m {elapsed:.3f} s for {number_of_moves} moves of {number_of_mirrors} mirrors with {latency} s latency")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates the coarse-to-fine mode of grid_sweep_optimize_ND,
+and compares the number of measurements with a full grid sweep at the same
+final step size, as the number of mirrors grows: the measurements per mirror
+stay about constant, as every level is made of line scans.
+"""
+
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+import numpy as np
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+
+if __name__ == "__main__":
+    # parameters
+    photon_number = 100
+    coarse_step = 0.4
+    target_precision = 0.005
+    rng = np.random.default_rng(1)
+    
+    for dimension in range(1, 7):
+        print(f"\n{dimension} dimension")
+        # the coarse line scans start from the mirrors at 0, so the peak
+        # must stand out along lines through there
+        centers = rng.uniform(-0.3, 0.3, dimension)
+        widths = rng.uniform(0.15, 0.4, dimension)
+        
+        # simulated response to be used
+        photon_distribution = lambda *r: photon_number*np.exp(-sum((r[index]-centers[index])**2/widths[index]**2 for index in range(dimension)))
+        sim = IonResponseSimulation(photon_distribution=photon_distribution)
+        
+        # instantiate a LaserCalibrationSystem class    
+        syst = LaserCalibrationSystem(
+            ion_response_function=sim.measure_ion_response
+            )
+        
+        # add mirrors to the LaserCalibrationSystem object
+        mirror_names = ["x"+str(index+1) for index in range(dimension)]
+        for mirror_name in mirror_names:
+            syst.add_mirror(mirror_name, None)
+        
+        # the following two lines are needed for simulation mode
+        syst.simulation = True
+        syst.simulation_mirror_set = mirror_names
+        
+        # perform optimization of ion response to calibrate the system
+        output = grid_sweep_optimize_ND(laser_syst = syst, step = coarse_step, target_precision = target_precision, full_output = True)
+        if output is None:
+            continue
+        result, info = output
+        deviation = [centers[index]-result[mirror_names[index]] for index in range(dimension)]
+        
+        # a full sweep at the finest step reached would need this many points
+        finest_step = min(info["levels"][-1]["step"])
+        full_grid_measurements = int(np.ceil(2/finest_step))**dimension
+        
+        print(f"\33[0;49;36mIon location found with deviation\33[0;49;38m {np.round(deviation, 4)}")
+        print(f"\33[0;49;36mMeasurements:\33[0;49;38m {info['number_of_measurements']} \33[0;49;36m({info['number_of_measurements']/dimension:.0f} per mirror; full grid at step {finest_step:.4f}: {full_grid_measurements})\33[0;49;38m")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example shows a 2D grid sweep filling in live: frames are written to
+live_view_<frame>.png while the sweep runs, at up to 5 frames per second.
+Each simulated point takes 0.2 ms of integration, and the sweep time with
+and without the live view is compared.
+"""
+
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+from laser_calibration.live_view import LiveView
+import numpy as np
+import time
+
+if __name__ == "__main__":
+    # parameters
+    integration_time = 2e-4
+    step = 0.02
+    
+    sim = IonResponseSimulation(lambda x,y: 50*np.exp(-(x-0.1)**2/0.3**2-(y+0.2)**2/0.2**2) + 1, seed=0)
+    
+    def batch_ion_response_function(positions):
+        time.sleep(integration_time*len(positions))
+        return sim.measure_batch(positions)
+    
+    syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response, batch_ion_response_function=batch_ion_response_function)
+    syst.add_mirror("x", None)
+    syst.add_mirror("y", None)
+    syst.simulation = True
+    syst.simulation_mirror_set = ["x","y"]
+    
+    start_time = time.perf_counter()
+    grid_sweep_optimize_ND(syst, step=step, plot=False)
+    sweep_time = time.perf_counter() - start_time
+    
+    with LiveView("live_view_{}.png", max_frame_rate=5, chunk_size=200) as live_view:
+        start_time = time.perf_counter()
+        grid_sweep_optimize_ND(syst, step=step, plot=False, live_view=live_view)
+        live_sweep_time = time.perf_counter() - start_time
+    
+    print(f"\33[0;49;36mSweep time:\33[0;49;38m {sweep_time:.2f} s, {live_sweep_time:.2f} s with the live view")
+    print(f"\33[0;49;36mFrames rendered:\33[0;49;38m {live_view.frames_rendered} for {live_view.updates_received} updates, {live_view.updates_dropped} dropped")
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example runs Monte Carlo simulations of grid_sweep_optimize over random
+ion centers, widths, photon numbers and instrument noise, prints the error
+distribution and failure rate, and compares the wall time with different
+numbers of processes.
+"""
+
+from laser_calibration.monte_carlo import run_monte_carlo, summarize_monte_carlo
+import os
+
+if __name__ == "__main__":
+    # parameters
+    number_of_runs = 2000
+    photon_number = (2, 100)
+    width = (0.2, 0.4)
+    noise = (0, 2)
+    
+    results = run_monte_carlo("grid_sweep_optimize", number_of_runs=number_of_runs, photon_number=photon_number, width=width, noise=noise, step=0.1)
+    summarize_monte_carlo(results, verbose=True)
+    
+    # the results do not depend on the number of processes, only the time
+    serial_time = None
+    for processes in sorted({1, 2, os.cpu_count() or 1}):
+        wall_time = run_monte_carlo("grid_sweep_optimize", number_of_runs=number_of_runs, photon_number=photon_number, width=width, noise=noise, processes=processes, step=0.1)["wall_time"]
+        serial_time = serial_time or wall_time
+        print(f"\33[0;49;36m{processes} processes:\33[0;49;38m {wall_time:.2f} s, speedup {serial_time/wall_time:.2f}")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example runs grid_sweep_optimize_ND with simulated latencies: mirrors
+that take 4 ms to settle, a 2 ms acquisition, and a 5 ms readout of the
+acquired data, first one step after the other (overlap_readout=False), then
+with the readout of each point overlapping the moves to the next points.
+"""
+
+import numpy as np
+import time
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import SimulatedMirror
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+
+if __name__ == "__main__":
+    # parameters
+    settle_time = 4e-3
+    acquisition_time = 2e-3
+    readout_time = 5e-3
+    x_center = 0.1
+    y_center = 0.2
+    
+    rng = np.random.default_rng(0)
+    
+    def acquire(x, y):
+        # the mirrors must stay put while photons are counted; the raw data
+        # is only the position here
+        time.sleep(acquisition_time)
+        return x, y
+    
+    def readout(raw):
+        # e.g. transferring and processing a camera frame
+        time.sleep(readout_time)
+        x, y = raw
+        return rng.poisson(100*np.exp(-(x - x_center)**2/0.3**2 - (y - y_center)**2/0.3**2))
+    
+    for overlap_readout in [False, True]:
+        syst = LaserCalibrationSystem(ion_response_function=acquire, readout_function=readout, overlap_readout=overlap_readout)
+        syst.add_mirror("x", SimulatedMirror(latency=settle_time))
+        syst.add_mirror("y", SimulatedMirror(latency=settle_time))
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        start_time = time.perf_counter()
+        output = grid_sweep_optimize_ND(syst, step=0.1, plot=False)
+        elapsed = time.perf_counter() - start_time
+        print(f"\33[0;49;36moverlap_readout={overlap_readout}:\33[0;49;38m {elapsed:.2f} s, center found at ({output['x']:.3f}, {output['y']:.3f})")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+This example demonstrates using spsa_optimize routine for calibration of
+many mirror axes in the presence of photon shot noise.
+"""
+
+from laser_calibration.ion_response_simulation import IonResponseSimulation
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+import numpy as np
+from laser_calibration.spsa_optimize import spsa_optimize
+
+if __name__ == "__main__":
+    # parameters
+    photon_number = 100
+    budget = 2000
+    rng = np.random.default_rng(0)
+    
+    for dimension in [2, 4, 6, 8]:
+        print(f"\n{dimension} dimension")
+        centers = rng.uniform(-0.2, 0.2, dimension)
+        widths = rng.uniform(0.2, 0.4, dimension)
+    
+        # simulated response to be used
+        photon_distribution = lambda *r: photon_number*np.exp(-sum((r[index]-centers[index])**2/widths[index]**2 for index in range(dimension)))
+        print(f"\33[0;49;36mlocation used in simulation:\33[0;49;38m {np.round(centers, 4)}")
+        sim = IonResponseSimulation(photon_distribution=photon_distribution)
+        
+        # instantiate a LaserCalibrationSystem class    
+        syst = LaserCalibrationSystem(
+            ion_response_function=sim.measure_ion_response
+            )
+        
+        # add mirrors to the LaserCalibrationSystem object; they start at 0,
+        # within reach of the ion response
+        mirror_names = ["x"+str(index+1) for index in range(dimension)]
+        for mirror_name in mirror_names:
+            syst.add_mirror(mirror_name, None)
+        
+        # the following two lines are needed for simulation mode
+        syst.simulation = True
+        syst.simulation_mirror_set = mirror_names
+        
+        # perform optimization of ion response to calibrate the system
+        result = spsa_optimize(laser_syst = syst, budget = budget)
+        deviation = [centers[index]-result[mirror_names[index]] for index in range(dimension)]
+        print(f"\33[0;49;36mIon location found with deviation\33[0;49;38m {np.round(deviation, 4)} \33[0;49;36mwith {budget} measurements\33[0;49;38m")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Lazy namespace of the laser_calibration package: the classes and functions
+below are only imported on first access (PEP 562), so that e.g.
+
+    import laser_calibration
+    syst = laser_calibration.LaserCalibrationSystem(...)
+
+loads neither matplotlib nor scipy. Submodules are also loaded on access.
+Routines named like their module (e.g. grid_sweep_optimize) are reached
+through it, as laser_calibration.grid_sweep_optimize is the module:
+
+    from laser_calibration.grid_sweep_optimize import grid_sweep_optimize
+"""
+
+import importlib
+
+
+_ATTRIBUTES = {
+    "LaserCalibrationSystem": "laser_calibration_system",
+    "MirrorMoveError": "laser_calibration_system",
+    "Mirror": "mirror",
+    "SimulatedMirror": "mirror",
+    "TransportMirror": "mirror_transport",
+    "MirrorController": "mirror_transport",
+    "ControllerEmulator": "mirror_transport",
+    "get_controller": "mirror_transport",
+    "MeasurementLedger": "measurement_ledger",
+    "IonResponseSimulation": "ion_response_simulation",
+    "GaussianIonResponseSimulation": "ion_response_simulation",
+    "DriftingGaussianIonResponseSimulation": "ion_response_simulation",
+    "simulated_calibration_system": "ion_response_simulation",
+    "GaussianPSF": "psf_models",
+    "AiryPSF": "psf_models",
+    "Background": "psf_models",
+    "fit_stored_sweep": "grid_sweep_optimize_ND",
+    "fit_roi": "grid_sweep_optimize_ND",
+    "SweepStore": "sweep_store",
+    "CalibrationScheduler": "calibration_scheduler",
+    "BeamTracker": "tracking",
+    "LiveView": "live_view",
+    "run_monte_carlo": "monte_carlo",
+    "summarize_monte_carlo": "monte_carlo",
+    "poisson_interval": "adaptive_sampling",
+}
+
+_SUBMODULES = [
+    "adaptive_sampling", "bayesian_optimize", "benchmark", "calibration_scheduler", "generic_optimize",
+    "grid_sweep_optimize", "grid_sweep_optimize_ND", "instrumentation", "ion_response_simulation",
+    "laser_calibration_system", "live_view", "measurement_ledger", "mirror", "mirror_transport", "monte_carlo", "psf_models",
+    "spsa_optimize", "sweep_order", "sweep_store", "tracking", "visualization",
+]
+
+__all__ = list(_ATTRIBUTES) + _SUBMODULES
+
+
+def __getattr__(name):
+    if name in _ATTRIBUTES:
+        value = getattr(importlib.import_module("." + _ATTRIBUTES[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module("." + name, __name__)
+    else:
+        m = "module " + repr(__name__) + " has no attribute " + repr(name)
+        raise AttributeError(m)
+
+    # cached, so that __getattr__ is only called once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Poisson confidence intervals for adaptive sampling. A point is sampled
+repeatedly only until the confidence interval of its photon number per
+sample is clear of the threshold that matters for the decision at hand,
+e.g. the background level in a sweep or the incumbent in an optimizer.
+
+The intervals are exact (Garwood) intervals for the mean of Poisson counts,
+so they assume photon shot noise dominates; with significant instrument
+noise, lower the confidence or use fixed sampling.
+"""
+
+import numpy as np
+
+
+def poisson_interval(total: float | np.ndarray, samples: int | np.ndarray, confidence: float = 0.95):
+    """
+        Two-sided confidence interval of the photon number per sample, from
+        the total of `samples` Poisson counts. Returns (low, high), arrays if
+        the arguments are.
+
+        total: float | ndarray, sum of the counts (negative values, from
+        instrument noise, are treated as 0)
+        samples: int | ndarray, number of counts summed
+        confidence: float, defaulted to 0.95. Confidence level
+    """
+    if not 0 < confidence < 1:
+        m = "confidence must be between 0 and 1"
+        raise ValueError(m)
+
+    # deferred, so that importing LaserCalibrationSystem does not load scipy
+    from scipy.special import gammaincinv
+    
+    total = np.maximum(np.asarray(total, dtype=float), 0)
+    samples = np.asarray(samples, dtype=float)
+    alpha = 1 - confidence
+
+    # chi2.ppf(q, 2k)/2 is gammaincinv(k, q); the lower bound is 0 for k = 0
+    low = np.where(total > 0, gammaincinv(np.maximum(total, 1e-300), alpha/2), 0)
+    high = gammaincinv(total + 1, 1 - alpha/2)
+
+    return low/samples, high/samples
+
+
+def poisson_decision(total: float | np.ndarray, samples: int | np.ndarray, threshold: float | None, confidence: float = 0.95):
+    """
+        Compare the photon number per sample with threshold: 1 if the whole
+        confidence interval is above it, -1 if it is below, and 0 while
+        undecided (always 0 if threshold is None).
+
+        total, samples, confidence: as in poisson_interval
+        threshold: float | None, photon number per sample
+    """
+    if threshold is None:
+        return np.zeros(np.broadcast(np.asarray(total), np.asarray(samples)).shape, dtype=int)[()]
+
+    low, high = poisson_interval(total, samples, confidence)
+    return np.where(low > threshold, 1, np.where(high < threshold, -1, 0))[()]
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+import numpy as np
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.instrumentation import instrumentation
+from laser_calibration.grid_sweep_optimize_ND import gaussian_ND
+
+
+
+def bayesian_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None, budget: int = 100, initial_points: int | None = None, length_scale: float | list[float] = 0.15, acquisition: str = "ei", kappa: float = 2, xi: float = 0.01, measurement_noise: float = 0, candidates: int = 2000, seed: int | None = None, full_output: bool = False):
+    """
+        function to calibrate with Bayesian optimization, for when every
+        measurement is expensive. The photon number is modeled with a
+        Gaussian process, whose observation noise follows the Poisson
+        statistics of the counts (variance equal to the count, plus
+        instrument noise). Each new point maximizes the acquisition function
+        over random candidates spread over the mirror range and concentrated
+        around the current best point. Finally, the mirrors are moved to the
+        maximum of the posterior mean, refined by a Gaussian fit of the
+        measurements (which cluster around the peak) when the fit succeeds.
+
+        Arguments:
+        laser_syst: a LaserCalibrationSystem instance
+
+        Optional arguments:
+        optimize_over_axes: str | list[str] | None. Specify which mirror
+        axes to optmize over (if None, all is assumed)
+        budget: int, defaulted to 100. Total number of measurements
+        initial_points: int | None. Number of random measurements before the
+        acquisition function is used (if None, 5 per axis)
+        length_scale: float | list[float], defaulted to 0.15. Length scale
+        of the squared-exponential kernel, per axis or common to all; it
+        should be comparable to the width of the ion response
+        acquisition: str, defaulted to "ei". "ei" for expected improvement,
+        or "ucb" for upper confidence bound
+        kappa: float, defaulted to 2. Exploration weight of "ucb"
+        xi: float, defaulted to 0.01. Exploration margin of "ei", relative to
+        the best posterior mean
+        measurement_noise: float, defaulted to 0. Standard deviation of the
+        instrument noise on top of photon shot noise
+        candidates: int, defaulted to 2000. Number of candidate points over
+        which the acquisition function is maximized
+        seed: int | None. Seed of the random initial and candidate points
+        full_output: bool, defaulted to False. If True, also return a dict
+        with the measured positions and responses, and the Gaussian process
+    """
+    if optimize_over_axes is None:
+        optimize_over_axes = laser_syst.get_all_mirror_names()
+    elif isinstance(optimize_over_axes, str):
+        optimize_over_axes = [optimize_over_axes]
+
+    dimension = len(optimize_over_axes)
+
+    if initial_points is None:
+        initial_points = 5*dimension
+    initial_points = min(initial_points, budget)
+
+    if acquisition not in ("ei", "ucb"):
+        m = "acquisition must be \"ei\" or \"ucb\""
+        raise ValueError(m)
+
+    # scipy is imported here, as it is slow to import
+    from scipy.special import ndtr
+
+    rng = np.random.default_rng(seed)
+    length_scale = np.broadcast_to(np.asarray(length_scale, dtype=float), (dimension,))
+
+    indices = laser_syst.mirror_indices(optimize_over_axes)
+
+    def measure(x):
+        y = laser_syst.move_and_measure_vector(x, indices)
+        # Poisson variance equals the mean, estimated by the count itself
+        return y, max(y, 1) + measurement_noise**2
+
+    X = rng.uniform(-1, 1, (initial_points, dimension))
+    observations = [measure(x) for x in X]
+    y = np.array([observation[0] for observation in observations], dtype=float)
+
+    # prior mean is zero (no photons away from the ion); the signal variance
+    # follows the largest count seen so far
+    gp = GaussianProcess(dimension, length_scale, signal_variance=_signal_variance(y), capacity=budget)
+    [gp.add(x, observation[0], observation[1]) for x, observation in zip(X, observations)]
+
+    for index in range(initial_points, budget):
+        x_best = gp.X[np.argmax(gp.predict(gp.X)[0])]
+        candidate_points = _candidates(rng, x_best, length_scale, candidates)
+        mean, variance = gp.predict(candidate_points)
+        sigma = np.sqrt(variance)
+
+        if acquisition == "ucb":
+            score = mean + kappa*sigma
+        else:
+            improvement = mean - np.max(gp.predict(gp.X)[0]) - xi*np.sqrt(gp.signal_variance)
+            z = improvement/sigma
+            score = improvement*ndtr(z) + sigma*np.exp(-0.5*z**2)/np.sqrt(2*np.pi)
+
+        x = candidate_points[np.argmax(score)]
+        response, noise_variance = measure(x)
+
+        if _signal_variance([response]) > 2*gp.signal_variance:
+            # rescaling the prior requires refactorizing, which is rare
+            gp.signal_variance = _signal_variance([response])
+        gp.add(x, response, noise_variance)
+
+    # final estimate: maximum of the posterior mean, refined by a Gaussian
+    # fit of the observations, which cluster around the peak
+    x_best = gp.X[np.argmax(gp.predict(gp.X)[0])]
+    candidate_points = _candidates(rng, x_best, length_scale/4, candidates)
+    x_best = candidate_points[np.argmax(gp.predict(candidate_points)[0])]
+    
+    x_fit = _fit_gaussian(gp, x_best)
+    if x_fit is not None:
+        x_best = x_fit
+
+    move_mirrors_args = {}
+    [move_mirrors_args.update({optimize_over_axes[index]:x_best[index]}) for index in range(len(optimize_over_axes)) ]
+    laser_syst.batch_move_mirrors(**move_mirrors_args)
+
+
+    for mirror in optimize_over_axes:
+        print("\33[0;49;33mMirror "+mirror + " moved to:\33[0;49;38m "+str(move_mirrors_args[mirror]))
+
+    if instrumentation.enabled:
+        instrumentation.print_summary()
+
+    if full_output:
+        return move_mirrors_args, {"number_of_measurements": budget, "positions": gp.X, "responses": gp.y, "gaussian_process": gp}
+
+    return move_mirrors_args
+
+
+class GaussianProcess():
+
+    """
+        Gaussian process regression with a zero prior mean and a
+        squared-exponential kernel,
+
+            k(x, x') = signal_variance*exp(-sum((x-x')**2/length_scale**2)/2)
+
+        and an individual noise variance per observation.
+
+        The Cholesky factor of the covariance matrix is updated in place as
+        observations are added (one triangular solve per point), instead of
+        being refactorized from scratch. Storage for `capacity` observations
+        is preallocated, and grows if exceeded. Changing `signal_variance` or
+        `length_scale` refactorizes.
+
+        The `add` method adds an observation, and `predict` returns the
+        posterior mean and variance at new points.
+    """
+    def __init__(self, dimension: int, length_scale: float | list[float], signal_variance: float = 1, capacity: int = 100):
+        self._dimension = dimension
+        self._length_scale = np.broadcast_to(np.asarray(length_scale, dtype=float), (dimension,)).copy()
+        self._signal_variance = signal_variance
+        self._n = 0
+        self._allocate(max(capacity, 1))
+
+    @property
+    def X(self):
+        return self._X[:self._n]
+
+    @property
+    def y(self):
+        return self._y[:self._n]
+
+    @property
+    def signal_variance(self):
+        return self._signal_variance
+
+    @signal_variance.setter
+    def signal_variance(self, signal_variance: float):
+        self._signal_variance = signal_variance
+        self._refactorize()
+
+    @property
+    def length_scale(self):
+        return self._length_scale
+
+    @length_scale.setter
+    def length_scale(self, length_scale: float | list[float]):
+        self._length_scale = np.broadcast_to(np.asarray(length_scale, dtype=float), (self._dimension,)).copy()
+        self._refactorize()
+
+    def kernel(self, A: np.ndarray, B: np.ndarray):
+        """
+            Kernel matrix between the rows of A and the rows of B
+        """
+        squared_distance = np.sum(((A[:,None,:] - B[None,:,:])/self._length_scale)**2, axis=-1)
+        return self._signal_variance*np.exp(-0.5*squared_distance)
+
+    def add(self, x: np.ndarray, y: float, noise_variance: float):
+        """
+            Add an observation y at x with the given noise variance
+        """
+        from scipy.linalg import solve_triangular
+
+        n = self._n
+        if n == len(self._y):
+            self._allocate(2*n)
+
+        x = np.asarray(x, dtype=float)
+        L = self._L[:n,:n]
+
+        # new row of the Cholesky factor, and of z = L^-1 y
+        if n > 0:
+            l = solve_triangular(L, self.kernel(self.X, x[None,:])[:,0], lower=True, check_finite=False)
+        else:
+            l = np.zeros(0)
+        d = np.sqrt(max(self._signal_variance + noise_variance - l@l, 1e-12*self._signal_variance))
+
+        self._L[n,:n] = l
+        self._L[n,n] = d
+        self._z[n] = (y - l@self._z[:n])/d
+        self._X[n] = x
+        self._y[n] = y
+        self._noise_variance[n] = noise_variance
+        self._n += 1
+
+    def predict(self, X: np.ndarray):
+        """
+            Posterior mean and variance (without observation noise) at the
+            rows of X
+        """
+        from scipy.linalg import solve_triangular
+
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        if self._n == 0:
+            return np.zeros(len(X)), np.full(len(X), float(self._signal_variance))
+
+        V = solve_triangular(self._L[:self._n,:self._n], self.kernel(self.X, X), lower=True, check_finite=False)
+        mean = V.T@self._z[:self._n]
+        variance = np.maximum(self._signal_variance - np.sum(V**2, axis=0), 1e-12*self._signal_variance)
+        return mean, variance
+
+    def _allocate(self, capacity):
+        n = self._n
+        old = (self._X[:n], self._y[:n], self._noise_variance[:n], self._L[:n,:n], self._z[:n]) if n else None
+
+        self._X = np.empty((capacity, self._dimension))
+        self._y = np.empty(capacity)
+        self._noise_variance = np.empty(capacity)
+        self._L = np.zeros((capacity, capacity))
+        self._z = np.empty(capacity)
+
+        if old is not None:
+            self._X[:n], self._y[:n], self._noise_variance[:n], self._L[:n,:n], self._z[:n] = old
+
+    def _refactorize(self):
+        observations = (self.X.copy(), self.y.copy(), self._noise_variance[:self._n].copy())
+        self._n = 0
+        [self.add(x, y, noise_variance) for x, y, noise_variance in zip(*observations)]
+
+
+def _fit_gaussian(gp, x_best):
+    # Poisson-weighted fit of gaussian_ND to the observations, started at
+    # x_best; None if it fails or lands outside of the mirror range
+    # scipy.optimize is imported here, as it is slow to import
+    from scipy.optimize import curve_fit
+    
+    dimension = len(x_best)
+    p0 = [np.max(gp.predict(x_best)[0])]
+    for index in range(dimension):
+        p0 += [x_best[index], np.sqrt(2)*gp.length_scale[index]]
+    
+    try:
+        with instrumentation.timer("fit"):
+            popt, pcov = curve_fit(gaussian_ND, gp.X.T, gp.y, p0, sigma=np.sqrt(np.maximum(gp.y, 1)))
+    except:
+        return None
+    
+    x_fit = popt[1::2]
+    if np.any(np.isnan(x_fit)) or np.any(np.abs(x_fit) > 1):
+        return None
+    return x_fit
+
+
+def _signal_variance(y):
+    return max(np.max(y), 1)**2
+
+
+def _candidates(rng, x_best, length_scale, number):
+    # half uniformly over the mirror range, half around the best point
+    uniform = rng.uniform(-1, 1, (number - number//2, len(x_best)))
+    local = x_best + rng.normal(size=(number//2, len(x_best)))*length_scale
+    return np.clip(np.vstack((uniform, local, x_best)), -1, 1)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+End-to-end calibration benchmark. Runs the calibration routines against
+simulated ion responses over a range of dimensions, photon numbers, widths,
+instrument noise and step sizes, and records for each run the number of
+measurements, the number of mirror moves, wall-clock time, time spent in
+Gaussian fits and the error of the center found. A mirror move is counted
+when it changes the position of a mirror, whether the points are measured
+one at a time or in a batch, so that move counts compare between
+algorithms. Runs that raise are failed, with the exception in "error".
+
+Results are saved as JSON, and can be compared with a stored baseline to flag
+regressions. To run from the command line:
+
+    python -m laser_calibration.benchmark --output results.json
+    python -m laser_calibration.benchmark --baseline results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import numpy as np
+
+from laser_calibration.ion_response_simulation import simulated_calibration_system
+from laser_calibration.instrumentation import instrumentation
+from laser_calibration.grid_sweep_optimize import grid_sweep_optimize
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+from laser_calibration.bayesian_optimize import bayesian_optimize
+from laser_calibration.generic_optimize import generic_optimize
+from laser_calibration.spsa_optimize import spsa_optimize
+
+
+# name: (routine taking (laser_syst, step, seed), maximum dimension, whether
+# step applies). All routines start with the mirrors at 0.
+ALGORITHMS = {
+    "grid_sweep_optimize": (lambda syst, step, seed: grid_sweep_optimize(syst, step=step, plot=False), 2, True),
+    "grid_sweep_optimize_ND": (lambda syst, step, seed: grid_sweep_optimize_ND(syst, step=step, plot=False), None, True),
+    "generic_optimize": (lambda syst, step, seed: generic_optimize(syst), 2, False),
+    "spsa_optimize": (lambda syst, step, seed: spsa_optimize(syst, seed=seed), None, False),
+    "bayesian_optimize": (lambda syst, step, seed: bayesian_optimize(syst, seed=seed), None, False),
+}
+
+# configuration fields identifying a run, and metrics recorded for it
+CONFIGURATION_KEYS = ("algorithm", "dimension", "photon_number", "width", "noise", "step", "repeat")
+METRIC_KEYS = ("success", "number_of_measurements", "number_of_mirror_moves", "wall_time", "fit_time", "center_error", "error")
+
+
+def run_benchmark(algorithms: list[str] | None = None, dimensions: list[int] = (1, 2), photon_numbers: list[float] = (100,), widths: list[float] = (0.3,), noises: list[float] = (0,), steps: list[float] = (0.1,), repeats: int = 1, seed: int = 0, verbose: bool = True):
+    """
+        Run every algorithm on every combination of the benchmark parameters,
+        and return a list of dicts, one per run, with the configuration
+        (CONFIGURATION_KEYS) and metrics (METRIC_KEYS) of the run.
+
+        algorithms: list[str] | None, names from ALGORITHMS (if None, all);
+        algorithms are skipped in dimensions they do not support
+        dimensions, photon_numbers, widths, noises, steps: lists of values of
+        the number of mirrors, peak photon number, width of the Gaussian ion
+        response, instrument noise and sweep step size. steps only apply to
+        the grid sweeps.
+        repeats: int, number of runs per combination, each with a different
+        ion center
+        seed: int, seed of the ion centers, the simulated photon counts and
+        the randomized routines, so that runs are reproducible
+    """
+    if algorithms is None:
+        algorithms = list(ALGORITHMS)
+
+    if any(algorithm not in ALGORITHMS for algorithm in algorithms):
+        m = "algorithms must be among " + ", ".join(ALGORITHMS)
+        raise ValueError(m)
+
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for dimension in dimensions:
+        for photon_number in photon_numbers:
+            for width in widths:
+                for noise in noises:
+                    for repeat in range(repeats):
+                        centers = rng.uniform(-0.5, 0.5, dimension)
+                        for algorithm in algorithms:
+                            routine, maximum_dimension, uses_step = ALGORITHMS[algorithm]
+                            if maximum_dimension is not None and dimension > maximum_dimension:
+                                continue
+
+                            for step in (steps if uses_step else (None,)):
+                                configuration = {"algorithm": algorithm, "dimension": dimension, "photon_number": photon_number, "width": width, "noise": noise, "step": step, "repeat": repeat}
+                                np.random.seed(seed + repeat)
+                                result = _run(routine, step, seed + repeat, centers, photon_number, width, noise)
+                                result.update(configuration)
+                                results.append(result)
+
+                                if verbose:
+                                    print(_format(result))
+
+    return results
+
+
+def save_results(results: list[dict], path: str):
+    """
+        Save benchmark results as JSON
+    """
+    with open(path, "w") as f:
+        json.dump(results, f, indent = 1)
+
+
+def load_results(path: str):
+    """
+        Load benchmark results saved with save_results
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(results: list[dict], baseline: list[dict], tolerance: float = 0.2, error_floor: float = 0.005, time_tolerance: float | None = None):
+    """
+        Compare benchmark results with a baseline, and return a list of
+        regressions, as strings. Runs are matched by configuration. A run
+        regresses if it fails where the baseline succeeded, if its number of
+        measurements grows by more than `tolerance` (relative), or if its
+        center error grows by more than `tolerance` (relative) and by more
+        than `error_floor` (absolute). If time_tolerance is not None, wall
+        time growing by more than time_tolerance (relative) is also flagged;
+        it is off by default as timings are noisy.
+    """
+    baseline = {_key(result): result for result in baseline}
+    regressions = []
+
+    for result in results:
+        reference = baseline.get(_key(result))
+        if reference is None:
+            continue
+
+        label = ", ".join(key + "=" + str(result[key]) for key in CONFIGURATION_KEYS)
+
+        if reference["success"] and not result["success"]:
+            regressions.append(label + ": calibration failed")
+            continue
+        if not result["success"] or not reference["success"]:
+            continue
+
+        if result["number_of_measurements"] > (1 + tolerance)*reference["number_of_measurements"]:
+            regressions.append(label + ": measurements " + str(reference["number_of_measurements"]) + " -> " + str(result["number_of_measurements"]))
+
+        if result["center_error"] > (1 + tolerance)*reference["center_error"] and result["center_error"] - reference["center_error"] > error_floor:
+            regressions.append(label + ": center error " + _round(reference["center_error"]) + " -> " + _round(result["center_error"]))
+
+        if time_tolerance is not None and result["wall_time"] > (1 + time_tolerance)*reference["wall_time"]:
+            regressions.append(label + ": wall time " + _round(reference["wall_time"]) + " s -> " + _round(result["wall_time"]) + " s")
+
+    return regressions
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description = "Benchmark laser calibration routines on simulated ion responses")
+    parser.add_argument("--algorithms", nargs = "+", default = None, choices = list(ALGORITHMS))
+    parser.add_argument("--dimensions", nargs = "+", type = int, default = [1, 2])
+    parser.add_argument("--photon-numbers", nargs = "+", type = float, default = [100.])
+    parser.add_argument("--widths", nargs = "+", type = float, default = [0.3])
+    parser.add_argument("--noises", nargs = "+", type = float, default = [0.])
+    parser.add_argument("--steps", nargs = "+", type = float, default = [0.1])
+    parser.add_argument("--repeats", type = int, default = 1)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--output", default = None, help = "JSON file to save results to")
+    parser.add_argument("--baseline", default = None, help = "JSON file of results to compare with")
+    parser.add_argument("--tolerance", type = float, default = 0.2)
+    parser.add_argument("--time-tolerance", type = float, default = None)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.algorithms, args.dimensions, args.photon_numbers, args.widths, args.noises, args.steps, args.repeats, args.seed)
+
+    if args.output is not None:
+        save_results(results, args.output)
+
+    if args.baseline is not None:
+        regressions = compare_results(results, load_results(args.baseline), args.tolerance, time_tolerance = args.time_tolerance)
+        for regression in regressions:
+            print("\33[0;49;31mREGRESSION\33[0;49;38m " + regression)
+        if regressions:
+            return 1
+        print("No regressions against " + args.baseline)
+
+    return 0
+
+
+def _run(routine, step, seed, centers, photon_number, width, noise):
+    dimension = len(centers)
+    syst, mirror_names, counts = simulated_calibration_system(centers, width, photon_number, noise)
+
+    # time spent in fits, from the instrumentation of the routines, kept
+    # apart from any data collected outside of the benchmark
+    with instrumentation.isolated(), contextlib.redirect_stdout(io.StringIO()):
+        start_time = time.perf_counter()
+        error = None
+        try:
+            output = routine(syst, step, seed)
+        except Exception as exception:
+            output = None
+            error = type(exception).__name__ + ": " + str(exception)
+        wall_time = time.perf_counter() - start_time
+
+        fit_time = instrumentation.data().get("fit", {}).get("total", 0.)
+
+    if output is not None:
+        center_error = float(np.max(np.abs([output[mirror_names[index]] - centers[index] for index in range(dimension)])))
+    else:
+        center_error = None
+
+    return {"success": output is not None, "number_of_measurements": counts["measurements"], "number_of_mirror_moves": counts["mirror_moves"], "wall_time": wall_time, "fit_time": fit_time, "center_error": center_error, "error": error}
+
+
+def _key(result):
+    return tuple(result[key] for key in CONFIGURATION_KEYS)
+
+
+def _round(value):
+    return "%.4g" % value
+
+
+def _format(result):
+    configuration = " ".join(key + "=" + str(result[key]) for key in CONFIGURATION_KEYS if key != "repeat")
+    if not result["success"]:
+        return configuration + ": failed" + (" (" + result["error"] + ")" if result.get("error") else "")
+    return configuration + ": " + str(result["number_of_measurements"]) + " measurements, " + str(result["number_of_mirror_moves"]) + " moves, " + _round(result["wall_time"]) + " s (fit " + _round(result["fit_time"]) + " s), center error " + _round(result["center_error"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+import concurrent.futures
+import threading
+import time
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+
+
+class CalibrationScheduler():
+
+    """
+        This provides a class for running the calibrations of several
+        LaserCalibrationSystem instances of the same setup concurrently,
+        where systems may share mirrors.
+
+        A job is a calibration routine (e.g. `grid_sweep_optimize_ND`) run on
+        a system over some of its axes. Two jobs conflict if their systems
+        share any Mirror instance: a routine moves the mirrors it optimizes
+        over, and its measurements rely on every other mirror of its system
+        staying where it is. Conflicts are detected from the Mirror objects
+        of each system (by identity, whatever names the systems give them).
+
+        `run` starts a job as soon as the locks of all of its mirrors can be
+        taken, so that jobs with disjoint mirrors run concurrently in a
+        thread pool and conflicting ones run one after another. Locks are
+        taken all-or-none, in a fixed order, so jobs never deadlock or hold
+        mirrors while waiting for others. Among jobs that are ready, the one
+        added first starts first.
+
+        To use:
+
+            scheduler = CalibrationScheduler()
+            scheduler.add_job(syst1, grid_sweep_optimize_ND, ["x1","y1"], plot=False)
+            scheduler.add_job(syst2, spsa_optimize, ["x2","y2"])
+            report = scheduler.run()
+    """
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers
+        self._jobs = []
+        # id(Mirror) -> (order, Lock, Mirror); the Mirror is kept so that
+        # its id stays unique while the scheduler is alive
+        self._locks = {}
+
+    def add_job(self, laser_syst: LaserCalibrationSystem, routine, optimize_over_axes: str | list[str] | None = None, name: str | None = None, **kwargs):
+        """
+            Add a job calling routine(laser_syst, optimize_over_axes=
+            optimize_over_axes, **kwargs), and return its name
+
+            laser_syst: a LaserCalibrationSystem instance
+            routine: calibration routine
+            optimize_over_axes: str | list[str] | None, passed to routine
+            name: str | None, name of the job in the report (if None,
+            "job <number>")
+        """
+        if name is None:
+            name = "job " + str(len(self._jobs))
+
+        if any(job["name"] == name for job in self._jobs):
+            m = "a job named " + name + " already exists"
+            raise ValueError(m)
+
+        mirrors = [laser_syst.get_mirror(mirror) for mirror in laser_syst.get_all_mirror_names()]
+        for mirror in mirrors:
+            if id(mirror) not in self._locks:
+                self._locks[id(mirror)] = (len(self._locks), threading.Lock(), mirror)
+
+        self._jobs.append({"name": name, "laser_syst": laser_syst, "routine": routine, "optimize_over_axes": optimize_over_axes, "kwargs": kwargs,
+                           "mirrors": sorted({id(mirror) for mirror in mirrors}, key = lambda key: self._locks[key][0])})
+        return name
+
+    def conflicts(self):
+        """
+            Conflicting jobs, as a dict of job name: list of names of the
+            jobs sharing a mirror with it
+        """
+        return {job["name"]: [other["name"] for other in self._jobs if other is not job and set(job["mirrors"]) & set(other["mirrors"])] for job in self._jobs}
+
+    def run(self):
+        """
+            Run all jobs added so far, and return a report as a dict with
+
+            "results": dict of job name: return value of the routine
+            "errors": dict of job name: exception, for jobs that raised
+            "durations": dict of job name: run time in seconds
+            "makespan": time from the first job start to the last job end
+            "serial_time": sum of the durations, i.e. the time running the
+            jobs one after another would have taken
+        """
+        jobs = list(self._jobs)
+        report = {"results": {}, "errors": {}, "durations": {}}
+        max_workers = self.max_workers if self.max_workers is not None else max(len(jobs), 1)
+
+        start_time = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers = max_workers) as executor:
+            running = {}
+            while jobs or running:
+                # start every waiting job whose mirrors are all free, while
+                # there are idle workers
+                for job in list(jobs):
+                    if len(running) >= max_workers:
+                        break
+                    if self._acquire(job["mirrors"]):
+                        jobs.remove(job)
+                        running[executor.submit(self._run_job, job, report)] = job
+
+                if not running:
+                    # a job's mirrors are only busy while another job runs
+                    m = "no job can be started"
+                    raise RuntimeError(m)
+
+                done = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)[0]
+                for future in done:
+                    job = running.pop(future)
+                    self._release(job["mirrors"])
+
+        report["makespan"] = time.perf_counter() - start_time
+        report["serial_time"] = sum(report["durations"].values())
+
+        for name, error in report["errors"].items():
+            print("\33[0;49;31mJob "+name+" failed:\33[0;49;38m "+repr(error))
+        print("\33[0;49;33mMakespan:\33[0;49;38m "+"%.3f" % report["makespan"]+" s\33[0;49;33m, serial:\33[0;49;38m "+"%.3f" % report["serial_time"]+" s")
+
+        return report
+
+    def _run_job(self, job, report):
+        start_time = time.perf_counter()
+        try:
+            report["results"][job["name"]] = job["routine"](job["laser_syst"], optimize_over_axes = job["optimize_over_axes"], **job["kwargs"])
+        except Exception as error:
+            report["errors"][job["name"]] = error
+        finally:
+            report["durations"][job["name"]] = time.perf_counter() - start_time
+
+    def _acquire(self, mirrors):
+        # take the locks of all mirrors, in their fixed order, or none
+        acquired = []
+        for key in mirrors:
+            if not self._locks[key][1].acquire(blocking = False):
+                self._release(acquired)
+                return False
+            acquired.append(key)
+        return True
+
+    def _release(self, mirrors):
+        for key in reversed(mirrors):
+            self._locks[key][1].release()
@@ -6,11 +6,11 @@
 
 import numpy as np
 from laser_calibration.laser_calibration_system import LaserCalibrationSystem
-from scipy.optimize import minimize
+from laser_calibration.instrumentation import instrumentation
 
 
 
-def generic_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None,samples: int = 1):
+def generic_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None,samples: int = 1, adaptive: bool = False, confidence: float = 0.95):
     """
         function to calibrate by using scipy's optimize.minimize function.
         
@@ -20,6 +20,12 @@ def generic_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str
         Optional arguments:
         optimize_over_axes: str | list[str] | None. Specify which mirror
         samples: how many samples of measurements to take at a given point
+        adaptive: bool, defaulted to False. If True, `samples` is the
+        maximum number of samples, and a point stops being sampled as soon
+        as the Poisson confidence interval of its photon number per sample
+        shows it is better or worse than the best point so far
+        confidence: float, defaulted to 0.95. Confidence level of the
+        interval used with adaptive
     """
     if optimize_over_axes is None:
         optimize_over_axes = laser_syst.get_all_mirror_names()
@@ -31,18 +37,37 @@ def generic_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str
     
     
     
+    # best photon number per sample so far, and number of samples taken
+    incumbent = [None]
+    number_of_samples = [0]
+    
+    indices = laser_syst.mirror_indices(optimize_over_axes)
+    
+    def adaptive_func(r):
+        laser_syst.move_mirrors_vector(np.ravel(r), indices)
+        response, samples_taken = laser_syst.measure_adaptive(incumbent[0], samples, confidence=confidence)
+        number_of_samples[0] += samples_taken
+        if incumbent[0] is None or response > incumbent[0]:
+            incumbent[0] = response
+        return -1*response
+    
     if dimension == 1:
-        func = lambda x: -1*np.mean( [laser_syst.move_mirrors_and_measure(**{optimize_over_axes[0]:x}) for sample_number in range(samples)])
+        func = lambda x: -1*np.mean( [laser_syst.move_and_measure_vector(np.ravel(x), indices) for sample_number in range(samples)])
         bounds = ((-1,1),)
         x0 = (.1,)
     elif dimension == 2:
-        func = lambda r: -1*np.mean( [laser_syst.move_mirrors_and_measure(**{optimize_over_axes[0]:r[0],optimize_over_axes[1]:r[1]}) for sample_number in range(samples)])
+        func = lambda r: -1*np.mean( [laser_syst.move_and_measure_vector(r, indices) for sample_number in range(samples)])
         bounds = ((-1,1),(-1,1),)
         x0 = (.1,.1,)
     else:
         m = "optimization over more than 2 dimensions are not yet implemented"
         raise NotImplementedError(m)
         
+    if adaptive:
+        func = adaptive_func
+        
+    # deferred, as scipy.optimize is slow to import
+    from scipy.optimize import minimize
     result = minimize(func,x0=x0,bounds=bounds)        
 
     
@@ -52,8 +77,17 @@ def generic_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str
     
     
     print("Fit parameters: "+str(result))
+    
+    if adaptive:
+        print("Samples taken: "+str(number_of_samples[0])+" of "+str(samples*result.nfev)+" with fixed sampling")
+    
+    if laser_syst.ledger is not None:
+        print("Measurements answered from ledger: "+str(laser_syst.ledger.hits)+", measured: "+str(laser_syst.ledger.misses))
 
     for mirror in optimize_over_axes:
         print("Mirror "+mirror + " moved to "+str(move_mirrors_args[mirror]))
+
+    if instrumentation.enabled:
+        instrumentation.print_summary()
         
     return move_mirrors_args
\ No newline at end of file
@@ -6,12 +6,12 @@
 
 import numpy as np
 from laser_calibration.laser_calibration_system import LaserCalibrationSystem
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt
+from laser_calibration.instrumentation import instrumentation
+from laser_calibration.grid_sweep_optimize_ND import fit_roi
 
 
 
-def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None,  step: float = 0.1, plot: bool = True):
+def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None,  step: float = 0.1, plot: bool = True, samples: int = 1, threshold: float | None = None, confidence: float = 0.95, roi: float | None = None, live_view = None):
     """
         functino to perform grid sweep over up to 2 dimensions, and then
         perform Gaussian fit to find the optimal operating point.
@@ -24,6 +24,20 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
         axes to optmize over (if None, all is assumed)
         step: float, defaulted to 0.1. Step size of sweep
         plot: bool, defaulted to True. Whether to display the final plot.
+        samples: int, defaulted to 1. Number of samples of measurements per
+        point; the response is the mean photon number per sample
+        threshold: float | None, defaulted to None. If not None, a point
+        stops being sampled as soon as the Poisson confidence interval of
+        its photon number per sample is below threshold (background)
+        confidence: float, defaulted to 0.95. Confidence level of the
+        interval
+        roi: float | None, defaulted to None. If not None, only fit the
+        points within +/- roi standard deviations of the peak, with Poisson
+        weights, falling back to the whole grid if that fit fails (see
+        grid_sweep_optimize_ND)
+        live_view: LiveView | None, defaulted to None. A started LiveView
+        (see live_view.py) to send the sweep and the fit to as they come in;
+        the sweep is then measured in chunks of live_view.chunk_size points
     """
     
     if optimize_over_axes is None:
@@ -36,11 +50,33 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
     
     grid_values = np.arange(-1,1,step)
     
+    def measure_chunk(positions):
+        # one sample per point, or adaptively up to `samples`; returns the
+        # response and the number of samples of each point
+        if samples == 1:
+            return laser_syst.measure_batch(positions, optimize_over_axes), np.ones(len(positions), dtype=int)
+        return laser_syst.measure_batch_adaptive(positions, threshold, samples, optimize_over_axes, confidence=confidence, stop_above=False)
+    
+    def measure(positions):
+        if live_view is None:
+            return measure_chunk(positions)
+        
+        # positions are in raveled grid order, so their indices are those
+        # of the grid
+        live_view.begin([grid_values]*dimension, optimize_over_axes)
+        responses, sample_counts = [], []
+        for start in range(0, len(positions), live_view.chunk_size):
+            chunk_response, chunk_samples = measure_chunk(positions[start:start+live_view.chunk_size])
+            live_view.update(np.arange(start, start+len(chunk_response)), np.array(chunk_response))
+            responses.append(chunk_response)
+            sample_counts.append(chunk_samples)
+        return np.concatenate(responses), np.concatenate(sample_counts)
+    
     if dimension == 1:
         model = gaussian_1d
+        jacobian = gaussian_1d_jacobian
            
-        response = [laser_syst.move_mirrors_and_measure(x=x_val) for x_val in grid_values]
-        response = np.array(response)
+        response, sample_counts = measure(grid_values)
         independent_variables = grid_values
         
         amplitude_guess = np.max(response)
@@ -55,11 +91,13 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
         
     elif dimension == 2:
         model = gaussian_2d
+        jacobian = gaussian_2d_jacobian
 
         x,y = np.meshgrid(grid_values,grid_values,indexing='ij')
         independent_variables = (x,y)
-        response = [[laser_syst.move_mirrors_and_measure(x=x_val,y=y_val) for y_val in grid_values] for x_val in grid_values]  
-        response = np.array(response)
+        positions = np.column_stack((np.ravel(x),np.ravel(y)))
+        response, sample_counts = measure(positions)
+        response = response.reshape(x.shape)
         
         index_x,index_y = np.unravel_index(np.argmax(response),shape=response.shape)
         amplitude_guess = np.max(response)
@@ -84,9 +122,20 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
         m = "Width obtained from second moments is small compared to step size; try using a smaller step size"
 
     
-    try:
-        popt, pcov = curve_fit(model,independent_variables,response,p0)
-    except:
+    def fit(axes, values, p0, sigma=None):
+        # deferred, as scipy.optimize is slow to import
+        from scipy.optimize import curve_fit
+        
+        variables = axes[0] if dimension == 1 else tuple(np.meshgrid(*axes, indexing='ij'))
+        try:
+            with instrumentation.timer("fit"):
+                return curve_fit(model,variables,values,p0,sigma=sigma,jac=jacobian)
+        except:
+            return None, None
+    
+    # the widths of gaussian_1d/2d are standard deviations
+    popt, pcov = fit_roi([grid_values]*dimension, response, p0, roi, fit, width_scale=1, sample_counts=sample_counts)[:2]
+    if popt is None:
         print("Fit failed; exiting calibration")
         return
     
@@ -94,29 +143,16 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
         print("Fit obtained NaN values; exiting calibration")
         return
     
+    if live_view is not None:
+        # gaussian_ND parameters, from the width convention of gaussian_1d/2d
+        live_view.fit([popt[0]] + [value*np.sqrt(2) if index % 2 else value for index, value in enumerate(popt[1:])])
+    
     if plot:
-        plt.figure()
+        from laser_calibration.visualization import plot_sweep_1d, plot_sweep_2d
         if dimension == 1:
-            
-            plt.plot(grid_values,response,'o')
-            x_fit = np.linspace(-1,1,101)
-            plt.plot(x_fit,gaussian_1d(x_fit,*popt))
-            plt.xlabel("x")
-            plt.ylabel("Photon number")
-            
-            
+            plot_sweep_1d(grid_values, response, gaussian_1d, popt)
         elif dimension == 2:
-            response = response.reshape(x.shape)
-            plt.pcolormesh(x,y,response)
-            
-            fit_model_z_values = gaussian_2d((x,y),*popt)
-            fit_model_z_values = fit_model_z_values.reshape(x.shape)
-            plt.contour(x,y,fit_model_z_values, cmap=plt.cm.copper)
-            plt.pcolormesh(x,y,np.array(response))
-            plt.xlabel("x")
-            plt.ylabel("y")
-            cbar = plt.colorbar()
-            cbar.set_label("Photon number")
+            plot_sweep_2d(x, y, response, gaussian_2d, popt)
 
 
     move_mirrors_args = {}
@@ -127,6 +163,12 @@ def grid_sweep_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes:
     for mirror in optimize_over_axes:
         print("\33[0;49;33mMirror "+mirror + " moved to:\33[0;49;38m "+str(move_mirrors_args[mirror]))
     
+    if samples > 1:
+        print("\33[0;49;33mSamples taken:\33[0;49;38m "+str(int(np.sum(sample_counts)))+" of "+str(samples*response.size)+" with fixed sampling")
+
+    if instrumentation.enabled:
+        instrumentation.print_summary()
+    
     return move_mirrors_args
     
 def gaussian_2d(x_y,A,x0,x_width,y0,y_width):
@@ -138,4 +180,39 @@ def gaussian_2d(x_y,A,x0,x_width,y0,y_width):
 def gaussian_1d(x,A,x0,x_width):
  
     G= A*np.exp(-(x-x0)**2/(2*x_width**2))
-    return np.ravel(G)
\ No newline at end of file
+    return np.ravel(G)
+
+def gaussian_2d_jacobian(x_y,A,x0,x_width,y0,y_width):
+    """
+        derivatives of gaussian_2d with respect to (A,x0,x_width,y0,y_width)
+    """
+    x = np.ravel(x_y[0])
+    y = np.ravel(x_y[1])
+    jacobian = np.empty((len(x),5))
+    
+    dx = (x-x0)/x_width**2
+    dy = (y-y0)/y_width**2
+    E = np.exp(-0.5*(dx*(x-x0) + dy*(y-y0)))
+    G = A*E
+    
+    jacobian[:,0] = E
+    jacobian[:,1] = G*dx
+    jacobian[:,2] = jacobian[:,1]*(x-x0)/x_width
+    jacobian[:,3] = G*dy
+    jacobian[:,4] = jacobian[:,3]*(y-y0)/y_width
+    return jacobian
+
+def gaussian_1d_jacobian(x,A,x0,x_width):
+    """
+        derivatives of gaussian_1d with respect to (A,x0,x_width)
+    """
+    x = np.ravel(x)
+    jacobian = np.empty((len(x),3))
+    
+    dx = (x-x0)/x_width**2
+    E = np.exp(-0.5*dx*(x-x0))
+    
+    jacobian[:,0] = E
+    jacobian[:,1] = A*E*dx
+    jacobian[:,2] = jacobian[:,1]*(x-x0)/x_width
+    return jacobian
@@ -6,12 +6,15 @@
 
 import numpy as np
 from laser_calibration.laser_calibration_system import LaserCalibrationSystem
-from scipy.optimize import curve_fit
-from matplotlib import pyplot as plt
+from laser_calibration.instrumentation import instrumentation
+from laser_calibration.sweep_order import sweep_order_chunks, sweep_travel
+from laser_calibration.sweep_store import SweepStore
 
-import itertools
 
-def grid_sweep_optimize_ND(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None, sweep_range: list | tuple | None = None, step: list[float] | tuple[float] | float = 0.1, plot: bool = True):
+# number of grid points generated, measured and accumulated at a time
+SWEEP_CHUNK_SIZE = 65536
+
+def grid_sweep_optimize_ND(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None, sweep_range: list | tuple | None = None, step: list[float] | tuple[float] | float = 0.1, plot: bool = True, order: str = "raster", full_output: bool = False, target_precision: float | None = None, window_widths: float = 2, refinement: float = 2, max_levels: int = 6, coarse_grid: bool = False, store: SweepStore | str | None = None, samples: int = 1, threshold: float | None = None, confidence: float = 0.95, roi: float | None = None, live_view = None):
     """
         function to perform grid sweep over up to 2 dimensions, and then
         perform Gaussian fit to find the optimal operating point.
@@ -23,6 +26,80 @@ def grid_sweep_optimize_ND(laser_syst: LaserCalibrationSystem, optimize_over_axe
         optimize_over_axes: str | list[str] | None. Specify which mirror
         axes to optmize over (if None, all is assumed)
         plot: bool, defaulted to True. Whether to display the final plot.
+        order: str, defaulted to "raster". Order in which the grid points are
+        visited: "raster", "serpentine" or "hilbert" (see `sweep_order`).
+        "serpentine" avoids the flyback of the fast axis at the end of each row
+        full_output: bool, defaulted to False. If True, also return a dict
+        with the total mirror travel commanded during the sweep ("travel",
+        summed over axes) and the number of measurements taken
+        
+        Coarse-to-fine mode (used if target_precision is not None):
+        target_precision: float | None, defaulted to None. The first, coarse
+        level then sweeps each axis over its whole range with `step`, along
+        a line through the current mirror positions and the centers found on
+        the previous axes; an axis showing no peak is scanned once more,
+        through the centers of the other axes. This needs the peak to stand
+        out along some line through the starting positions; if it does not
+        along every axis, None is returned. Each subsequent level 
+        re-sweeps every axis along a line through the current fitted center,
+        over a window of +/- window_widths times the previous level's fitted
+        width, with the step divided by `refinement`. At least one refinement
+        level is run; levels stop once the fit uncertainty of every center is
+        below target_precision, or after max_levels levels. Since every level
+        is made of line scans, the number of measurements grows linearly with
+        the number of axes. The amplitude is that of the last line fitted,
+        through the latest centers of all other axes. If a level fails (a
+        line fit fails, or its window leaves the sweep range), refinement
+        stops at the centers of the last level that succeeded. With
+        full_output, the dict also has the per-level results under "levels".
+        coarse_grid: bool, defaulted to False. If True, the coarse level is
+        a grid sweep with `step` instead, which costs (2/step)^N
+        measurements but does not assume the peak is visible along a line
+        through the starting positions; store and roi need it.
+        
+        If a fitted center is outside of the mirror range, the mirrors are
+        not moved and None is returned.
+        
+        Storage:
+        store: SweepStore | str | None, defaulted to None. A SweepStore, or
+        the path of its directory, to stream the grid sweep into as it runs.
+        If the store already holds an unfinished sweep of the same grid and
+        order, the sweep resumes from its last checkpoint; if it holds a
+        finished one, nothing is measured and the stored response is fitted.
+        In coarse-to-fine mode, it needs coarse_grid; refinement line scans
+        are not stored.
+        
+        Sampling:
+        samples: int, defaulted to 1. Number of samples of measurements per
+        point; the response is the mean photon number per sample
+        threshold: float | None, defaulted to None. If not None, sampling
+        is adaptive: a point stops being sampled as soon as the Poisson
+        confidence interval of its photon number per sample is below
+        threshold (i.e. it is background), so that dark regions take fewer
+        than `samples` samples. Set it above the background level.
+        confidence: float, defaulted to 0.95. Confidence level of the
+        interval
+        With full_output, the dict also has the total number of samples
+        taken, "number_of_samples".
+        
+        Region of interest:
+        roi: float | None, defaulted to None. If not None, the Gaussian is
+        only fitted to the points within +/- roi standard deviations of the
+        center along each axis, with Poisson weights (see fit_roi; with
+        several samples per point, these follow the samples taken at each
+        point), instead of the whole
+        grid; e.g. roi=3. The center and standard deviation along an axis
+        are the moments of the response summed over the other axes, less
+        its median (the background). Most points of a large grid are background, which costs fit
+        time without constraining the center. If the fit fails, or its
+        center falls outside the region, the whole grid is fitted instead.
+        In coarse-to-fine mode, it needs coarse_grid. With full_output, the
+        dict also has the number of points fitted, "fit_points" (None for
+        coarse line scans).
+        
+        live_view: LiveView | None, defaulted to None. A started LiveView
+        (see live_view.py) to send the grid sweep and the fit to as they
+        come in; refinement line scans are not shown
     """
     
     if optimize_over_axes is None:
@@ -39,33 +116,115 @@ def grid_sweep_optimize_ND(laser_syst: LaserCalibrationSystem, optimize_over_axe
         sweep_range = [[-1,1]]*dimension
         
     
-    meshgrid_arg = [np.arange(sweep_range[index][0],sweep_range[index][1],step[index]) for index in range(dimension)] 
-    independent_variables_grid = np.meshgrid(*meshgrid_arg, indexing="ij")
-    independent_variables_ravel = list(itertools.product(*meshgrid_arg))
-    all_mirror_names = laser_syst.get_all_mirror_names()
-    response = np.array([laser_syst.move_mirrors_and_measure(**dict(zip(all_mirror_names,val))) for val in independent_variables_ravel])
+    sampling = {"samples": samples, "threshold": threshold, "confidence": confidence}
     
-    amplitude_guess = np.max(response)
-    p0 = [amplitude_guess]
-    for index in range(dimension):
-        x = np.ravel(independent_variables_grid[index])
-        center_guess = np.sum(x*response)/np.sum(response)
-        width_guess = np.sum((x-center_guess)**2*response)/np.sum(response)*np.sqrt(2)
-        p0.append(center_guess)
-        p0.append(width_guess)        
-    
-    try:
-        popt, pcov = curve_fit(gaussian_ND,independent_variables_grid,response,p0)
-    except:
-        print("Fit failed; exiting calibration")
-        return    
+    if target_precision is not None and not coarse_grid:
+        if store is not None or roi is not None:
+            m = "store and roi need a coarse grid sweep; set coarse_grid=True"
+            raise ValueError(m)
+        
+        popt, pcov, number_of_measurements, number_of_samples, travel = _coarse_line_scans(laser_syst, optimize_over_axes, sweep_range, step, order, sampling)
+        fit_points = None
+        if popt is None:
+            print("No peak found along the coarse line scans; exiting calibration (coarse_grid=True sweeps a grid instead)")
+            return
+    else:
+        meshgrid_arg = [np.arange(sweep_range[index][0],sweep_range[index][1],step[index]) for index in range(dimension)] 
+        
+        resumed = 0
+        if store is not None:
+            if not isinstance(store, SweepStore):
+                store = SweepStore(store)
+            if not store.initialized:
+                store.initialize(optimize_over_axes, meshgrid_arg, order, sweep_range, step, _configuration(laser_syst))
+            elif not store.matches(optimize_over_axes, meshgrid_arg, order):
+                m = "store holds a sweep of different mirrors, grid or order"
+                raise ValueError(m)
+            else:
+                resumed = store.completed
+                print("\33[0;49;33mResuming sweep from point\33[0;49;38m "+str(resumed)+" of "+str(len(store.response)))
+        
+        response, travel, p0, number_of_samples, sample_counts = _sweep_grid(laser_syst, optimize_over_axes, meshgrid_arg, order, store, live_view=live_view, **sampling)
+        number_of_measurements = len(response) - resumed
+        print("\33[0;49;33mTotal mirror travel ("+order+" order):\33[0;49;38m "+str(travel))
+        
+        popt, pcov, fit_points = _fit_gaussian_ND_roi(meshgrid_arg, response, p0, roi, sample_counts)
+        if popt is not None and live_view is not None:
+            live_view.fit(popt)
+        if target_precision is not None and popt is not None and not all(sweep_range[index][0] <= popt[index*2+1] <= sweep_range[index][1] for index in range(dimension)):
+            print("Coarse fit center is outside of the sweep range")
+            popt = None
+        if popt is None and target_precision is not None:
+            # the coarse level only needs to locate the peak
+            print("Coarse fit failed; refining from the moments of the response")
+            popt, pcov = np.array(p0), np.full((len(p0), len(p0)), np.inf)
+        elif popt is None:
+            print("Fit failed; exiting calibration")
+            return
     
+    levels = []
+    if target_precision is not None:
+        levels.append({"step": list(step), "number_of_measurements": number_of_measurements, "precision": _center_precision(pcov)})
+        level_step = np.array(step, dtype=float)
+        
+        # the coarse level only locates the peak, so at least one refinement
+        # level is always run
+        while len(levels) == 1 or max(levels[-1]["precision"]) > target_precision and len(levels) < max_levels:
+            level_step = level_step/refinement
+            level = {"step": list(level_step), "number_of_measurements": 0, "precision": []}
+            # centers of the last level that succeeded, to fall back to
+            previous_popt = np.array(popt, dtype=float)
+            
+            for index in range(dimension):
+                center = popt[index*2+1]
+                # the previous level cannot resolve widths below its step
+                width = max(abs(popt[index*2+2]), level_step[index]*refinement)
+                if not np.isfinite(width) or width > sweep_range[index][1] - sweep_range[index][0]:
+                    width = step[index]
+                low = max(sweep_range[index][0], center - window_widths*width)
+                high = min(sweep_range[index][1], center + window_widths*width)
+                if not high > low:
+                    print("Fitted center is outside of the sweep range; refinement stopped at level "+str(len(levels)))
+                    break
+                
+                # line through the current center along this axis, with at
+                # least 8 points in the window so the width is still resolved
+                line_arg = [[np.clip(popt[axis*2+1], *sweep_range[axis])] for axis in range(dimension)]
+                line_arg[index] = np.arange(low, high, min(level_step[index], (high-low)/8))
+                line_response, line_travel, line_p0, line_samples, _ = _sweep_grid(laser_syst, optimize_over_axes, line_arg, order, **sampling)
+                level["number_of_measurements"] += len(line_response)
+                number_of_samples += line_samples
+                travel += line_travel
+                
+                line_p0 = [line_p0[0], line_p0[index*2+1], line_p0[index*2+2]]
+                line_popt, line_pcov = _fit_gaussian_ND([line_arg[index]], line_response, line_p0)
+                if line_popt is None:
+                    print("Fit failed; refinement stopped at level "+str(len(levels)))
+                    break
+                
+                # the amplitude of a line is attenuated by the offsets of the
+                # other centers, so the last line, through the latest
+                # centers of all other axes, gives the best estimate
+                popt[0] = line_popt[0]
+                popt[index*2+1] = line_popt[1]
+                popt[index*2+2] = line_popt[2]
+                level["precision"].append(_center_precision(line_pcov)[0])
+            else:
+                number_of_measurements += level["number_of_measurements"]
+                levels.append(level)
+                continue
+            
+            number_of_measurements += level["number_of_measurements"]
+            popt = previous_popt
+            break
+        
+        print("\33[0;49;33mLevels:\33[0;49;38m "+str(len(levels))+"\33[0;49;33m, total measurements:\33[0;49;38m "+str(number_of_measurements))
 
-    if any(np.isnan(popt)):
-        print("Fit obtained NaN values; exiting calibration")
-        return
-    
 
+    centers = np.array([popt[index*2+1] for index in range(dimension)], dtype=float)
+    if not np.all(np.abs(centers) <= 1):
+        print("Fitted center is outside of the mirror range; exiting calibration")
+        return
 
     move_mirrors_args = {}
     [move_mirrors_args.update({optimize_over_axes[index]:popt[index*2+1]}) for index in range(len(optimize_over_axes)) ]
@@ -75,9 +234,378 @@ def grid_sweep_optimize_ND(laser_syst: LaserCalibrationSystem, optimize_over_axe
     for mirror in optimize_over_axes:
         print("\33[0;49;33mMirror "+mirror + " moved to:\33[0;49;38m "+str(move_mirrors_args[mirror]))
     
+    if samples > 1 and number_of_measurements > 0:
+        print("\33[0;49;33mSamples taken:\33[0;49;38m "+str(number_of_samples)+" of "+str(samples*number_of_measurements)+" with fixed sampling ("+"%.1f" % (100*(1 - number_of_samples/(samples*number_of_measurements)))+"% less integration)")
+
+    if instrumentation.enabled:
+        instrumentation.print_summary()
+    
+    if full_output:
+        info = {"travel": travel, "number_of_measurements": number_of_measurements, "number_of_samples": number_of_samples, "fit_points": fit_points}
+        if target_precision is not None:
+            info["levels"] = levels
+        return move_mirrors_args, info
+    
     return move_mirrors_args
 
 
+def _sweep_grid(laser_syst, optimize_over_axes, meshgrid_arg, order, store=None, samples=1, threshold=None, confidence=0.95, live_view=None):
+    # visit the grid in the requested order, one chunk of points at a time,
+    # and put each measurement back into its cell so that the response is in
+    # the raveled meshgrid order. The moment guesses are accumulated as the
+    # chunks come in, so only the response array scales with the grid.
+    # With a store, the response is its memory-mapped array, each chunk is
+    # checkpointed, and points completed in a previous run are read back
+    # instead of measured. With several samples per point, the response is
+    # the mean per sample, sampled adaptively if threshold is not None.
+    # With a live view, every chunk is also sent to it.
+    # Returns the response, the total mirror travel, the guesses, the
+    # number of samples taken and the number of samples of each point
+    # (points read back from a store are taken to have all `samples`).
+    dimension = len(optimize_over_axes)
+    meshgrid_arg = [np.asarray(values, dtype=float) for values in meshgrid_arg]
+    shape = tuple(len(values) for values in meshgrid_arg)
+    
+    if store is None:
+        response = np.empty(int(np.prod(shape)))
+        chunk_size = SWEEP_CHUNK_SIZE
+        completed = 0
+    else:
+        response = store.response
+        chunk_size = min(SWEEP_CHUNK_SIZE, store.checkpoint_interval)
+        completed = store.completed
+    sample_counts = np.full(len(response), samples)
+    
+    if live_view is not None:
+        chunk_size = min(chunk_size, live_view.chunk_size)
+        live_view.begin(meshgrid_arg, optimize_over_axes)
+    
+    moments = _MomentAccumulator([(values[0] + values[-1])/2 for values in meshgrid_arg])
+    previous_position = [laser_syst.get_mirror_position(mirror) for mirror in optimize_over_axes]
+    travel = 0
+    visited = 0
+    number_of_samples = 0
+    
+    for indices in sweep_order_chunks(shape, order, chunk_size):
+        positions = np.column_stack([meshgrid_arg[index][indices[:,index]] for index in range(dimension)])
+        flat_indices = np.ravel_multi_index(tuple(indices.T), shape)
+        
+        # points before `stored` were measured in a previous run
+        stored = min(max(completed - visited, 0), len(indices))
+        if stored:
+            moments.add(positions[:stored], response[flat_indices[:stored]])
+        
+        if stored < len(indices):
+            travel += np.sum(sweep_travel(positions[stored:], previous_position))
+            previous_position = positions[-1]
+            
+            if samples == 1:
+                chunk_response = laser_syst.measure_batch(positions[stored:], optimize_over_axes)
+                number_of_samples += len(chunk_response)
+            else:
+                # points stop being sampled once known to be background
+                chunk_response, chunk_samples = laser_syst.measure_batch_adaptive(positions[stored:], threshold, samples, optimize_over_axes, confidence=confidence, stop_above=False)
+                number_of_samples += np.sum(chunk_samples)
+                sample_counts[flat_indices[stored:]] = chunk_samples
+            if store is None:
+                response[flat_indices] = chunk_response
+            else:
+                store.write(flat_indices[stored:], chunk_response)
+            moments.add(positions[stored:], chunk_response)
+        
+        if live_view is not None:
+            live_view.update(flat_indices, response[flat_indices])
+        
+        visited += len(indices)
+    
+    return response, travel, moments.guess(), int(number_of_samples), sample_counts
+
+
+def _coarse_line_scans(laser_syst, optimize_over_axes, sweep_range, step, order, sampling):
+    # coarse level of the coarse-to-fine mode, in line scans instead of a
+    # grid: starting from the current mirror positions, each axis is swept
+    # over its whole range with `step`, along a line through the centers
+    # found so far. For an axis-aligned Gaussian, the center along a line
+    # does not depend on the other coordinates, which only attenuate the
+    # peak; axes whose line shows no peak are scanned again in a second
+    # pass, through the centers found on the other axes. The cost is one or
+    # two lines per axis, so it grows linearly with the number of axes.
+    # Returns (popt, pcov, number of measurements, number of samples,
+    # travel), with popt None if some axis shows no peak.
+    dimension = len(optimize_over_axes)
+    point = [float(np.clip(laser_syst.get_mirror_position(mirror), *sweep_range[index])) for index, mirror in enumerate(optimize_over_axes)]
+    popt = np.full(2*dimension + 1, np.nan)
+    variances = np.full(2*dimension + 1, np.inf)
+    number_of_measurements, number_of_samples, travel = 0, 0, 0
+    found = [False]*dimension
+    
+    for scan in range(2):
+        if scan == 1 and not any(found):
+            # the lines of a second pass would be the same
+            break
+        for index in range(dimension):
+            if found[index]:
+                continue
+            
+            line_arg = [[point[axis]] for axis in range(dimension)]
+            line_arg[index] = np.arange(sweep_range[index][0], sweep_range[index][1], step[index])
+            line_response, line_travel, line_p0, line_samples, _ = _sweep_grid(laser_syst, optimize_over_axes, line_arg, order, **sampling)
+            number_of_measurements += len(line_response)
+            number_of_samples += line_samples
+            travel += line_travel
+            
+            # a peak stands out of the median of the line by several
+            # Poisson standard deviations
+            median = np.median(line_response)
+            if not np.max(line_response) - median > 3*np.sqrt(max(median, 1)):
+                continue
+            
+            line_p0 = [line_p0[0], line_p0[index*2+1], line_p0[index*2+2]]
+            line_popt, line_pcov = _fit_gaussian_ND([line_arg[index]], line_response, line_p0)
+            if line_popt is not None and line_arg[index][0] <= line_popt[1] <= line_arg[index][-1]:
+                popt[0], popt[index*2+1], popt[index*2+2] = line_popt
+                variances[index*2+1] = line_pcov[1, 1]
+            else:
+                # too few points to fit: the brightest one, to within a step
+                popt[0] = np.max(line_response)
+                popt[index*2+1] = line_arg[index][np.argmax(line_response)]
+                popt[index*2+2] = step[index]
+            
+            point[index] = popt[index*2+1]
+            found[index] = True
+    
+    print("\33[0;49;33mCoarse line scans:\33[0;49;38m "+str(number_of_measurements)+" measurements")
+    if not all(found):
+        return None, None, number_of_measurements, number_of_samples, travel
+    
+    return popt, np.diag(variances), number_of_measurements, number_of_samples, travel
+
+
+def _configuration(laser_syst):
+    # system configuration recorded with a stored sweep
+    mirror_names = laser_syst.get_all_mirror_names()
+    return {"mirror_names": mirror_names,
+            "mirror_positions": {mirror: float(laser_syst.get_mirror_position(mirror)) for mirror in mirror_names},
+            "simulation": bool(laser_syst.simulation),
+            "simulation_mirror_set": list(laser_syst.simulation_mirror_set) if laser_syst.simulation else None}
+
+
+class _MomentAccumulator():
+    
+    """
+        Online amplitude, center and width guesses of a response, from its
+        maximum and its first (center-of-mass) and second moments, updated
+        one chunk of points at a time. The sums are taken relative to a
+        fixed shift (the center of the grid) to avoid cancellation in the
+        second moment.
+    """
+    def __init__(self, shift):
+        self._shift = np.asarray(shift, dtype=float)
+        self._amplitude = -np.inf
+        self._weight = np.float64(0)
+        self._first = np.zeros(len(self._shift))
+        self._second = np.zeros(len(self._shift))
+        
+    def add(self, positions, response):
+        if len(response) == 0:
+            return
+        
+        difference = positions - self._shift
+        self._amplitude = max(self._amplitude, np.max(response))
+        self._weight += np.sum(response)
+        self._first += response@difference
+        self._second += response@difference**2
+        
+    def guess(self):
+        # [amplitude, center 1, width 1, center 2, width 2, ...]
+        mean = self._first/self._weight
+        variance = self._second/self._weight - mean**2
+        
+        p0 = [self._amplitude]
+        for index in range(len(self._shift)):
+            p0.append(self._shift[index] + mean[index])
+            p0.append(variance[index]*np.sqrt(2))
+        
+        return p0
+
+
+def fit_stored_sweep(store: SweepStore | str, full_output: bool = False, roi: float | None = None):
+    """
+        function to fit the Gaussian to a finished sweep in a SweepStore,
+        offline. The stored response is used directly from its memory-mapped
+        file, and the moment guesses are accumulated chunk by chunk, so the
+        response is not copied into memory.
+        
+        Arguments:
+        store: a SweepStore, or the path of its directory
+        
+        Optional arguments:
+        full_output: bool, defaulted to False. If True, also return a dict
+        with the fitted parameters "popt" (as in `gaussian_ND`) and their
+        covariance "pcov"
+        roi: float | None, defaulted to None. Fit a region of interest only
+        (see grid_sweep_optimize_ND); only the region is then read from
+        the file
+        
+        Returns the fitted center of each mirror as a dict, or None if the
+        fit fails.
+    """
+    if not isinstance(store, SweepStore):
+        store = SweepStore(store, read_only=True)
+    
+    if not store.initialized or not store.finished:
+        m = "store does not hold a finished sweep"
+        raise ValueError(m)
+    
+    meshgrid_arg = store.meshgrid_arg
+    moments = _MomentAccumulator([(values[0] + values[-1])/2 for values in meshgrid_arg])
+    for indices in sweep_order_chunks(store.shape, "raster", SWEEP_CHUNK_SIZE):
+        positions = np.column_stack([meshgrid_arg[index][indices[:,index]] for index in range(len(meshgrid_arg))])
+        moments.add(positions, store.response[np.ravel_multi_index(tuple(indices.T), store.shape)])
+    
+    popt, pcov, fit_points = _fit_gaussian_ND_roi(meshgrid_arg, store.response, moments.guess(), roi)
+    if popt is None:
+        print("Fit failed")
+        return None
+    
+    centers = {mirror: popt[index*2+1] for index, mirror in enumerate(store.mirror_names)}
+    
+    if full_output:
+        return centers, {"popt": popt, "pcov": pcov, "fit_points": fit_points}
+    
+    return centers
+
+
+def _fit_gaussian_ND_roi(meshgrid_arg, response, p0, roi, sample_counts=None):
+    # gaussian_ND fit within the region of interest; see fit_roi
+    return fit_roi(meshgrid_arg, response, p0, roi, _fit_gaussian_ND, sample_counts=sample_counts)
+
+
+def fit_roi(meshgrid_arg: list[np.ndarray], response: np.ndarray, p0: list[float], roi: float | None, fit, width_scale: float = np.sqrt(2), sample_counts: np.ndarray | None = None):
+    """
+        Fit a Gaussian to the points of a grid sweep within +/- roi standard
+        deviations of the peak, falling back to the whole grid if that fit
+        fails or its center is outside of the region. Returns (popt, pcov,
+        number of points fitted), with popt and pcov None if the fit fails.
+        
+        The center and standard deviation along each axis are the moments of
+        the response summed over the other axes, less its median. Points in
+        the region are weighted by their Poisson errors: the response of a
+        point is the mean of k samples, so its standard deviation is
+        sqrt(mean/k), with the mean floored at 1 so that zero counts keep a
+        finite weight.
+        
+        Arguments:
+        meshgrid_arg: list of the grid values along each axis
+        response: ndarray, response in the raveled order of the grid
+        p0: list[float], initial guess of the fit on the whole grid
+        roi: float | None. If None, the whole grid is fitted
+        fit: function called as fit(axes, response, p0, sigma=None),
+        fitting the model on the grid of axes and returning (popt, pcov),
+        or (None, None) if it fails. The parameters are the amplitude, then
+        the center and width along each axis, as for gaussian_ND
+        
+        Optional arguments:
+        width_scale: float, defaulted to sqrt(2). Width parameter of the
+        model for a standard deviation of 1 (sqrt(2) for gaussian_ND, 1 for
+        gaussian_1d and gaussian_2d)
+        sample_counts: ndarray | None, defaulted to None. Number of samples
+        of each point, in the order of response (if None, one each)
+    """
+    if roi is not None:
+        shape = tuple(len(values) for values in meshgrid_arg)
+        response_grid = np.asarray(response).reshape(shape)
+        centers, deviations = _profile_moments(meshgrid_arg, response_grid)
+        slices = _roi_slices(meshgrid_arg, centers, deviations, roi)
+        roi_arg = [values[index] for values, index in zip(meshgrid_arg, slices)]
+        roi_response = response_grid[slices].ravel()
+        roi_counts = np.asarray(sample_counts).reshape(shape)[slices].ravel() if sample_counts is not None else 1
+        
+        roi_p0 = [np.max(roi_response)]
+        for index in range(len(shape)):
+            roi_p0 += [centers[index], deviations[index]*width_scale] if np.isfinite(centers[index]) else list(p0[index*2+1:index*2+3])
+        
+        popt, pcov = fit(roi_arg, roi_response, roi_p0, sigma=np.sqrt(np.maximum(roi_response, 1)/roi_counts))
+        if popt is not None and all(values[0] <= popt[index*2+1] <= values[-1] for index, values in enumerate(roi_arg)):
+            print("\33[0;49;33mFitted region of interest:\33[0;49;38m "+str(len(roi_response))+" of "+str(response_grid.size)+" points")
+            return popt, pcov, len(roi_response)
+        print("Region of interest fit failed; fitting the whole grid")
+    
+    popt, pcov = fit(meshgrid_arg, response, p0)
+    return popt, pcov, len(response)
+
+
+def _profile_moments(meshgrid_arg, response_grid):
+    # center and standard deviation along each axis, from the moments of
+    # the response summed over the other axes, less its median. Unlike the
+    # moments of the whole grid, these are barely affected by background,
+    # which is spread over every point of the grid. NaN where no signal
+    # stands out.
+    centers, deviations = [], []
+    for index, values in enumerate(meshgrid_arg):
+        profile = np.sum(response_grid, axis=tuple(axis for axis in range(response_grid.ndim) if axis != index))
+        profile = np.maximum(profile - np.median(profile), 0)
+        weight = np.sum(profile)
+        if not weight > 0:
+            centers.append(np.nan)
+            deviations.append(np.nan)
+            continue
+        
+        center = profile@values/weight
+        centers.append(center)
+        deviations.append(np.sqrt(profile@(values - center)**2/weight))
+    
+    return centers, deviations
+
+
+def _roi_slices(meshgrid_arg, centers, deviations, roi, min_points=7):
+    # per-axis slices of the points within +/- roi deviations of the
+    # centers, widened to at least min_points so that the widths are still
+    # resolved; whole axes where the guesses are not finite
+    slices = []
+    for values, center, deviation in zip(meshgrid_arg, centers, deviations):
+        values = np.asarray(values)
+        if not (np.isfinite(center) and np.isfinite(deviation)):
+            slices.append(slice(None))
+            continue
+        
+        low = int(np.searchsorted(values, center - roi*deviation, side="left"))
+        high = int(np.searchsorted(values, center + roi*deviation, side="right"))
+        if high - low < min_points:
+            low = max(min((low + high)//2 - min_points//2, len(values) - min_points), 0)
+            high = min(low + min_points, len(values))
+        slices.append(slice(low, high))
+    
+    return tuple(slices)
+
+
+def _fit_gaussian_ND(meshgrid_arg, response, p0, sigma=None):
+    # returns (None, None) if the fit fails or obtains NaN values
+    # scipy.optimize is imported here, as it is slow to import
+    from scipy.optimize import curve_fit
+    
+    grid = SeparableGrid(meshgrid_arg)
+    
+    model = GaussianNDModel(grid)
+    
+    try:
+        with instrumentation.timer("fit"):
+            popt, pcov = curve_fit(model,grid,response,p0,sigma=sigma,jac=model.jacobian)
+    except:
+        return None, None
+    
+
+    if any(np.isnan(popt)):
+        return None, None
+    
+    return popt, pcov
+
+
+def _center_precision(pcov):
+    # one-sigma fit uncertainty of each center
+    return list(np.sqrt(np.abs(np.diag(pcov)[1::2])))
+
+
 
 def gaussian_ND(*args):
     """
@@ -89,11 +617,173 @@ def gaussian_ND(*args):
         w2 = args[5]
         ...
         A.np.exp(-(r[0]-r1)**2/w1**2-(r[1]-r2)**2/w2**2...)
+        
+        r may be a list of arrays of the same shape (e.g. from np.meshgrid),
+        or a SeparableGrid
     """
     r = args[0]
     dim = len(r)
-    arg = np.array([(r[index]-args[index*2+2])/args[index*2+3] for index in range(dim)])
-    G= args[1]*np.exp(-np.sum(arg**2,0))
+    exponent = 0
+    for index in range(dim):
+        exponent = exponent + ((r[index]-args[index*2+2])/args[index*2+3])**2
+    G= args[1]*np.exp(-exponent)
 
     return np.ravel(G)
-    
\ No newline at end of file
+
+
+class SeparableGrid():
+    
+    """
+        Rectangular N-dimensional grid stored as its N 1D axes, in place of
+        the N dense arrays of np.meshgrid(*axes, indexing="ij"). Coordinates
+        take O(sum of n_i) memory instead of O(N*prod(n_i)).
+        
+        grid[i] is axis i reshaped to broadcast along the other axes (as
+        np.meshgrid(..., sparse=True)), so that expressions written for
+        meshgrid arrays, e.g. `gaussian_ND`, broadcast to the full grid.
+        Points are ordered as the raveled meshgrid.
+        
+        It is not a list or an array, so curve_fit passes it to the model
+        unchanged.
+    """
+    def __init__(self, axes):
+        self.axes = [np.ravel(np.asarray(values, dtype=float)) for values in axes]
+        self.shape = tuple(len(values) for values in self.axes)
+        self.size = int(np.prod(self.shape))
+        
+    def __len__(self):
+        return len(self.axes)
+    
+    def __getitem__(self, index):
+        return self.axes[index].reshape(self._broadcast_shape(index))
+    
+    def _broadcast_shape(self, index):
+        broadcast_shape = [1]*len(self.axes)
+        broadcast_shape[index] = self.shape[index]
+        return broadcast_shape
+    
+    def dense(self):
+        """
+            The equivalent np.meshgrid arrays (allocates the full grid)
+        """
+        return np.meshgrid(*self.axes, indexing="ij")
+
+
+class GaussianNDModel():
+    
+    """
+        Same model as `gaussian_ND`, with an analytic Jacobian, for fitting
+        on a fixed grid with `curve_fit`. All intermediate results are kept in
+        buffers allocated once for the grid, so that repeated evaluations
+        during a fit do not allocate. To use:
+            
+            model = GaussianNDModel(r)
+            curve_fit(model, r, response, p0, jac=model.jacobian)
+        
+        r: a SeparableGrid, or a list of N arrays of the same shape, e.g. from
+        np.meshgrid
+        
+        On a SeparableGrid, the model is evaluated as the outer product of
+        N 1D Gaussian factors, so per-axis work is O(n_i) and only the model
+        values and Jacobian are of the size of the grid.
+        
+        The arrays returned by the model and its `jacobian` are overwritten
+        by the next evaluation; copy them if they are needed afterwards.
+    """
+    def __init__(self, r):
+        if isinstance(r, SeparableGrid):
+            self._grid = r
+            self._r = r.axes
+            size = r.size
+        else:
+            self._grid = None
+            self._r = [np.ravel(x) for x in r]
+            size = len(self._r[0])
+        dim = len(self._r)
+        
+        self._params = None
+        # differences (r-r_i)/w_i, per axis on a SeparableGrid
+        self._difference = [np.empty(len(x)) for x in self._r]
+        self._scratch = np.empty(size)
+        self._exponential = np.empty(size)
+        self._G = np.empty(size)
+        # column-major, so that each parameter's derivative is contiguous
+        self._jacobian = np.empty((size, 2*dim+1), order="F")
+        
+    def __call__(self, r, *params):
+        """
+            Evaluate the model; r is ignored in favor of the grid supplied
+            at instantiation
+        """
+        self._evaluate(params)
+        return self._G
+    
+    def jacobian(self, r, *params):
+        """
+            Derivatives of the model with respect to (A, r1, w1, r2, w2, ...),
+            of shape (number of grid points, 2N+1)
+        """
+        self._evaluate(params)
+        
+        jacobian = self._jacobian
+        jacobian[:,0] = self._exponential
+        for index in range(len(self._r)):
+            width = params[index*2+2]
+            # d/dr_i = 2 G (r-r_i)/w_i**2, d/dw_i = 2 G (r-r_i)**2/w_i**3,
+            # with the buffered difference = (r-r_i)/w_i
+            if self._grid is None:
+                difference = self._difference[index]
+                G = self._G
+                center_column = jacobian[:,index*2+1]
+                width_column = jacobian[:,index*2+2]
+            else:
+                shape = self._grid.shape
+                difference = self._difference[index].reshape(self._grid._broadcast_shape(index))
+                G = self._G.reshape(shape)
+                center_column = jacobian[:,index*2+1].reshape(shape)
+                width_column = jacobian[:,index*2+2].reshape(shape)
+            
+            np.multiply(difference, G, out=center_column)
+            center_column *= 2/width
+            np.multiply(center_column, difference, out=width_column)
+        
+        return jacobian
+    
+    def _evaluate(self, params):
+        # curve_fit evaluates the model and the jacobian at the same point,
+        # so the last evaluation is reused
+        params = tuple(float(value) for value in params)
+        if params == self._params:
+            return
+        
+        for index in range(len(self._r)):
+            difference = self._difference[index]
+            np.subtract(self._r[index], params[index*2+1], out=difference)
+            difference /= params[index*2+2]
+        
+        if self._grid is None:
+            self._exponential.fill(0)
+            for difference in self._difference:
+                np.multiply(difference, difference, out=self._scratch)
+                self._exponential -= self._scratch
+            np.exp(self._exponential, out=self._exponential)
+        else:
+            self._outer_product([np.exp(-difference**2) for difference in self._difference])
+        
+        np.multiply(self._exponential, params[0], out=self._G)
+        self._params = params
+    
+    def _outer_product(self, factors):
+        # raveled outer product of the 1D factors into self._exponential,
+        # built up one axis at a time, alternating between two buffers so
+        # that the last product lands in self._exponential
+        buffers = [self._exponential, self._scratch]
+        current = (len(factors) - 1) % 2
+        buffers[current][:len(factors[0])] = factors[0]
+        size = len(factors[0])
+        
+        for factor in factors[1:]:
+            out = buffers[1-current][:size*len(factor)].reshape(size, len(factor))
+            np.multiply(buffers[current][:size,None], factor[None,:], out=out)
+            current = 1 - current
+            size *= len(factor)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Instrumentation of the calibration hot paths. The module-level
+`instrumentation` instance times every mirror move (`Mirror`), every ion
+response measurement (`LaserCalibrationSystem`) and every Gaussian fit of the
+calibration routines, per phase:
+
+    "mirror_move": Mirror.move_mirror_to_position
+    "measurement": LaserCalibrationSystem.measure_ion_response
+    "batch_measurement": LaserCalibrationSystem.measure_batch
+    "readout": readout function, when pipelined by measure_batch
+    "fit": curve_fit in the calibration routines
+
+It is disabled by default, in which case the cost is a single attribute check
+per call. To use:
+
+    from laser_calibration.instrumentation import instrumentation
+    instrumentation.enabled = True
+    grid_sweep_optimize(syst)   # prints a per-phase summary at the end
+    instrumentation.data()      # raw counters and histograms
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+import numpy as np
+
+
+class Instrumentation():
+
+    """
+        This provides a class for collecting timings per phase. For each
+        phase, it keeps the number of calls, the number of items (e.g.
+        points measured in a batch), total, minimum and maximum duration, and
+        a histogram of durations in logarithmic bins (4 per decade, from 1 us
+        to 100 s).
+
+        `enabled` turns collection on and off. Callbacks registered with
+        `add_callback` are called as callback(phase, duration, items) on
+        every recorded event, e.g. to forward them to monitoring.
+
+        Data accumulates until `reset` is called.
+    """
+    HISTOGRAM_EDGES = tuple(10**np.arange(-6, 2.01, 0.25))
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._phases = {}
+
+    def record(self, phase: str, duration: float, items: int = 1):
+        """
+            Record an event of a phase that took `duration` seconds
+        """
+        with self._lock:
+            statistics = self._phases.get(phase)
+            if statistics is None:
+                statistics = {"calls": 0, "items": 0, "total": 0., "min": np.inf, "max": 0., "histogram": [0]*(len(self.HISTOGRAM_EDGES) + 1)}
+                self._phases[phase] = statistics
+
+            statistics["calls"] += 1
+            statistics["items"] += items
+            statistics["total"] += duration
+            statistics["min"] = min(statistics["min"], duration)
+            statistics["max"] = max(statistics["max"], duration)
+            statistics["histogram"][bisect.bisect(self.HISTOGRAM_EDGES, duration)] += 1
+
+        for callback in self._callbacks:
+            callback(phase, duration, items)
+
+    @contextlib.contextmanager
+    def timer(self, phase: str, items: int = 1):
+        """
+            Context manager recording the time spent in its body as an event
+            of phase (nothing is recorded if disabled)
+        """
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start_time, items)
+
+    def add_callback(self, callback):
+        """
+            Register callback(phase, duration, items), called on every event
+        """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def reset(self):
+        """
+            Discard all collected data
+        """
+        with self._lock:
+            self._phases = {}
+
+    @contextlib.contextmanager
+    def isolated(self):
+        """
+            Context manager collecting into fresh data, enabled and without
+            callbacks, e.g. to time a benchmark run; the data, callbacks and
+            `enabled` of before are restored on exit
+        """
+        with self._lock:
+            saved = (self.enabled, self._phases, self._callbacks)
+            self._phases = {}
+            self._callbacks = []
+            self.enabled = True
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.enabled, self._phases, self._callbacks = saved
+
+    def data(self):
+        """
+            Collected data, as a dict of phase: dict with "calls", "items",
+            "total", "min", "max" (in seconds), and "histogram", a dict with
+            the bin "edges" and the "counts" of durations below the first
+            edge, between consecutive edges, and above the last edge
+        """
+        with self._lock:
+            data = {}
+            for phase, statistics in self._phases.items():
+                data[phase] = dict(statistics)
+                data[phase]["histogram"] = {"edges": list(self.HISTOGRAM_EDGES), "counts": list(statistics["histogram"])}
+            return data
+
+    def summary(self):
+        """
+            Per-phase summary of the collected data, as a string
+        """
+        data = self.data()
+        total = sum(statistics["total"] for statistics in data.values())
+
+        lines = [f"{'phase':<18} {'calls':>8} {'items':>9} {'total (s)':>10} {'share':>6} {'mean (ms)':>10} {'max (ms)':>9}"]
+        for phase, statistics in sorted(data.items(), key = lambda item: -item[1]["total"]):
+            share = statistics["total"]/total if total > 0 else 0
+            mean = statistics["total"]/statistics["calls"]
+            lines.append(f"{phase:<18} {statistics['calls']:>8} {statistics['items']:>9} {statistics['total']:>10.4f} {share:>6.1%} {mean*1e3:>10.4f} {statistics['max']*1e3:>9.4f}")
+
+        return "\n".join(lines)
+
+    def print_summary(self):
+        print("\33[0;49;33mTime per phase:\33[0;49;38m")
+        print(self.summary())
+
+
+instrumentation = Instrumentation()
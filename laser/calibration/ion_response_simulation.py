@@ -4,8 +4,11 @@
 @author: markjhku
 """
 
-from scipy.stats import poisson
 import numpy as np
+import time
+from laser_calibration.psf_models import GaussianPSF
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.mirror import Mirror
 
 
 class IonResponseSimulation():
@@ -20,17 +23,63 @@ class IonResponseSimulation():
         To obtain a measurement, one uses `measure_ion_response` function which
         is an N-dimensional function
         
+        To obtain measurements at many points at once, one uses `measure_batch`,
+        which requires `photon_distribution` to accept numpy arrays
+        
         Options:        
         use_poisson_distribution: whether to generate photon number based on poisson distribution
         measurement_noise: instrument noise to the measurement
+        seed: int | None. Seed of the instance's numpy.random.Generator (if
+        None, it is drawn from the global numpy random state, so that
+        np.random.seed still makes simulations reproducible)
+        rng: numpy.random.Generator to draw from instead, e.g. one shared
+        with other simulations
+        block_size: int, defaulted to 1024. Number of noise values drawn at
+        a time for single-point measurements
+        
+        Photon numbers and noise are drawn from the instance's generator
+        `rng`. `reseed` restarts it, so that the same calls replay the same
+        measurements.
     """
         
     
-    def __init__(self, photon_distribution, use_poisson_distribution: bool = True, measurement_noise: bool = 0):
+    def __init__(self, photon_distribution, use_poisson_distribution: bool = True, measurement_noise: bool = 0, seed: int | None = None, rng: np.random.Generator | None = None, block_size: int = 1024):
         self._photon_distribution = photon_distribution
         self._use_poisson_distribution = use_poisson_distribution
         self._measurement_noise = measurement_noise
+        self._block_size = block_size
+        
+        if rng is None and seed is None:
+            seed = int(np.random.randint(2**63 - 1, dtype=np.int64))
+        self.seed = seed
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        self._noise = np.zeros(0, dtype=int)
+        self._noise_index = 0
 
+    def reseed(self, seed: int | None = None):
+        """
+            Restart the generator from seed (if None, the seed it was created
+            with), discarding prefetched noise
+        """
+        if seed is None:
+            seed = self.seed
+        if seed is None:
+            m = "simulation was created with a generator, not a seed"
+            raise ValueError(m)
+        
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self._noise = np.zeros(0, dtype=int)
+        self._noise_index = 0
+
+    def _next_noise(self):
+        # single-point noise, from a block drawn in one call
+        if self._noise_index == len(self._noise):
+            self._noise = (self._measurement_noise*self.rng.standard_normal(self._block_size)).astype(int)
+            self._noise_index = 0
+        
+        self._noise_index += 1
+        return int(self._noise[self._noise_index - 1])
 
 
     def measure_ion_response(self,*args):
@@ -44,18 +93,43 @@ class IonResponseSimulation():
         photon_number = self._photon_distribution(*args)
         
         if self._use_poisson_distribution:
-            photon_number = poisson.rvs(photon_number,size=1)[0]
-
-        noise = int(np.random.normal(loc = 0, scale = self._measurement_noise))
+            photon_number = self.rng.poisson(photon_number)
         
-        return photon_number + noise
+        if not self._measurement_noise:
+            return photon_number
+        
+        return photon_number + self._next_noise()
     
+    def measure_batch(self, positions: np.ndarray):
+        """
+            This generates ion response at many locations at once, drawing all
+            photon numbers and noise in a single vectorized call.
+            
+            positions: ndarray of shape (number of points, N), where row i is
+            the location x=positions[i,0], y=positions[i,1],...
+        """
+        positions = np.asarray(positions, dtype=float)
+        number_of_points = len(positions)
+        
+        photon_number = np.broadcast_to(self._photon_distribution(*positions.T), (number_of_points,))
+        
+        if self._use_poisson_distribution:
+            photon_number = self.rng.poisson(photon_number)
+        
+        if not self._measurement_noise:
+            return photon_number
+        
+        noise = (self._measurement_noise*self.rng.standard_normal(number_of_points)).astype(int)
+        
+        return photon_number + noise
+
 
 class GaussianIonResponseSimulation(IonResponseSimulation):
     """
         This provides a class for generating photon response with Gaussian 
         distribution. To instantiate, provide the parameters associated
-        with a 2D Gaussian distribution
+        with a 2D Gaussian distribution (see psf_models for rotated Gaussians,
+        Airy patterns and background)
         
         photon_number: float
         x_center: float
@@ -66,9 +140,108 @@ class GaussianIonResponseSimulation(IonResponseSimulation):
         Options:        
         use_poisson_distribution: whether to generate photon number based on poisson distribution
         measurement_noise: instrument noise to the measurement
+        seed, rng, block_size: see IonResponseSimulation
+
+        
+    """
+    def __init__(self, photon_number: float, x_center: float, y_center: float, x_width: float, y_width: float, use_poisson_distribution: bool = True, measurement_noise: bool = 0, seed: int | None = None, rng: np.random.Generator | None = None, block_size: int = 1024):
+        photon_distribution = GaussianPSF.from_widths(photon_number, [x_center, y_center], [x_width, y_width])
+        super().__init__(photon_distribution = photon_distribution, use_poisson_distribution = use_poisson_distribution, measurement_noise = measurement_noise, seed = seed, rng = rng, block_size = block_size)
+
+
+class DriftingGaussianIonResponseSimulation(IonResponseSimulation):
+    """
+        This provides a class for generating photon response with an
+        N-dimensional Gaussian distribution whose center drifts over time at
+        a constant velocity, e.g. to test drift tracking
+        
+        photon_number: float
+        center: list[float], center at time 0
+        width: float | list[float], width along each axis
+        velocity: list[float], drift of the center per second along each axis
+        
+        The `center` property gives the center at the current time.
+        
+        Options:        
+        use_poisson_distribution: whether to generate photon number based on poisson distribution
+        measurement_noise: instrument noise to the measurement
+        clock: function returning the time in seconds, defaulted to
+        time.monotonic; time 0 is at instantiation
+        seed, rng, block_size: see IonResponseSimulation
+    """
+    def __init__(self, photon_number: float, center: list[float], width: float | list[float], velocity: list[float], use_poisson_distribution: bool = True, measurement_noise: bool = 0, clock = time.monotonic, seed: int | None = None, rng: np.random.Generator | None = None, block_size: int = 1024):
+        self._initial_center = np.asarray(center, dtype=float)
+        self._width = np.broadcast_to(np.asarray(width, dtype=float), self._initial_center.shape)
+        self._velocity = np.asarray(velocity, dtype=float)
+        self._clock = clock
+        self._start_time = clock()
+        
+        def photon_distribution(*r):
+            center = self.center
+            return photon_number*np.exp(-sum(((r[index]-center[index])/self._width[index])**2 for index in range(len(center))))
+        
+        super().__init__(photon_distribution = photon_distribution, use_poisson_distribution = use_poisson_distribution, measurement_noise = measurement_noise, seed = seed, rng = rng, block_size = block_size)
+        
+    @property
+    def center(self):
+        return self._initial_center + self._velocity*(self._clock() - self._start_time)
+
 
+def simulated_calibration_system(centers: list[float], width: float | list[float], photon_number: float, measurement_noise: float = 0, rng: np.random.Generator | None = None):
+    """
+        LaserCalibrationSystem in simulation mode, with mirrors "x1", "x2",
+        ... on a Gaussian ion response, counting the measurements and mirror
+        moves of the routines run on it, e.g. to benchmark them. Returns
+        (system, mirror names, counts), where counts is a dict with
+        "measurements" and "mirror_moves", updated as the system is used.
         
+        A mirror move is counted when it changes the position last commanded
+        to the mirror, whether the points are measured one at a time or in a
+        batch, so that counts compare between routines.
+        
+        Arguments:
+        centers: list[float], center of the ion response along each axis
+        width: float | list[float], width along each axis (or one for all)
+        photon_number: float, peak average photon number
+        
+        Optional arguments:
+        measurement_noise: float, defaulted to 0. Instrument noise
+        rng: numpy.random.Generator to draw the photon counts from (see
+        IonResponseSimulation)
     """
-    def __init__(self, photon_number: float, x_center: float, y_center: float, x_width: float, y_width: float, use_poisson_distribution: bool = True, measurement_noise: bool = 0):
-        photon_distribution = lambda x,y: photon_number*np.exp(-(x-x_center)**2/x_width**2-(y-y_center)**2/y_width**2)
-        super().__init__(photon_distribution = photon_distribution, use_poisson_distribution = use_poisson_distribution, measurement_noise = measurement_noise)
\ No newline at end of file
+    dimension = len(centers)
+    width = np.broadcast_to(np.asarray(width, dtype=float), (dimension,))
+    counts = {"measurements": 0, "mirror_moves": 0}
+
+    photon_distribution = lambda *r: photon_number*np.exp(-sum(((r[index] - centers[index])/width[index])**2 for index in range(dimension)))
+    sim = IonResponseSimulation(photon_distribution, measurement_noise = measurement_noise, rng = rng)
+
+    # last commanded position of each mirror
+    commanded = np.zeros(dimension)
+
+    def ion_response_function(*args):
+        counts["measurements"] += 1
+        return sim.measure_ion_response(*args)
+
+    def batch_ion_response_function(positions):
+        counts["measurements"] += len(positions)
+        if len(positions):
+            counts["mirror_moves"] += int(np.count_nonzero(np.diff(positions, axis = 0, prepend = commanded[np.newaxis])))
+            commanded[:] = positions[-1]
+        return sim.measure_batch(positions)
+
+    def move_mirror_function(index):
+        def move(position):
+            if position != commanded[index]:
+                counts["mirror_moves"] += 1
+                commanded[index] = position
+        return move
+
+    syst = LaserCalibrationSystem(ion_response_function, batch_ion_response_function = batch_ion_response_function)
+    mirror_names = ["x" + str(index + 1) for index in range(dimension)]
+    for index, mirror_name in enumerate(mirror_names):
+        syst.add_mirror(mirror_name, Mirror(move_mirror_function(index)))
+    syst.simulation = True
+    syst.simulation_mirror_set = mirror_names
+
+    return syst, mirror_names, counts
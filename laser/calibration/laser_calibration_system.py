@@ -3,9 +3,27 @@
 """
 @author: markjhku
 """
+import numpy as np
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from laser_calibration.instrumentation import instrumentation
+from laser_calibration.adaptive_sampling import poisson_decision
 from laser_calibration.mirror import Mirror
 
 
+class MirrorMoveError(Exception):
+    
+    """
+        Raised by a concurrent (or coalesced, see `mirror_transport`)
+        `batch_move_mirrors` when one or more mirrors fail to move. `errors` maps each failed mirror name to its exception;
+        all other mirrors have finished moving when this is raised.
+    """
+    def __init__(self, errors: dict):
+        self.errors = errors
+        m = "failed to move mirrors: " + ", ".join(name + " (" + repr(error) + ")" for name, error in errors.items())
+        super().__init__(m)
+
+
 class LaserCalibrationSystem():
     
     """
@@ -28,15 +46,77 @@ class LaserCalibrationSystem():
         The `move_mirrors_and_measure` method move mirrors to specified 
         positions and perform measurement
         
+        Mirrors are also indexed by the order in which they were added (the
+        order of `get_all_mirror_names`). The `move_and_measure_vector`
+        method takes the positions as an array in that order (or in the
+        order of `mirror_indices(mirror_names)`), and is what the sweep
+        routines call at every point; `move_mirrors_and_measure` and
+        `batch_move_mirrors` are wrappers around it. The `positions`
+        property returns the positions of all mirrors as an array
+        
+        The `measure_batch` method measures ion response over a whole array of
+        mirror positions at once. If the ion response backend provides a
+        vectorized `measure_batch` (e.g. `IonResponseSimulation`), it is used
+        in simulation mode; otherwise points are measured one at a time
+        
+        If `concurrent_moves` is True, `batch_move_mirrors` (and hence
+        `move_mirrors_and_measure`) moves the mirrors in parallel threads and
+        waits for all of them to finish before returning
+        
+        Moves of several mirrors on the same controller (see
+        `mirror_transport.TransportMirror`) are coalesced into one request
+        per controller, whatever `concurrent_moves` is; the other mirrors
+        move while the requests are in flight, in parallel if
+        `concurrent_moves` is True
+        
+        If a MeasurementLedger is supplied as `ledger`, repeated measurements
+        at the same mirror positions are answered from stored statistics
+        
+        The `measure_adaptive` and `measure_batch_adaptive` methods sample
+        points repeatedly, only until the Poisson confidence interval of
+        the photon number clears a decision threshold
+        
+        If a `readout_function` is supplied, a measurement is split into
+        the acquisition, `ion_response_function`, which needs the mirrors to
+        stay put and returns the raw data (e.g. a camera frame or counter
+        buffer), and the readout, `readout_function(raw data)`, which turns
+        it into the photon number and can run while the mirrors move on.
+        `measure_batch` (and hence the grid sweeps) then pipelines the
+        points: the readout of a point runs in a separate thread while the
+        mirrors move to the next points, with up to `readout_buffers`
+        acquisitions waiting to be read out. Set `overlap_readout` to False
+        for hardware that cannot move mirrors during a readout
+        
         To use simulation mode, see, for examples such as
         `simulation_laser_calibration_system_1d.py`
     """
-    def __init__(self, ion_response_function):
+    def __init__(self, ion_response_function, batch_ion_response_function = None, concurrent_moves: bool = False, ledger = None, readout_function = None, overlap_readout: bool = True, readout_buffers: int = 2):
+
+       if readout_buffers < 1:
+           m = "readout_buffers must be at least 1"
+           raise ValueError(m)
 
        self._ion_response_function = ion_response_function
+       self._batch_ion_response_function = batch_ion_response_function
        self._simulation = False
        self._mirror_set = {}
+       # mirrors by index, in the order they were added
+       self._mirrors = []
+       self._mirror_index = {}
+       # (controller, axis) of mirrors that are moved through a transport
+       # such as TransportMirror, else None
+       self._transports = []
+       self._coalesce_moves = False
        self._simulation_mirror_set = []
+       self._simulation_indices = []
+       self._concurrent_moves = concurrent_moves
+       self._executor = None
+       self._executor_workers = 0
+       self._ledger = ledger
+       self._readout_function = readout_function
+       self._overlap_readout = overlap_readout
+       self._readout_buffers = readout_buffers
+       self._readout_executor = None
 
     
     def add_mirror(self, mirror_name: str, mirror_object):
@@ -60,6 +140,12 @@ class LaserCalibrationSystem():
             mirror_object = Mirror(mirror_object)
         
         self._mirror_set[mirror_name] = mirror_object
+        self._mirror_index[mirror_name] = len(self._mirrors)
+        self._mirrors.append(mirror_object)
+        
+        controller = getattr(mirror_object, "controller", None)
+        self._transports.append((controller, mirror_object.axis) if controller is not None else None)
+        self._coalesce_moves = self._coalesce_moves or controller is not None
 
     def get_all_mirror_names(self):
         """
@@ -69,6 +155,19 @@ class LaserCalibrationSystem():
         
         return list(self._mirror_set.keys())
 
+    def get_mirror(self, mirror_name: str):
+        """
+            Get the Mirror instance of a single mirror
+            
+            mirror_name: str, name of mirror to be returned
+
+        """
+        if mirror_name not in self._mirror_set:
+            m = "mirror_name is not in the mirror set"
+            raise ValueError(m)
+        
+        return self._mirror_set[mirror_name]
+
     def get_mirror_position(self, mirror_name: str):
         """
             Get position of a single mirror
@@ -82,6 +181,29 @@ class LaserCalibrationSystem():
         
         return self._mirror_set[mirror_name].position
     
+    def mirror_indices(self, mirror_names: list[str]):
+        """
+            Get the indices of mirrors in the vector of all mirror positions,
+            e.g. for `move_and_measure_vector`
+            
+            mirror_names: list[str], names of the mirrors
+        """
+        return np.array(self._indices(mirror_names), dtype=np.intp)
+    
+    def _indices(self, mirror_names):
+        try:
+            return [self._mirror_index[mirror_name] for mirror_name in mirror_names]
+        except KeyError:
+            m = "mirror_name is not in the mirror set"
+            raise ValueError(m) from None
+    
+    @property
+    def positions(self):
+        """
+            Positions of all mirrors, in the order of `get_all_mirror_names`
+        """
+        return np.array([mirror.position for mirror in self._mirrors], dtype=float)
+    
     def move_mirror(self, mirror_name: str, position: float):
         """
             Move a single mirror
@@ -100,8 +222,138 @@ class LaserCalibrationSystem():
             Batch move mirrors. Takes keyword arguments in the form of
             mirror_name = position.
             
+            If `concurrent_moves` is True, the mirrors are moved in parallel,
+            and the call returns once all of them have finished. Errors from
+            individual mirrors are collected and raised together as a
+            MirrorMoveError.
         """        
-        [self.move_mirror(mirror_name = key, position = value) for key, value in kwargs.items()]
+        self.move_mirrors_vector(list(kwargs.values()), self._indices(kwargs))
+    
+    def move_mirrors_vector(self, positions: np.ndarray, indices: np.ndarray | None = None):
+        """
+            Move mirrors to an array of positions. Unless `concurrent_moves`
+            is True, all positions are checked before any mirror moves.
+            
+            positions: ndarray of positions, one per mirror in indices
+            indices: ndarray | None, indices of the mirrors (see
+            `mirror_indices`). If None, positions holds all mirrors, in the
+            order of `get_all_mirror_names`
+        """
+        values = positions.tolist() if isinstance(positions, np.ndarray) else list(positions)
+        if indices is None:
+            indices = range(len(self._mirrors))
+        elif isinstance(indices, np.ndarray):
+            indices = indices.tolist()
+        
+        if len(values) != len(indices):
+            m = "positions must have one entry per mirror in indices"
+            raise ValueError(m)
+        
+        if self._concurrent_moves and not self._coalesce_moves and len(values) > 1:
+            # each mirror checks its own position, so that its error is
+            # reported with those of the other mirrors
+            self._move_mirrors_concurrently(indices, values)
+            return
+        
+        if values and (max(values) > 1 or min(values) < -1):
+            m = "position must be between -1 and 1"
+            raise ValueError(m)
+        
+        if self._coalesce_moves and len(values) > 1:
+            self._move_mirrors_coalesced(indices, values)
+            return
+        
+        mirrors = self._mirrors
+        for index, value in zip(indices, values):
+            mirrors[index]._move(value)
+    
+    def _move_mirrors_coalesced(self, indices, values):
+        # the moves of mirrors on the same controller go out as one request;
+        # the requests to all controllers are in flight together, while the
+        # other mirrors move (in parallel, with concurrent_moves)
+        requests = {}
+        others = []
+        for index, value in zip(indices, values):
+            if self._transports[index] is None:
+                others.append((index, value))
+            else:
+                controller, axis = self._transports[index]
+                moves, request_indices = requests.setdefault(controller, ({}, []))
+                moves[axis] = value
+                request_indices.append((index, value))
+        
+        mirror_names = self.get_all_mirror_names()
+        errors = {}
+        futures = []
+        for controller, (moves, request_indices) in requests.items():
+            try:
+                futures.append((controller.submit(moves), controller, request_indices, time.perf_counter()))
+            except Exception as error:
+                # e.g. the controller cannot be reached
+                errors.update((mirror_names[index], error) for index, value in request_indices)
+        
+        if self._concurrent_moves and len(others) > 1:
+            errors.update(self._wait_for_moves(self._submit_moves(*zip(*others))))
+        else:
+            for index, value in others:
+                try:
+                    self._mirrors[index]._move(value)
+                except Exception as error:
+                    errors[mirror_names[index]] = error
+        
+        for future, controller, request_indices, start_time in futures:
+            try:
+                controller.wait(future)
+            except Exception as error:
+                errors.update((mirror_names[index], error) for index, value in request_indices)
+                continue
+            
+            # one event per mirror, as for mirrors moved one at a time
+            if instrumentation.enabled:
+                duration = time.perf_counter() - start_time
+                for _ in request_indices:
+                    instrumentation.record("mirror_move", duration)
+            for index, value in request_indices:
+                self._mirrors[index]._position = value
+        
+        if errors:
+            raise MirrorMoveError(errors)
+    
+    def _move_mirrors_concurrently(self, indices, values):
+        errors = self._wait_for_moves(self._submit_moves(indices, values))
+        if errors:
+            raise MirrorMoveError(errors)
+    
+    def _submit_moves(self, indices, values):
+        # moves of each mirror in a thread of the executor, as a dict of
+        # mirror name: future
+        if self._executor is None or self._executor_workers < len(values):
+            if self._executor is not None:
+                self._executor.shutdown(wait = False)
+            self._executor_workers = len(self._mirrors)
+            self._executor = ThreadPoolExecutor(max_workers = self._executor_workers, thread_name_prefix = "mirror")
+        
+        mirror_names = self.get_all_mirror_names()
+        return {mirror_names[index]: self._executor.submit(self._mirrors[index].move_mirror_to_position, value) for index, value in zip(indices, values)}
+    
+    def _wait_for_moves(self, futures):
+        # waits for all moves, and returns the errors as a dict of mirror
+        # name: exception
+        errors = {}
+        for key, future in futures.items():
+            try:
+                future.result()
+            except Exception as error:
+                errors[key] = error
+        return errors
+    
+    @property
+    def concurrent_moves(self):
+        return self._concurrent_moves
+    
+    @concurrent_moves.setter
+    def concurrent_moves(self, concurrent_moves: bool):
+        self._concurrent_moves = concurrent_moves
         
     @property
     def simulation(self):
@@ -128,6 +380,7 @@ class LaserCalibrationSystem():
             raise ValueError(m)
             
         self._simulation_mirror_set = mirror_set               
+        self._simulation_indices = self._indices(mirror_set)
         
     @property
     def ion_response_function(self):
@@ -136,14 +389,135 @@ class LaserCalibrationSystem():
     @ion_response_function.setter
     def ion_response_function(self, ion_response_function):
         self._ion_response_function = ion_response_function
+
+    @property
+    def readout_function(self):
+        """
+            Optional function turning the raw data returned by
+            `ion_response_function` into the photon number; see the class
+            description
+        """
+        return self._readout_function
+    
+    @readout_function.setter
+    def readout_function(self, readout_function):
+        self._readout_function = readout_function
+    
+    @property
+    def overlap_readout(self):
+        return self._overlap_readout
+    
+    @overlap_readout.setter
+    def overlap_readout(self, overlap_readout: bool):
+        self._overlap_readout = overlap_readout
+    
+    @property
+    def readout_buffers(self):
+        return self._readout_buffers
+    
+    @readout_buffers.setter
+    def readout_buffers(self, readout_buffers: int):
+        if readout_buffers < 1:
+            m = "readout_buffers must be at least 1"
+            raise ValueError(m)
+        
+        self._readout_buffers = readout_buffers
+
+    @property
+    def batch_ion_response_function(self):
+        """
+            Vectorized ion response function, taking an array of shape
+            (number of points, number of simulation mirrors) and returning an
+            array of photon numbers. If not set explicitly, the `measure_batch`
+            method of the object owning `ion_response_function` is used, if
+            any (e.g. `IonResponseSimulation.measure_batch`), unless there is
+            a `readout_function`
+        """
+        if self._batch_ion_response_function is not None:
+            return self._batch_ion_response_function
+        
+        if self._readout_function is not None:
+            # ion_response_function returns raw data, so its owner's
+            # measure_batch is not the batch version of it
+            return None
+        
+        owner = getattr(self._ion_response_function, "__self__", None)
+        return getattr(owner, "measure_batch", None)
+    
+    @batch_ion_response_function.setter
+    def batch_ion_response_function(self, batch_ion_response_function):
+        self._batch_ion_response_function = batch_ion_response_function
+
+    @property
+    def supports_batch_measurement(self):
+        return self.simulation and self.batch_ion_response_function is not None
+            
+    @property
+    def ledger(self):
+        """
+            Optional MeasurementLedger. If set, `measure_ion_response`
+            answers repeated measurements at the same mirror positions from
+            the ledger's stored statistics once it holds enough samples.
+            Batch measurements bypass the ledger.
+        """
+        return self._ledger
+    
+    @ledger.setter
+    def ledger(self, ledger):
+        self._ledger = ledger
             
     def measure_ion_response(self):
+        if self._ledger is None:
+            return self._measure_ion_response()
+        
+        # the ledger is keyed by the positions of all mirrors that affect
+        # the measurement
+        positions = self._measured_positions()
+        
+        response = self._ledger.lookup(positions)
+        if response is None:
+            response = self._measure_ion_response()
+            self._ledger.record(positions, response)
+            
+        return response
+    
+    def _measure_ion_response(self):
+        if instrumentation.enabled:
+            start_time = time.perf_counter()
+            response = self._measure_ion_response_uninstrumented()
+            instrumentation.record("measurement", time.perf_counter() - start_time)
+            return response
+        
+        return self._measure_ion_response_uninstrumented()
+    
+    def _measure_ion_response_uninstrumented(self):
+        if self._readout_function is not None:
+            return self._readout_function(self._acquire())
+        
+        return self._acquire()
+    
+    def _acquire(self):
         if self.simulation:
             
-            args = [self.get_mirror_position(mirror) for mirror in self.simulation_mirror_set]
-            return self._ion_response_function(*args)
+            mirrors = self._mirrors
+            return self._ion_response_function(*[mirrors[index]._position for index in self._simulation_indices])
         else:
             return self._ion_response_function()
+    
+    def _readout(self, raw):
+        if instrumentation.enabled:
+            start_time = time.perf_counter()
+            response = self._readout_function(raw)
+            instrumentation.record("readout", time.perf_counter() - start_time)
+            return response
+        
+        return self._readout_function(raw)
+    
+    def _measured_positions(self):
+        # positions of the mirrors that affect the measurement
+        if self.simulation:
+            return [self._mirrors[index]._position for index in self._simulation_indices]
+        return [mirror._position for mirror in self._mirrors]
 
 
     def move_mirrors_and_measure(self,**kwargs):
@@ -154,3 +528,188 @@ class LaserCalibrationSystem():
         """        
         self.batch_move_mirrors(**kwargs)
         return self.measure_ion_response()
+    
+    def move_and_measure_vector(self, positions: np.ndarray, indices: np.ndarray | None = None):
+        """
+            Move mirrors to an array of positions and perform measurement.
+            This is the fast path of `move_mirrors_and_measure`, as it skips
+            the keyword arguments and name lookups.
+            
+            positions: ndarray of positions, one per mirror in indices
+            indices: ndarray | None, indices of the mirrors (see
+            `mirror_indices`). If None, positions holds all mirrors, in the
+            order of `get_all_mirror_names`
+        """
+        self.move_mirrors_vector(positions, indices)
+        return self.measure_ion_response()
+
+    def measure_batch(self, positions: np.ndarray, mirror_names: list[str] | None = None):
+        """
+            Measure ion response at a whole array of mirror positions. 
+            
+            positions: ndarray of shape (number of points, number of mirrors);
+            a 1D array is interpreted as a single column if there is one mirror
+            mirror_names: list[str] | None, mirror corresponding to each column
+            of positions. If None, the simulation mirror set is assumed in
+            simulation mode, and all mirrors otherwise.
+            
+            Returns an ndarray of photon numbers, one per point. After the
+            call, the mirrors are left at the last point.
+        """
+        positions, mirror_names = self._batch_arguments(positions, mirror_names)
+            
+        if len(positions) == 0:
+            return np.array([])
+        
+        if not self.supports_batch_measurement:
+            indices = self.mirror_indices(mirror_names)
+            if self._readout_function is not None and self._overlap_readout and self._ledger is None:
+                return self._measure_pipelined(positions, indices)
+            return np.array([self.move_and_measure_vector(val, indices) for val in positions])
+        
+        if np.any(np.abs(positions) > 1):
+            m = "position must be between -1 and 1"
+            raise ValueError(m)
+        
+        # mirrors in the simulation mirror set that are not swept stay at
+        # their current position
+        columns = [positions[:, mirror_names.index(mirror)] if mirror in mirror_names 
+                   else np.full(len(positions), self.get_mirror_position(mirror)) 
+                   for mirror in self.simulation_mirror_set]
+        with instrumentation.timer("batch_measurement", len(positions)):
+            response = np.asarray(self.batch_ion_response_function(np.column_stack(columns)))
+        
+        self.move_mirrors_vector(positions[-1], self.mirror_indices(mirror_names))
+        
+        return response
+
+    def _measure_pipelined(self, positions, indices):
+        # point i is moved to and acquired while the readouts of earlier
+        # points run in a single thread, in order; each readout result is
+        # kept with the index of its point
+        if self._readout_executor is None:
+            self._readout_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "readout")
+        
+        futures = []
+        try:
+            for index, position in enumerate(positions):
+                self.move_mirrors_vector(position, indices)
+                # wait for a free buffer before acquiring
+                if index >= self._readout_buffers:
+                    futures[index - self._readout_buffers].result()
+                
+                if instrumentation.enabled:
+                    with instrumentation.timer("measurement"):
+                        raw = self._acquire()
+                else:
+                    raw = self._acquire()
+                futures.append(self._readout_executor.submit(self._readout, raw))
+            
+            return np.array([future.result() for future in futures])
+        except BaseException:
+            # no readout is left running after an error
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+
+    def measure_adaptive(self, threshold: float | None, max_samples: int, min_samples: int = 1, confidence: float = 0.95, stop_above: bool = True):
+        """
+            Measure ion response at the current mirror positions repeatedly,
+            until the Poisson confidence interval of the photon number per
+            sample is clear of threshold, or max_samples is reached.
+            
+            threshold: float | None, photon number per sample the decision
+            is about, e.g. the background level or the best photon number so
+            far. If None, max_samples are always taken
+            max_samples: int, maximum number of samples
+            min_samples: int, defaulted to 1. Minimum number of samples
+            confidence: float, defaulted to 0.95. Confidence level of the
+            interval
+            stop_above: bool, defaulted to True. Whether to also stop when
+            the interval is above threshold; if False, only points found to
+            be below threshold stop early
+            
+            Returns (mean photon number per sample, number of samples). With
+            a ledger, every sample is recorded, but none is answered from it.
+        """
+        if max_samples < 1:
+            m = "max_samples must be at least 1"
+            raise ValueError(m)
+        
+        total = 0
+        samples = 0
+        
+        while samples < max_samples:
+            response = self._measure_ion_response()
+            if self._ledger is not None:
+                self._ledger.record(self._measured_positions(), response)
+            total += response
+            samples += 1
+            
+            if samples >= min_samples:
+                decision = poisson_decision(total, samples, threshold, confidence)
+                if decision < 0 or (decision > 0 and stop_above):
+                    break
+        
+        return total/samples, samples
+    
+    def measure_batch_adaptive(self, positions: np.ndarray, threshold: float | None, max_samples: int, mirror_names: list[str] | None = None, min_samples: int = 1, confidence: float = 0.95, stop_above: bool = True):
+        """
+            Measure ion response at a whole array of mirror positions as in
+            `measure_batch`, sampling each point adaptively as in
+            `measure_adaptive`. With batch measurement support, all points
+            are measured once per round, and points whose decision is made
+            drop out of the next rounds; otherwise each point is sampled in
+            turn.
+            
+            Returns (ndarray of mean photon numbers per sample, ndarray of
+            numbers of samples), one per point.
+        """
+        if max_samples < 1:
+            m = "max_samples must be at least 1"
+            raise ValueError(m)
+        
+        positions, mirror_names = self._batch_arguments(positions, mirror_names)
+        
+        means = np.zeros(len(positions))
+        samples = np.zeros(len(positions), dtype=int)
+        
+        if not self.supports_batch_measurement:
+            indices = self.mirror_indices(mirror_names)
+            for index, position in enumerate(positions):
+                self.move_mirrors_vector(position, indices)
+                means[index], samples[index] = self.measure_adaptive(threshold, max_samples, min_samples, confidence, stop_above)
+            return means, samples
+        
+        totals = np.zeros(len(positions))
+        active = np.ones(len(positions), dtype=bool)
+        while np.any(active):
+            totals[active] += self.measure_batch(positions[active], mirror_names)
+            samples[active] += 1
+            
+            decision = poisson_decision(totals, np.maximum(samples, 1), threshold, confidence)
+            done = (decision < 0) | ((decision > 0) & stop_above)
+            active &= ~(done & (samples >= min_samples)) & (samples < max_samples)
+        
+        np.divide(totals, samples, out=means, where=samples > 0)
+        return means, samples
+    
+    def _batch_arguments(self, positions, mirror_names):
+        # positions as a 2D array with one column per mirror in mirror_names
+        if mirror_names is None:
+            mirror_names = self.simulation_mirror_set if self.simulation else self.get_all_mirror_names()
+        
+        if any(mirror not in self._mirror_set for mirror in mirror_names):
+            m = "mirror_names must be a subset of all mirrors"
+            raise ValueError(m)
+        
+        positions = np.asarray(positions, dtype=float)
+        if positions.ndim == 1:
+            positions = positions.reshape(-1, len(mirror_names))
+            
+        if positions.ndim != 2 or positions.shape[1] != len(mirror_names):
+            m = "positions must have one column per mirror in mirror_names"
+            raise ValueError(m)
+        
+        return positions, mirror_names
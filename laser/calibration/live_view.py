@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+import os
+import queue
+import threading
+import time
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from laser_calibration.grid_sweep_optimize_ND import gaussian_ND, _profile_moments
+
+
+class LiveView():
+
+    """
+        This provides a class for viewing a grid sweep while it runs,
+        without slowing it down. The sweep loop sends each chunk of
+        measurements through a queue; a separate thread collects them into
+        its own copy of the grid and renders it to image files with
+        matplotlib's Agg canvas (so no display or interactive backend is
+        needed, and pyplot is not used):
+
+            1 axis: the response along the axis
+            2 axes: a heatmap filled in as points come in
+            more axes: one panel per axis, with the response along the axis
+            through the brightest point measured so far
+
+        together with the running fit: the Gaussian of the moments of the
+        response so far, replaced by the fit when the sweep ends.
+
+        Frames are rendered at most `max_frame_rate` times per second:
+        updates that arrive in between are merged into the next frame, so
+        frames are dropped rather than the sweep waiting for the renderer.
+        Sending never blocks; if the queue is full (the renderer has fallen
+        far behind), the update is dropped and counted in
+        `updates_dropped`.
+
+        To use with grid_sweep_optimize_ND, run:
+
+            with LiveView("sweep.png") as live_view:
+                grid_sweep_optimize_ND(syst, live_view=live_view)
+
+        and open sweep.png in an image viewer that reloads it.
+
+        Optional arguments:
+        filename: str, defaulted to "live_view.png". Image file of the
+        frames, overwritten by each frame; if it contains "{}", it is
+        formatted with the frame number instead, keeping every frame
+        max_frame_rate: float, defaulted to 2. Frames per second at most
+        chunk_size: int, defaulted to 1000. Points a sweep measures between
+        updates
+        queue_size: int, defaulted to 1000. Updates waiting to be rendered
+        at most
+        figsize: tuple, defaulted to (6, 4.5). Size of the frames in inches
+        dpi: int, defaulted to 100
+    """
+    def __init__(self, filename: str = "live_view.png", max_frame_rate: float = 2, chunk_size: int = 1000, queue_size: int = 1000, figsize: tuple[float, float] = (6, 4.5), dpi: int = 100):
+        if max_frame_rate <= 0:
+            m = "max_frame_rate must be positive"
+            raise ValueError(m)
+
+        self.filename = filename
+        self.max_frame_rate = max_frame_rate
+        self.chunk_size = chunk_size
+        self._figsize = figsize
+        self._dpi = dpi
+        self._queue = queue.Queue(maxsize = queue_size)
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        # state of the renderer thread
+        self._axes = None
+        self._mirror_names = None
+        self._response = None
+        self._popt = None
+
+        self.frames_rendered = 0
+        self.updates_received = 0
+        self.updates_dropped = 0
+        self.error = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+            Start the renderer thread
+        """
+        if self.running:
+            m = "live view is already running"
+            raise RuntimeError(m)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._run, name = "LiveView", daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """
+            Render the last updates, and stop the renderer thread
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def begin(self, meshgrid_arg: list[np.ndarray], mirror_names: list[str]):
+        """
+            Start showing a new sweep over the grid of meshgrid_arg
+        """
+        return self._send(("begin", [np.array(values, dtype=float) for values in meshgrid_arg], list(mirror_names)))
+
+    def update(self, flat_indices: np.ndarray, values: np.ndarray):
+        """
+            Send measurements at raveled grid indices; returns False if the
+            update was dropped. The arrays must not be modified afterwards.
+        """
+        return self._send(("update", flat_indices, values))
+
+    def fit(self, popt: list[float]):
+        """
+            Send the fitted parameters (as in `gaussian_ND`) to show instead
+            of the running fit
+        """
+        return self._send(("fit", np.array(popt, dtype=float)))
+
+    def _send(self, message):
+        # never blocks the sweep
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            self.updates_dropped += 1
+            return False
+
+    def _run(self):
+        figure = Figure(figsize = self._figsize, dpi = self._dpi)
+        canvas = FigureCanvasAgg(figure)
+        last_frame = -np.inf
+        changed = False
+
+        while True:
+            stopping = self._stop_event.is_set()
+            frame_time = last_frame + 1/self.max_frame_rate
+            try:
+                if stopping:
+                    message = self._queue.get_nowait()
+                else:
+                    # wait for updates, but not past the next frame time
+                    message = self._queue.get(timeout = max(frame_time - time.perf_counter(), 1e-3) if changed else 0.05)
+                changed = self._receive(message) or changed
+            except queue.Empty:
+                if stopping and not changed:
+                    return
+
+            # updates arriving before the next frame time are merged into it
+            if changed and (time.perf_counter() >= frame_time or stopping and self._queue.empty()):
+                try:
+                    self._render(figure, canvas)
+                except Exception as error:
+                    self.error = error
+                    print("\33[0;49;31mLive view stopped:\33[0;49;38m "+repr(error))
+                    return
+                last_frame = time.perf_counter()
+                changed = False
+
+    def _receive(self, message):
+        # apply a message to the renderer's copy of the sweep; returns
+        # whether there is anything new to render
+        if message[0] == "begin":
+            self._axes, self._mirror_names = message[1], message[2]
+            self._response = np.full(tuple(len(values) for values in self._axes), np.nan)
+            self._popt = None
+            # nothing to show until the first update
+            return False
+        elif self._response is None:
+            return False
+        elif message[0] == "update":
+            self.updates_received += 1
+            self._response.ravel()[message[1]] = message[2]
+        elif message[0] == "fit":
+            self._popt = message[1]
+        return True
+
+    def _render(self, figure, canvas):
+        figure.clear()
+        response = self._response
+        measured = np.isfinite(response)
+        popt = self._popt if self._popt is not None else self._running_fit(measured)
+        label = "fit" if self._popt is not None else "running fit"
+        title = "%d of %d points" % (np.count_nonzero(measured), response.size)
+
+        if response.ndim == 2:
+            axes = figure.add_subplot()
+            mesh = axes.pcolormesh(self._axes[0], self._axes[1], response.T, shading = "nearest")
+            if popt is not None:
+                grid = np.meshgrid(*self._axes, indexing = "ij")
+                axes.contour(grid[0], grid[1], gaussian_ND(grid, *popt).reshape(response.shape), cmap = "copper")
+            axes.set_xlabel(self._mirror_names[0])
+            axes.set_ylabel(self._mirror_names[1])
+            figure.colorbar(mesh, ax = axes).set_label("Photon number")
+            axes.set_title(title + (", contours: " + label if popt is not None else ""))
+        else:
+            # slices through the brightest point measured so far
+            peak = np.unravel_index(np.nanargmax(np.where(measured, response, -np.inf)), response.shape) if measured.any() else (0,)*response.ndim
+            panels = figure.subplots(1, response.ndim, squeeze = False)[0]
+            for index, axes in enumerate(panels):
+                cut = list(peak)
+                cut[index] = slice(None)
+                axes.plot(self._axes[index], response[tuple(cut)], "o", markersize = 3)
+                if popt is not None:
+                    values = np.linspace(self._axes[index][0], self._axes[index][-1], 101)
+                    point = [np.full_like(values, self._axes[axis][peak[axis]]) if axis != index else values for axis in range(response.ndim)]
+                    axes.plot(values, gaussian_ND(point, *popt), label = label)
+                axes.set_xlabel(self._mirror_names[index])
+            panels[0].set_ylabel("Photon number")
+            figure.suptitle(title)
+
+        figure.tight_layout()
+        self._save(canvas)
+        self.frames_rendered += 1
+
+    def _running_fit(self, measured):
+        # Gaussian of the moments of the response so far (unmeasured points
+        # count as zero)
+        if not measured.any():
+            return None
+        centers, deviations = _profile_moments(self._axes, np.where(measured, self._response, 0))
+        if not np.all(np.isfinite(centers)):
+            return None
+
+        popt = [np.nanmax(self._response)]
+        for center, deviation in zip(centers, deviations):
+            # exp(-(x-x0)**2/w**2) has a standard deviation of w/sqrt(2)
+            popt += [center, max(deviation, 1e-12)*np.sqrt(2)]
+        return popt
+
+    def _save(self, canvas):
+        if "{}" in self.filename:
+            canvas.print_png(self.filename.format(self.frames_rendered))
+            return
+
+        # written to a temporary file and renamed, so that a viewer never
+        # reads a partial frame
+        root, extension = os.path.splitext(self.filename)
+        temporary = root + ".tmp" + extension
+        canvas.print_png(temporary)
+        os.replace(temporary, self.filename)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+from collections import OrderedDict
+import numpy as np
+import time
+
+
+class MeasurementLedger():
+
+    """
+        This provides a ledger of ion response measurements keyed by mirror
+        positions, so that repeated measurements at the same (or nearly the
+        same) positions can be answered from stored statistics instead of a
+        new photon integration.
+
+        Positions are quantized to `resolution` to form the key. When used
+        with a gradient-based optimizer such as `generic_optimize`, the
+        resolution must be finer than the optimizer's finite-difference step
+        (about 1e-8 for L-BFGS-B), otherwise the points of a finite
+        difference share an entry and the gradient vanishes. For each key,
+        the count, running mean and variance of the measurements are kept
+        (Welford's algorithm). Once an entry has `min_samples` measurements,
+        `lookup` answers with the mean.
+
+        Entries are evicted when the ledger holds more than `max_entries`
+        (least recently used first), and when they are older than
+        `time_to_live` seconds (counted from their first measurement), so
+        that drift does not leave stale data in use.
+
+        `hits` and `misses` count lookups answered from the ledger and
+        lookups that required a measurement; `evictions` counts evicted
+        entries.
+
+        To use with a LaserCalibrationSystem, run:
+
+            syst.ledger = MeasurementLedger(min_samples=3)
+    """
+    def __init__(self, resolution: float = 1e-10, min_samples: int = 1, max_entries: int = 10000, time_to_live: float | None = None, clock = time.monotonic):
+        if resolution <= 0:
+            m = "resolution must be positive"
+            raise ValueError(m)
+
+        if min_samples < 1:
+            m = "min_samples must be at least 1"
+            raise ValueError(m)
+
+        self.resolution = resolution
+        self.min_samples = min_samples
+        self.max_entries = max_entries
+        self.time_to_live = time_to_live
+        self._clock = clock
+
+        # key -> [count, mean, sum of squared deviations, time of first measurement]
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, positions):
+        """
+            Quantized key of mirror positions
+
+            positions: list or ndarray of float
+        """
+        return tuple(np.round(np.asarray(positions, dtype=float)/self.resolution).astype(int).tolist())
+
+    def lookup(self, positions):
+        """
+            Return the mean of the stored measurements at positions if there
+            are at least min_samples of them, otherwise None (a miss).
+
+            positions: list or ndarray of float
+        """
+        entry = self._get(self.key(positions))
+
+        if entry is None or entry[0] < self.min_samples:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry[1]
+
+    def record(self, positions, value: float):
+        """
+            Add a measurement at positions to the ledger
+
+            positions: list or ndarray of float
+            value: float, measured ion response
+        """
+        key = self.key(positions)
+        entry = self._get(key)
+
+        if entry is None:
+            entry = [0, 0., 0., self._clock()]
+            self._entries[key] = entry
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+                self.evictions += 1
+
+        entry[0] += 1
+        delta = value - entry[1]
+        entry[1] += delta/entry[0]
+        entry[2] += delta*(value - entry[1])
+
+    def statistics(self, positions):
+        """
+            Return (count, mean, variance) of the measurements stored at
+            positions, or None if there are none. The variance is the sample
+            variance, and is NaN for a single measurement.
+
+            positions: list or ndarray of float
+        """
+        entry = self._get(self.key(positions), touch = False)
+        if entry is None:
+            return None
+
+        variance = entry[2]/(entry[0] - 1) if entry[0] > 1 else np.nan
+        return entry[0], entry[1], variance
+
+    def clear(self):
+        """
+            Remove all entries; counters are kept
+        """
+        self._entries.clear()
+
+    def _get(self, key, touch: bool = True):
+        # returns the entry for key, evicting it if it has expired, and
+        # marking it as most recently used
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self.time_to_live is not None and self._clock() - entry[3] > self.time_to_live:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+
+        if touch:
+            self._entries.move_to_end(key)
+        return entry
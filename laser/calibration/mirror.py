@@ -4,6 +4,8 @@
 @author: markjhku
 """
 
+import time
+from laser_calibration.instrumentation import instrumentation
 
 
 class Mirror():
@@ -17,7 +19,12 @@ class Mirror():
         
         The property `move_mirror_function` points to the current
         `move_mirror_function` associated with the given Mirror object
+        
+        Mirrors have `__slots__`, as systems hold many of them and access
+        their positions at every sweep point
     """
+    __slots__ = ("_position", "_move_mirror_function", "simulation")
+    
     def __init__(self, move_mirror_function = None):
        self._position = 0
   
@@ -33,11 +40,20 @@ class Mirror():
             if abs(position) > 1:
                 m = "position must be between -1 and 1"
                 raise ValueError(m)
-                
-            if self._move_mirror_function is not None:
+            
+            self._move(position)
+    
+    def _move(self, position):
+        # move without the range check, for callers that checked already
+        if self._move_mirror_function is not None:
+            if instrumentation.enabled:
+                start_time = time.perf_counter()
+                self._move_mirror_function(position)
+                instrumentation.record("mirror_move", time.perf_counter() - start_time)
+            else:
                 self._move_mirror_function(position)
 
-            self._position = position
+        self._position = position
                 
     @property
     def position(self):
@@ -47,7 +63,6 @@ class Mirror():
     @position.setter
     def position(self, value: float):
         self.move_mirror_to_position(position=value)
-        self._position = value
 
 
     @property
@@ -61,5 +76,20 @@ class Mirror():
         
         if move_mirror_function is None:
             self.simulation = True
+
+
+class SimulatedMirror(Mirror):
+    
+    """
+        Mirror for simulation mode whose moves block for `latency` seconds,
+        emulating the settle time of a real mirror controller. Useful for
+        testing concurrent mirror actuation without hardware.
+    """
+    __slots__ = ("latency",)
+    
+    def __init__(self, latency: float = 0):
+        super().__init__(move_mirror_function = self._settle)
+        self.latency = latency
         
-        
\ No newline at end of file
+    def _settle(self, position: float):
+        time.sleep(self.latency)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Transport layer for mirror controllers behind a TCP link (or a serial link
+bridged to TCP). Commands are framed as a 4-byte big-endian length followed
+by a JSON message:
+
+    request:  {"id": 7, "moves": {"x": 0.1, "y": -0.2}}
+    reply:    {"id": 7}                     once the moves are done
+              {"id": 7, "error": "..."}     if they failed
+
+A request can move any number of axes of the controller, and is
+acknowledged once. Requests are pipelined: they are sent without waiting
+for the replies of earlier ones, which are matched back by "id". The
+controller handles the requests of a connection in order.
+
+To move mirrors through a controller:
+
+    controller = get_controller("192.168.0.10", 5025)
+    syst.add_mirror("x", TransportMirror(controller, "x"))
+    syst.add_mirror("y", TransportMirror(controller, "y"))
+    syst.batch_move_mirrors(x=0.1, y=-0.2)     # one request, one round trip
+
+`ControllerEmulator` is a controller on localhost with a configurable link
+latency and settle time, for measuring the gain without hardware.
+"""
+
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from laser_calibration.mirror import Mirror
+
+
+_HEADER = struct.Struct(">I")
+
+
+class MirrorTransportError(Exception):
+
+    """
+        Raised when a controller replies with an error to a request
+    """
+
+
+def _send_frame(sock, message):
+    payload = json.dumps(message, separators = (",", ":")).encode()
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _receive_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def _receive_frame(sock):
+    size, = _HEADER.unpack(_receive_exactly(sock, _HEADER.size))
+    return json.loads(_receive_exactly(sock, size))
+
+
+class MirrorController():
+
+    """
+        This provides a client of a mirror controller, over one persistent
+        TCP connection that is opened on the first request and reopened if
+        it drops. A reader thread matches the replies to the pending
+        requests, so any number of requests can be in flight (pipelined),
+        also from several threads.
+
+        `submit(moves)` sends a request and returns a
+        concurrent.futures.Future, done when the controller acknowledges it.
+        `move(moves)` sends a request and waits for it, and `wait(future)`
+        waits for a submitted request.
+        
+        A request that is not acknowledged within `timeout` raises
+        TimeoutError, and the connection is dropped (failing the other
+        pending requests too) and reopened by the next request: the
+        controller may still carry out a late request, so the replies on
+        that connection no longer tell which moves were done.
+
+        Controllers are usually shared through `get_controller`, so that all
+        mirrors (and systems) on the same controller use one connection.
+
+        Arguments:
+        host: str
+        port: int
+
+        Optional arguments:
+        timeout: float, defaulted to 5. Seconds to wait for a connection and
+        for each reply in `move` and `wait`
+    """
+    def __init__(self, host: str, port: int, timeout: float = 5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+
+        self.requests_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def submit(self, moves: dict):
+        """
+            Send a request moving the axes in moves (a dict of axis:
+            position), and return a Future of its acknowledgement
+        """
+        future = Future()
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = future
+            try:
+                _send_frame(self._socket, {"id": request_id, "moves": moves})
+            except OSError as error:
+                del self._pending[request_id]
+                self._disconnect(error)
+                raise
+            self.requests_sent += 1
+
+        return future
+
+    def move(self, moves: dict):
+        """
+            Move the axes in moves (a dict of axis: position), and wait for
+            the controller to acknowledge it
+        """
+        self.wait(self.submit(moves))
+
+    def wait(self, future: Future):
+        """
+            Wait for the acknowledgement of a request returned by `submit`,
+            for up to `timeout` seconds
+        """
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:
+            pass
+        
+        with self._lock:
+            if not any(pending is future for pending in self._pending.values()):
+                # the reply came in meanwhile
+                return future.result()
+            error = TimeoutError("no reply from " + self.host + ":" + str(self.port) + " within " + str(self.timeout) + " s")
+            self._disconnect(error)
+        raise error
+
+    def close(self):
+        """
+            Close the connection; pending requests fail with ConnectionError
+        """
+        with self._lock:
+            self._disconnect(ConnectionError("connection closed"))
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout = self.timeout)
+        sock.settimeout(None)
+        # requests are small and latency-bound
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket = sock
+        threading.Thread(target = self._read, args = (sock,), name = "MirrorController", daemon = True).start()
+
+    def _disconnect(self, error):
+        # called with the lock held
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    def _read(self, sock):
+        try:
+            while True:
+                reply = _receive_frame(sock)
+                with self._lock:
+                    future = self._pending.pop(reply["id"], None)
+                if future is None:
+                    continue
+                if "error" in reply:
+                    future.set_exception(MirrorTransportError(reply["error"]))
+                else:
+                    future.set_result(None)
+        except (OSError, ValueError) as error:
+            with self._lock:
+                if self._socket is sock:
+                    self._disconnect(error if isinstance(error, ConnectionError) else ConnectionError(str(error)))
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(host: str, port: int, timeout: float = 5):
+    """
+        Get the MirrorController of host and port, creating it on the first
+        call; later calls return the same controller, and hence connection
+    """
+    with _controllers_lock:
+        if (host, port) not in _controllers:
+            _controllers[(host, port)] = MirrorController(host, port, timeout)
+        return _controllers[(host, port)]
+
+
+class TransportMirror(Mirror):
+
+    """
+        Mirror moved through an axis of a MirrorController. Moving a single
+        mirror sends a request for its axis; `batch_move_mirrors` (and the
+        other moves of LaserCalibrationSystem) coalesces the moves of all
+        TransportMirrors on the same controller into one request.
+
+        Arguments:
+        controller: MirrorController
+        axis: str, name of the axis on the controller
+    """
+    __slots__ = ("controller", "axis")
+
+    def __init__(self, controller: MirrorController, axis: str):
+        super().__init__(move_mirror_function = self._send)
+        self.controller = controller
+        self.axis = axis
+
+    def _send(self, position: float):
+        self.controller.move({self.axis: position})
+
+
+class ControllerEmulator():
+
+    """
+        This provides a mirror controller on a localhost socket, speaking
+        the protocol of MirrorController, for testing and benchmarking
+        without hardware.
+
+        Each connection handles its requests in order: a request takes
+        `settle_time` seconds to carry out (whatever the number of axes it
+        moves), and its reply arrives `latency` seconds after the request
+        was received, so `latency` models the link (and is overlapped by
+        pipelining) while `settle_time` models the mirrors. The positions of
+        the axes are in `positions`.
+
+        To use:
+
+            with ControllerEmulator(latency=1e-3) as emulator:
+                controller = MirrorController(*emulator.address)
+
+        Optional arguments:
+        latency: float, defaulted to 0. Seconds from a request to its reply
+        settle_time: float, defaulted to 0. Seconds to carry out a request
+        axes: list[str] | None, axes of the controller. If None, any axis is
+        accepted
+        port: int, defaulted to 0 (any free port)
+    """
+    def __init__(self, latency: float = 0, settle_time: float = 0, axes: list[str] | None = None, port: int = 0):
+        self.latency = latency
+        self.settle_time = settle_time
+        self.axes = axes
+        self.positions = {axis: 0. for axis in axes} if axes is not None else {}
+        self.requests_received = 0
+
+        self._server = socket.create_server(("127.0.0.1", port))
+        self._connections = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target = self._accept, name = "ControllerEmulator", daemon = True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def address(self):
+        """
+            (host, port) the emulator listens on
+        """
+        return self._server.getsockname()[:2]
+
+    def close(self):
+        """
+            Stop accepting connections and close the open ones
+        """
+        self._server.close()
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                connection.close()
+            self._connections = []
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self._server.accept()
+            except OSError:
+                return
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._connections.append(connection)
+            replies = queue.Queue()
+            threading.Thread(target = self._handle, args = (connection, replies), daemon = True).start()
+            threading.Thread(target = self._reply, args = (connection, replies), daemon = True).start()
+
+    def _handle(self, connection, replies):
+        try:
+            while True:
+                request = _receive_frame(connection)
+                received = time.perf_counter()
+                with self._lock:
+                    self.requests_received += 1
+                reply = {"id": request["id"]}
+
+                moves = request.get("moves", {})
+                unknown = [axis for axis in moves if self.axes is not None and axis not in self.axes]
+                if unknown:
+                    reply["error"] = "unknown axes: " + ", ".join(unknown)
+                elif any(abs(position) > 1 for position in moves.values()):
+                    reply["error"] = "position must be between -1 and 1"
+                else:
+                    if self.settle_time > 0:
+                        time.sleep(self.settle_time)
+                    self.positions.update(moves)
+
+                replies.put((max(received + self.latency, time.perf_counter()), reply))
+        except (OSError, ValueError):
+            replies.put(None)
+
+    def _reply(self, connection, replies):
+        # sends the replies in order, each at its due time
+        while True:
+            item = replies.get()
+            if item is None:
+                return
+            due, reply = item
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                _send_frame(connection, reply)
+            except OSError:
+                return
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Monte Carlo harness for the accuracy of the calibration routines. Runs many
+simulated calibrations with random ion centers, widths, photon numbers and
+instrument noise, distributed over a pool of processes, and collects the
+results into arrays.
+
+Every run has its own seed, spawned from a single numpy SeedSequence: it
+draws its parameters, its simulated photon counts (through the `rng` of
+IonResponseSimulation) and, for randomized routines, the routine's seed.
+Results are therefore reproducible, and independent of the number of
+processes. To use:
+
+    from laser_calibration.monte_carlo import run_monte_carlo, summarize_monte_carlo
+    results = run_monte_carlo("grid_sweep_optimize", number_of_runs=1000, step=0.1)
+    summarize_monte_carlo(results, verbose=True)
+"""
+
+import concurrent.futures
+import contextlib
+import inspect
+import io
+import os
+import time
+import numpy as np
+
+from laser_calibration.ion_response_simulation import simulated_calibration_system
+from laser_calibration.grid_sweep_optimize import grid_sweep_optimize
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND
+from laser_calibration.generic_optimize import generic_optimize
+from laser_calibration.spsa_optimize import spsa_optimize
+from laser_calibration.bayesian_optimize import bayesian_optimize
+
+
+# routines that can be named in run_monte_carlo; any other module-level
+# function taking a LaserCalibrationSystem can also be passed directly
+ROUTINES = {
+    "grid_sweep_optimize": grid_sweep_optimize,
+    "grid_sweep_optimize_ND": grid_sweep_optimize_ND,
+    "generic_optimize": generic_optimize,
+    "spsa_optimize": spsa_optimize,
+    "bayesian_optimize": bayesian_optimize,
+}
+
+
+def run_monte_carlo(routine = "grid_sweep_optimize", number_of_runs: int = 100, dimension: int = 2, photon_number: float | tuple[float, float] = 100, width: float | tuple[float, float] = (0.2, 0.4), noise: float | tuple[float, float] = 0, center_range: float = 0.5, processes: int | None = None, runs_per_task: int | None = None, seed: int = 0, **kwargs):
+    """
+        Run simulated calibrations with random parameters, in parallel
+        processes, and return the results as a dict of arrays, one entry
+        per run:
+
+            "center": true ion centers, shape (number_of_runs, dimension)
+            "width", "photon_number", "noise": parameters of the run
+            "found": centers found (NaN if the routine failed)
+            "error": found - center
+            "success": whether the routine returned a result (not None, and
+            without raising)
+            "number_of_measurements": ion response measurements taken
+            "run_time": time of each run in seconds
+
+        and "wall_time", the total time, and "processes".
+
+        Arguments:
+        routine: a name from ROUTINES, or a module-level function called as
+        routine(laser_syst, **kwargs)
+
+        Optional arguments:
+        number_of_runs: int, defaulted to 100
+        dimension: int, defaulted to 2. Number of mirrors
+        photon_number, width, noise: float, or (low, high) to draw uniformly
+        per run (widths per axis). Defaulted to 100, (0.2, 0.4) and 0
+        center_range: float, defaulted to 0.5. Centers are drawn uniformly
+        in +/- center_range
+        processes: int | None. Number of processes (if None, one per CPU; if
+        1, runs in this process)
+        runs_per_task: int | None. Runs sent to a process at a time (if
+        None, chosen to give each process a few tasks)
+        seed: int, defaulted to 0. Seed of the SeedSequence of all runs
+        kwargs: passed to the routine. plot=False is passed to routines
+        that plot, and routines with a `seed` argument get a per-run seed,
+        unless given here
+    """
+    if isinstance(routine, str):
+        if routine not in ROUTINES:
+            m = "routine must be among " + ", ".join(ROUTINES)
+            raise ValueError(m)
+        routine = ROUTINES[routine]
+
+    if number_of_runs < 1:
+        m = "number_of_runs must be at least 1"
+        raise ValueError(m)
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    if runs_per_task is None:
+        runs_per_task = max(1, number_of_runs//(4*processes))
+
+    seed_sequences = np.random.SeedSequence(seed).spawn(number_of_runs)
+    tasks = [(routine, dimension, photon_number, width, noise, center_range, kwargs, seed_sequences[start:start + runs_per_task])
+             for start in range(0, number_of_runs, runs_per_task)]
+
+    start_time = time.perf_counter()
+    if processes == 1:
+        outputs = [_run_task(*task) for task in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = processes) as executor:
+            outputs = list(executor.map(_run_task, *zip(*tasks)))
+    wall_time = time.perf_counter() - start_time
+
+    runs = [run for output in outputs for run in output]
+    results = {key: np.array([run[key] for run in runs]) for key in runs[0]}
+    results["error"] = results["found"] - results["center"]
+    results["wall_time"] = wall_time
+    results["processes"] = processes
+
+    return results
+
+
+def summarize_monte_carlo(results: dict, percentiles: list[float] = (50, 90, 99), verbose: bool = False):
+    """
+        Summarize the results of run_monte_carlo as a dict with
+
+            "number_of_runs", "failure_rate"
+            "rms_error": root-mean-square error per axis, over successful runs
+            "bias": mean error per axis, over successful runs
+            "percentiles": dict of percentile: value of the largest absolute
+            error over axes, over successful runs
+            "mean_measurements": mean number of measurements per run
+
+        verbose: bool, defaulted to False. Whether to print the summary
+    """
+    success = results["success"]
+    error = results["error"][success]
+    largest_error = np.max(np.abs(error), axis = 1) if len(error) else np.array([])
+
+    summary = {
+        "number_of_runs": len(success),
+        "failure_rate": float(1 - np.mean(success)) if len(success) else float("nan"),
+        "rms_error": np.sqrt(np.mean(error**2, axis = 0)).tolist() if len(error) else None,
+        "bias": np.mean(error, axis = 0).tolist() if len(error) else None,
+        "percentiles": {percentile: float(np.percentile(largest_error, percentile)) for percentile in percentiles} if len(error) else {},
+        "mean_measurements": float(np.mean(results["number_of_measurements"])),
+    }
+
+    if verbose:
+        print("\33[0;49;33mRuns:\33[0;49;38m "+str(summary["number_of_runs"])+"\33[0;49;33m, failure rate:\33[0;49;38m "+"%.3f" % summary["failure_rate"])
+        if summary["rms_error"] is not None:
+            print("\33[0;49;33mRMS error per axis:\33[0;49;38m "+", ".join("%.4g" % value for value in summary["rms_error"]))
+            print("\33[0;49;33mBias per axis:\33[0;49;38m "+", ".join("%.4g" % value for value in summary["bias"]))
+            print("\33[0;49;33mLargest axis error percentiles:\33[0;49;38m "+", ".join(str(percentile)+"%: "+"%.4g" % value for percentile, value in summary["percentiles"].items()))
+        print("\33[0;49;33mMean measurements per run:\33[0;49;38m "+"%.1f" % summary["mean_measurements"])
+
+    return summary
+
+
+def _run_task(routine, dimension, photon_number, width, noise, center_range, kwargs, seed_sequences):
+    # a block of runs, in a worker process
+    return [_run(routine, dimension, photon_number, width, noise, center_range, kwargs, seed_sequence) for seed_sequence in seed_sequences]
+
+
+def _run(routine, dimension, photon_number, width, noise, center_range, kwargs, seed_sequence):
+    rng = np.random.default_rng(seed_sequence)
+    center = rng.uniform(-center_range, center_range, dimension)
+    width = _draw(rng, width, dimension)
+    photon_number = float(_draw(rng, photon_number, 1)[0])
+    noise = float(_draw(rng, noise, 1)[0])
+
+    syst, mirror_names, counts = simulated_calibration_system(center, width, photon_number, noise, rng)
+
+    parameters = inspect.signature(routine).parameters
+    kwargs = dict(kwargs)
+    if "plot" in parameters:
+        kwargs.setdefault("plot", False)
+    if "seed" in parameters:
+        kwargs.setdefault("seed", int(rng.integers(2**32)))
+
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            output = routine(syst, **kwargs)
+        except Exception:
+            output = None
+    run_time = time.perf_counter() - start_time
+
+    if isinstance(output, tuple):
+        output = output[0]
+    found = np.array([output[mirror_name] for mirror_name in mirror_names], dtype = float) if output is not None else np.full(dimension, np.nan)
+
+    return {"center": center, "width": width, "photon_number": photon_number, "noise": noise, "found": found, "success": output is not None, "number_of_measurements": counts["measurements"], "run_time": run_time}
+
+
+def _draw(rng, value, size):
+    # a fixed value, or uniform in (low, high)
+    if np.ndim(value) == 0:
+        return np.full(size, float(value))
+    return rng.uniform(value[0], value[1], size)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Vectorized point-spread-function models, for use as the photon_distribution
+of IonResponseSimulation. Every model is called as model(x, y, ...) with
+floats or arrays broadcastable against each other, so that a whole grid is
+evaluated in one call, e.g. model(*np.meshgrid(x, y, indexing="ij")) or
+sim.measure_batch(positions).
+
+Models can be added together, and adding a number adds a uniform background:
+
+    psf = GaussianPSF.from_widths(100, [0.1, 0.2], [0.3, 0.2], rotation=0.5) + 2
+    sim = IonResponseSimulation(psf)
+"""
+
+import functools
+import numpy as np
+
+
+class PSFModel():
+
+    """
+        Base class of the models. Subclasses implement `__call__(*r)`,
+        returning the average photon number at r = (x, y, ...).
+    """
+    def __add__(self, other):
+        if np.isscalar(other):
+            if other == 0:
+                # so that sum() of models starts from 0
+                return self
+            other = Background(other)
+        if not isinstance(other, PSFModel):
+            return NotImplemented
+        return SumPSF([self, other])
+
+    __radd__ = __add__
+
+
+class GaussianPSF(PSFModel):
+
+    """
+        N-dimensional Gaussian with a full covariance matrix, i.e. rotated
+        with respect to the mirror axes:
+
+            photon_number*exp(-(r - center)^T covariance^-1 (r - center))
+
+        With covariance = diag(width**2) this is `gaussian_ND` of
+        grid_sweep_optimize_ND (note there is no factor 1/2, so the widths
+        are those of the fits). See `from_widths` to build the covariance
+        from widths and a rotation.
+
+        Arguments:
+        photon_number: float, photon number at the center
+        center: list[float]
+        covariance: ndarray of shape (N, N), symmetric positive definite
+    """
+    def __init__(self, photon_number: float, center: list[float], covariance: np.ndarray):
+        self.photon_number = photon_number
+        self.center = np.asarray(center, dtype=float)
+        covariance = np.asarray(covariance, dtype=float)
+
+        if covariance.shape != (len(self.center), len(self.center)):
+            m = "covariance must be of shape (N, N) for a center of length N"
+            raise ValueError(m)
+
+        if not np.allclose(covariance, covariance.T) or np.any(np.linalg.eigvalsh(covariance) <= 0):
+            m = "covariance must be symmetric positive definite"
+            raise ValueError(m)
+
+        self.covariance = covariance
+        self._precision = np.linalg.inv(covariance)
+        # cross terms are skipped for axis-aligned Gaussians
+        self._pairs = [(i, j) for i in range(len(self.center)) for j in range(i + 1, len(self.center)) if self._precision[i, j] != 0]
+
+    @classmethod
+    def from_widths(cls, photon_number: float, center: list[float], width: float | list[float], rotation: float | np.ndarray | None = None):
+        """
+            Gaussian with `width` along its principal axes, which are the
+            mirror axes rotated by `rotation`: an angle in radians (2D), or
+            an orthogonal matrix whose columns are the principal axes
+        """
+        center = np.asarray(center, dtype=float)
+        width = np.broadcast_to(np.asarray(width, dtype=float), center.shape)
+
+        if rotation is None:
+            rotation = np.eye(len(center))
+        elif np.isscalar(rotation):
+            if len(center) != 2:
+                m = "rotation angle is only defined in 2D; give a rotation matrix instead"
+                raise ValueError(m)
+            rotation = np.array([[np.cos(rotation), -np.sin(rotation)], [np.sin(rotation), np.cos(rotation)]])
+
+        rotation = np.asarray(rotation, dtype=float)
+        return cls(photon_number, center, rotation@np.diag(width**2)@rotation.T)
+
+    def __call__(self, *r):
+        if len(r) != len(self.center):
+            m = "expected " + str(len(self.center)) + " coordinates"
+            raise ValueError(m)
+
+        d = [np.asarray(r[index], dtype=float) - self.center[index] for index in range(len(r))]
+        exponent = sum(self._precision[index, index]*d[index]**2 for index in range(len(d)))
+        for i, j in self._pairs:
+            exponent = exponent + 2*self._precision[i, j]*d[i]*d[j]
+
+        return self.photon_number*np.exp(-exponent)
+
+
+class AiryPSF(PSFModel):
+
+    """
+        Airy pattern, the diffraction-limited PSF of a circular aperture:
+
+            photon_number*(2*J1(v)/v)**2, v = 3.8317*rho
+
+        where rho is the distance to the center in units of `radius`, the
+        radius of the first dark ring (per axis, for elliptical patterns).
+        In more than 2 dimensions rho is the distance over all axes.
+
+        The Bessel function is not evaluated per point: (2*J1(v)/v)**2 is
+        tabulated once (and shared between instances) for v up to
+        `table_range`, and linearly interpolated; further out, its
+        asymptotic form 8*cos(v - 3*pi/4)**2/(pi*v**3) is used.
+
+        Arguments:
+        photon_number: float, photon number at the center
+        center: list[float]
+        radius: float | list[float], radius of the first dark ring
+
+        Optional arguments:
+        table_size: int, defaulted to 8192. Points of the table
+        table_range: float, defaulted to 60. Largest v of the table
+    """
+    FIRST_ZERO = 3.8317059702075125
+
+    def __init__(self, photon_number: float, center: list[float], radius: float | list[float], table_size: int = 8192, table_range: float = 60):
+        self.photon_number = photon_number
+        self.center = np.asarray(center, dtype=float)
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=float), self.center.shape)
+        self._table, self._table_step = _airy_table(table_size, table_range)
+        # v**2 = sum of (scale*(r - center))**2
+        self._scale = self.FIRST_ZERO/self.radius
+
+    def __call__(self, *r):
+        if len(r) != len(self.center):
+            m = "expected " + str(len(self.center)) + " coordinates"
+            raise ValueError(m)
+
+        v = np.sqrt(sum((self._scale[index]*(np.asarray(r[index], dtype=float) - self.center[index]))**2 for index in range(len(r))))
+        return self.photon_number*airy_intensity(v, self._table, self._table_step)
+
+
+class Background(PSFModel):
+
+    """
+        Uniform background of `level` photons
+    """
+    def __init__(self, level: float):
+        self.level = level
+
+    def __call__(self, *r):
+        return np.full(np.broadcast(*r).shape, float(self.level))[()]
+
+
+class SumPSF(PSFModel):
+
+    """
+        Sum of models, e.g. several ions, or a PSF with background. Usually
+        built by adding models together.
+    """
+    def __init__(self, models: list[PSFModel]):
+        self.models = []
+        for model in models:
+            # flattened, so that long sums stay one level deep
+            self.models += model.models if isinstance(model, SumPSF) else [model]
+
+    def __call__(self, *r):
+        total = self.models[0](*r)
+        for model in self.models[1:]:
+            total = total + model(*r)
+        return total
+
+
+def airy_intensity(v: np.ndarray, table: np.ndarray | None = None, table_step: float | None = None):
+    """
+        (2*J1(v)/v)**2 for v >= 0, from a table (by default, the one of
+        AiryPSF's default arguments)
+    """
+    if table is None:
+        table, table_step = _airy_table(8192, 60)
+
+    v = np.asarray(v, dtype=float)
+    position = v/table_step
+    index = np.minimum(position.astype(np.intp), len(table) - 2)
+    fraction = position - index
+    intensity = table[index]*(1 - fraction) + table[index + 1]*fraction
+
+    outside = v > table_step*(len(table) - 1)
+    if np.any(outside):
+        v_outside = v[outside] if intensity.ndim else v
+        asymptote = 8*np.cos(v_outside - 3*np.pi/4)**2/(np.pi*v_outside**3)
+        if intensity.ndim:
+            intensity[outside] = asymptote
+        else:
+            intensity = asymptote
+
+    return intensity[()]
+
+
+@functools.lru_cache(maxsize = None)
+def _airy_table(table_size, table_range):
+    # the only place where the Bessel function is evaluated
+    from scipy.special import j1
+
+    v = np.linspace(0, table_range, table_size)
+    table = np.ones(table_size)
+    table[1:] = (2*j1(v[1:])/v[1:])**2
+    table.setflags(write = False)
+    return table, v[1] - v[0]
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+import numpy as np
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+from laser_calibration.instrumentation import instrumentation
+
+
+
+def spsa_optimize(laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None, budget: int = 2000, x0: list[float] | None = None, initial_step: float = 0.05, c: float = 0.05, alpha: float = 0.602, gamma: float = 0.101, A: float | None = None, a: float | None = None, average: bool = True, samples: int = 1, seed: int | None = None, full_output: bool = False):
+    """
+        function to calibrate by maximizing the ion response with simultaneous
+        perturbation stochastic approximation (SPSA). Each iteration perturbs
+        all mirrors at once along a random +/-1 direction and measures on
+        both sides, so the gradient estimate takes two measurements
+        regardless of the number of mirrors, and averages out shot noise
+        over the iterations.
+
+        SPSA is a local optimizer: it has to start where the ion response is
+        non-zero, e.g. from the result of a coarse grid sweep.
+
+        Arguments:
+        laser_syst: a LaserCalibrationSystem instance
+
+        Optional arguments:
+        optimize_over_axes: str | list[str] | None. Specify which mirror
+        axes to optmize over (if None, all is assumed)
+        budget: int, defaulted to 2000. Maximum number of measurements
+        x0: list[float] | None. Starting mirror positions (if None, the
+        current mirror positions are used)
+        initial_step: float, defaulted to 0.05. Size of the first steps, used
+        to set the gain `a` if it is not supplied
+        c: float, defaulted to 0.05. Size of the first perturbations
+        alpha, gamma: float, defaulted to 0.602 and 0.101. Decay exponents
+        of the gain a_k = a/(k+1+A)**alpha and of the perturbation size
+        c_k = c/(k+1)**gamma
+        A: float | None. Stability constant of the gain schedule (if None,
+        10% of the number of iterations)
+        a: float | None. Gain (if None, it is set from the magnitude of the
+        first gradient estimates so that the first steps are about
+        initial_step)
+        average: bool, defaulted to True. Whether to return the average of
+        the iterates over the second half of the run instead of the last
+        iterate, which reduces the effect of noise
+        samples: int, defaulted to 1. How many samples of measurements to
+        take at a given point
+        seed: int | None. Seed of the random perturbations
+        full_output: bool, defaulted to False. If True, also return a dict
+        with the number of measurements and iterations
+    """
+    if optimize_over_axes is None:
+        optimize_over_axes = laser_syst.get_all_mirror_names()
+    elif isinstance(optimize_over_axes, str):
+        optimize_over_axes = [optimize_over_axes]
+
+    dimension = len(optimize_over_axes)
+    iterations = budget//(2*samples)
+    number_of_measurements = 2*samples*iterations
+    
+    # with a = None, part of the budget goes into setting the gain
+    calibration_iterations = max(1, min(5, iterations//4)) if a is None else 0
+    if iterations - calibration_iterations < 1:
+        m = "budget is too small for the number of samples"
+        raise ValueError(m)
+
+    if x0 is None:
+        x0 = [laser_syst.get_mirror_position(mirror) for mirror in optimize_over_axes]
+
+    if A is None:
+        A = 0.1*iterations
+
+    rng = np.random.default_rng(seed)
+
+    indices = laser_syst.mirror_indices(optimize_over_axes)
+    func = lambda r: -1*np.mean([laser_syst.move_and_measure_vector(r, indices) for sample_number in range(samples)])
+
+    def gradient(x, c_k):
+        # both perturbed points have to lie within the mirror range
+        x = np.clip(x, -1 + c_k, 1 - c_k)
+        delta = rng.choice((-1., 1.), size = dimension)
+        return (func(x + c_k*delta) - func(x - c_k*delta))/(2*c_k*delta)
+
+    x = np.array(x0, dtype = float)
+    averaged = np.zeros(dimension)
+    number_averaged = 0
+
+    if a is None:
+        # gain such that the first steps are about initial_step, from the
+        # average magnitude of a few gradient estimates at the start
+        g = np.mean([np.abs(gradient(x, c)) for k in range(calibration_iterations)])
+        a = initial_step*(A+1)**alpha/max(g, 1e-12)
+        iterations -= calibration_iterations
+
+    for k in range(iterations):
+        c_k = c/(k+1)**gamma
+        x = np.clip(x - a/(k+1+A)**alpha*gradient(x, c_k), -1, 1)
+
+        if k >= iterations//2:
+            averaged += x
+            number_averaged += 1
+
+    if average:
+        x = averaged/number_averaged
+
+    move_mirrors_args = {}
+    [move_mirrors_args.update({optimize_over_axes[index]:x[index]}) for index in range(len(optimize_over_axes)) ]
+    laser_syst.batch_move_mirrors(**move_mirrors_args)
+
+
+    for mirror in optimize_over_axes:
+        print("\33[0;49;33mMirror "+mirror + " moved to:\33[0;49;38m "+str(move_mirrors_args[mirror]))
+
+    if instrumentation.enabled:
+        instrumentation.print_summary()
+
+    if full_output:
+        return move_mirrors_args, {"number_of_measurements": number_of_measurements, "iterations": iterations}
+
+    return move_mirrors_args
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Traversal orders for grid sweeps. Each order is returned as an integer array of
+grid indices of shape (number of points, N), in the order the points are to be
+visited, so that measurements can be placed back into the right cell of the
+response array regardless of the order they were taken in.
+
+For large grids, `sweep_order_chunks` yields the same indices a block at a
+time, so the full index array never has to be held in memory.
+"""
+
+import numpy as np
+
+
+SWEEP_ORDERS = ("raster", "serpentine", "hilbert")
+
+
+def sweep_order(shape: tuple[int, ...], order: str = "raster"):
+    """
+        Grid indices of an N-dimensional grid in visiting order.
+
+        shape: tuple[int], number of points along each axis (first axis is
+        the slowest)
+        order: str, one of
+            "raster": itertools.product order; the fast axis flies back at
+            the end of every row
+            "serpentine": boustrophedon order; every axis reverses direction
+            instead of flying back, so consecutive points are always
+            neighbours
+            "hilbert": order along an N-dimensional Hilbert curve. On grids
+            whose sides are not a power of two the curve is cropped, so a
+            few longer jumps remain
+    """
+    if order not in SWEEP_ORDERS:
+        m = "order must be one of " + ", ".join(SWEEP_ORDERS)
+        raise ValueError(m)
+
+    shape = tuple(int(n) for n in shape)
+    indices = np.indices(shape).reshape(len(shape), -1).T
+
+    if order == "serpentine":
+        indices = _serpentine(indices, shape)
+    elif order == "hilbert":
+        indices = indices[np.argsort(hilbert_index(indices), kind="stable")]
+
+    return indices
+
+
+def sweep_order_chunks(shape: tuple[int, ...], order: str = "raster", chunk_size: int = 65536):
+    """
+        Generator of the grid indices of `sweep_order(shape, order)`, in
+        consecutive blocks of at most chunk_size points, each an integer
+        array of shape (number of points in the block, N).
+
+        Raster and serpentine blocks are computed directly from the position
+        in the sweep. The Hilbert order is a sort over the whole grid, so it
+        keeps the Hilbert index and visiting order of every point (16 bytes
+        per point) while the blocks are produced.
+    """
+    if order not in SWEEP_ORDERS:
+        m = "order must be one of " + ", ".join(SWEEP_ORDERS)
+        raise ValueError(m)
+
+    if chunk_size < 1:
+        m = "chunk_size must be at least 1"
+        raise ValueError(m)
+
+    shape = tuple(int(n) for n in shape)
+    size = int(np.prod(shape))
+
+    if order == "hilbert":
+        bits = max(1, (max(shape) - 1).bit_length())
+        keys = np.empty(size, dtype=np.uint64)
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            keys[start:stop] = hilbert_index(_raster(shape, start, stop), bits)
+        visiting_order = np.argsort(keys, kind="stable")
+        del keys
+
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        if order == "hilbert":
+            yield np.column_stack(np.unravel_index(visiting_order[start:stop], shape))
+        elif order == "serpentine":
+            yield _serpentine(_raster(shape, start, stop), shape)
+        else:
+            yield _raster(shape, start, stop)
+
+
+def sweep_travel(positions: np.ndarray, start: np.ndarray | None = None):
+    """
+        Total mirror travel commanded along each axis when visiting positions
+        in order.
+
+        positions: ndarray of shape (number of points, N)
+        start: ndarray of shape (N,), mirror positions before the sweep. If
+        None, travel is counted from the first point.
+    """
+    positions = np.asarray(positions, dtype=float)
+    if start is not None:
+        positions = np.vstack((np.asarray(start, dtype=float), positions))
+
+    return np.sum(np.abs(np.diff(positions, axis=0)), axis=0)
+
+
+def hilbert_index(indices: np.ndarray, bits: int | None = None):
+    """
+        Position along the Hilbert curve of each N-dimensional integer grid
+        index, using Skilling's transpose algorithm on the smallest
+        power-of-two cube containing the grid.
+
+        indices: integer ndarray of shape (number of points, N)
+        bits: int | None, side of the cube as a power of two. If None, the
+        smallest cube containing indices is used; indices of the same grid
+        computed in several parts must share bits.
+    """
+    X = np.array(indices, dtype=np.uint64)
+    dimension = X.shape[1]
+    if bits is None:
+        bits = max(1, int(np.max(X, initial=0)).bit_length())
+
+    if dimension * bits > 64:
+        m = "grid is too large for a 64-bit Hilbert index"
+        raise ValueError(m)
+
+    # inverse undo excess work
+    Q = 1 << (bits - 1)
+    while Q > 1:
+        P = np.uint64(Q - 1)
+        for index in range(dimension):
+            is_set = (X[:, index] & np.uint64(Q)) != 0
+            t = (X[:, 0] ^ X[:, index]) & P
+            X[:, 0] = np.where(is_set, X[:, 0] ^ P, X[:, 0] ^ t)
+            if index != 0:
+                X[:, index] = np.where(is_set, X[:, index], X[:, index] ^ t)
+        Q >>= 1
+
+    # Gray encode
+    for index in range(1, dimension):
+        X[:, index] ^= X[:, index - 1]
+    t = np.zeros(len(X), dtype=np.uint64)
+    Q = 1 << (bits - 1)
+    while Q > 1:
+        t = np.where((X[:, dimension - 1] & np.uint64(Q)) != 0, t ^ np.uint64(Q - 1), t)
+        Q >>= 1
+    X ^= t[:, None]
+
+    # interleave the transposed bits into a single index
+    h = np.zeros(len(X), dtype=np.uint64)
+    for bit in range(bits - 1, -1, -1):
+        for index in range(dimension):
+            h = (h << np.uint64(1)) | ((X[:, index] >> np.uint64(bit)) & np.uint64(1))
+
+    return h
+
+
+def _raster(shape: tuple[int, ...], start: int, stop: int):
+    # grid indices of the raster positions start..stop-1
+    return np.column_stack(np.unravel_index(np.arange(start, stop), shape))
+
+
+def _serpentine(indices: np.ndarray, shape: tuple[int, ...]):
+    # axis k runs backwards on every odd "row", where the row is the raster
+    # position of the slower axes 0..k-1
+    serpentine = indices.copy()
+    row = np.zeros(len(indices), dtype=np.int64)
+    for axis in range(1, len(shape)):
+        row = row * shape[axis - 1] + indices[:, axis - 1]
+        odd = row % 2 == 1
+        serpentine[odd, axis] = shape[axis] - 1 - indices[odd, axis]
+
+    return serpentine
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+On-disk storage of grid sweeps, so that an interrupted sweep can be resumed
+and a finished one re-fitted offline without re-measuring.
+
+A store is a directory holding:
+
+    response.npy: memory-mapped float64 array of the photon numbers, one
+    per grid point in raveled meshgrid order (NaN until measured)
+    metadata.json: mirror names, axis values, sweep range and step, shape,
+    traversal order, timestamps, system configuration, and the number of
+    points completed in traversal order
+
+Points are written in traversal order, and the metadata is only updated
+after the written block is flushed to disk, so `completed` never counts a
+point that was not saved.
+"""
+
+import datetime
+import json
+import os
+import numpy as np
+from numpy.lib.format import open_memmap
+
+
+class SweepStore():
+
+    """
+        This provides a class for a sweep stored on disk at `path` (a
+        directory). If the directory already holds a sweep, it is opened;
+        otherwise the store is empty until `initialize` is called.
+
+        `response` is the memory-mapped array of photon numbers. `write`
+        saves a block of measurements and checkpoints the number of
+        completed points. Sweeps write in blocks of at most
+        `checkpoint_interval` points, which is at most what is lost (and
+        re-measured on resume) if a sweep is interrupted.
+
+        read_only: bool, defaulted to False. Open the response array
+        read-only, e.g. for offline fitting.
+
+        To use with grid_sweep_optimize_ND, run:
+
+            grid_sweep_optimize_ND(syst, store="sweeps/ion1")
+
+        and run the same call again to resume an interrupted sweep.
+    """
+    RESPONSE_FILE = "response.npy"
+    METADATA_FILE = "metadata.json"
+
+    def __init__(self, path: str, checkpoint_interval: int = 100, read_only: bool = False):
+        if checkpoint_interval < 1:
+            m = "checkpoint_interval must be at least 1"
+            raise ValueError(m)
+
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.read_only = read_only
+        self.metadata = None
+        self.response = None
+
+        if os.path.exists(os.path.join(path, self.METADATA_FILE)):
+            with open(os.path.join(path, self.METADATA_FILE)) as f:
+                self.metadata = json.load(f)
+            self.response = open_memmap(os.path.join(path, self.RESPONSE_FILE), mode = "r" if read_only else "r+")
+
+    @property
+    def initialized(self):
+        return self.metadata is not None
+
+    @property
+    def mirror_names(self):
+        return self.metadata["mirror_names"]
+
+    @property
+    def meshgrid_arg(self):
+        return [np.array(values) for values in self.metadata["axes"]]
+
+    @property
+    def shape(self):
+        return tuple(self.metadata["shape"])
+
+    @property
+    def order(self):
+        return self.metadata["order"]
+
+    @property
+    def completed(self):
+        return self.metadata["completed"]
+
+    @property
+    def finished(self):
+        return self.metadata["completed"] == self.metadata["size"]
+
+    def initialize(self, mirror_names: list[str], meshgrid_arg: list[np.ndarray], order: str, sweep_range: list | None = None, step: list[float] | None = None, configuration: dict | None = None):
+        """
+            Create the files of a new sweep, over the grid of meshgrid_arg
+            (one array of values per mirror in mirror_names), visited in
+            `order`. sweep_range, step and configuration (e.g. mirror
+            positions and simulation settings) are recorded as is.
+        """
+        if self.initialized:
+            m = "store already holds a sweep"
+            raise ValueError(m)
+
+        if self.read_only:
+            m = "store is read-only"
+            raise ValueError(m)
+
+        os.makedirs(self.path, exist_ok = True)
+        shape = [len(values) for values in meshgrid_arg]
+        size = int(np.prod(shape))
+
+        self.response = open_memmap(os.path.join(self.path, self.RESPONSE_FILE), mode = "w+", dtype = np.float64, shape = (size,))
+        self.response[:] = np.nan
+        self.response.flush()
+
+        now = _timestamp()
+        self.metadata = {
+            "mirror_names": list(mirror_names),
+            "axes": [np.asarray(values, dtype=float).tolist() for values in meshgrid_arg],
+            "sweep_range": None if sweep_range is None else np.asarray(sweep_range, dtype=float).tolist(),
+            "step": None if step is None else np.asarray(step, dtype=float).tolist(),
+            "shape": shape,
+            "size": size,
+            "order": order,
+            "created": now,
+            "updated": now,
+            "finished": None,
+            "completed": 0,
+            "configuration": configuration,
+        }
+        self._save_metadata()
+
+    def matches(self, mirror_names: list[str], meshgrid_arg: list[np.ndarray], order: str):
+        """
+            Whether the store holds a sweep of the same mirrors, grid and
+            order, i.e. one that can be resumed with these arguments
+        """
+        return (list(mirror_names) == self.mirror_names and order == self.order
+                and len(meshgrid_arg) == len(self.metadata["axes"])
+                and all(np.array_equal(np.asarray(values, dtype=float), stored) for values, stored in zip(meshgrid_arg, self.meshgrid_arg)))
+
+    def write(self, flat_indices: np.ndarray, values: np.ndarray):
+        """
+            Save the measurements of the next len(values) points in
+            traversal order, at their raveled grid indices, and checkpoint
+        """
+        if self.read_only:
+            m = "store is read-only"
+            raise ValueError(m)
+
+        self.response[flat_indices] = values
+        self.response.flush()
+
+        self.metadata["completed"] += len(values)
+        self.metadata["updated"] = _timestamp()
+        if self.finished:
+            self.metadata["finished"] = self.metadata["updated"]
+        self._save_metadata()
+
+    def _save_metadata(self):
+        # written to a temporary file and renamed, so that an interruption
+        # cannot leave a truncated header
+        path = os.path.join(self.path, self.METADATA_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.metadata, f, indent = 1)
+        os.replace(path + ".tmp", path)
+
+
+def _timestamp():
+    return datetime.datetime.now().astimezone().isoformat(timespec = "seconds")
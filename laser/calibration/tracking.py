@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+"""
+
+import collections
+import contextlib
+import threading
+import time
+import numpy as np
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+
+
+class BeamTracker():
+
+    """
+        This provides a class for keeping the beam on the ion while it
+        drifts, without taking the system offline for a full calibration.
+        A background thread repeatedly dithers each mirror by +/- `dither`
+        around the current position, estimates the gradient of the log
+        photon number from the counts, and nudges the mirrors towards the
+        peak.
+
+        For a Gaussian response of width w (as in `gaussian_ND`), the
+        gradient of the log photon number along an axis is -2(x-x0)/w**2, so
+        a step of gain*w**2/2 times the gradient moves a fraction `gain` of
+        the way to the center. Steps are limited to `max_step`.
+
+        `duty_cycle` sets the fraction of the time spent tracking: after each
+        iteration the tracker idles, with the mirrors at the current best
+        position, for long enough to keep to it. Experiments can run in the
+        idle time; `hold` blocks tracking while they do.
+
+        To use:
+
+            tracker = BeamTracker(syst, width=0.3, duty_cycle=0.1)
+            tracker.start()
+            ...
+            with tracker.hold():
+                run_experiment()   # mirrors are at tracker.position
+            ...
+            tracker.stop()
+
+        Arguments:
+        laser_syst: a LaserCalibrationSystem instance, with the mirrors near
+        the peak (e.g. after a calibration)
+
+        Optional arguments:
+        optimize_over_axes: str | list[str] | None. Mirror axes to track (if
+        None, all is assumed)
+        width: float | list[float], defaulted to 0.3. Approximate width of
+        the ion response along each axis
+        dither: float, defaulted to 0.05. Size of the dither; larger dithers
+        give less noisy gradients, up to a fraction of the width
+        gain: float, defaulted to 0.3. Fraction of the estimated distance
+        to the peak moved per iteration
+        max_step: float, defaulted to 0.02. Largest move per iteration
+        samples: int, defaulted to 1. Samples of measurements per dither
+        point
+        duty_cycle: float, defaulted to 0.1. Fraction of time spent tracking
+        history_length: int, defaulted to 1000. Number of iterations kept in
+        `history`
+    """
+    def __init__(self, laser_syst: LaserCalibrationSystem, optimize_over_axes: str | list[str] | None = None, width: float | list[float] = 0.3, dither: float = 0.05, gain: float = 0.3, max_step: float = 0.02, samples: int = 1, duty_cycle: float = 0.1, history_length: int = 1000):
+        if optimize_over_axes is None:
+            optimize_over_axes = laser_syst.get_all_mirror_names()
+        elif isinstance(optimize_over_axes, str):
+            optimize_over_axes = [optimize_over_axes]
+
+        if not 0 < duty_cycle <= 1:
+            m = "duty_cycle must be between 0 and 1"
+            raise ValueError(m)
+
+        self._laser_syst = laser_syst
+        self._axes = list(optimize_over_axes)
+        self._width = np.broadcast_to(np.asarray(width, dtype=float), (len(self._axes),)).copy()
+        self.dither = dither
+        self.gain = gain
+        self.max_step = max_step
+        self.samples = samples
+        self.duty_cycle = duty_cycle
+
+        self._indices = laser_syst.mirror_indices(self._axes)
+        self._position = laser_syst.positions[self._indices]
+        # held while the tracker moves the mirrors; see `hold`
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._thread = None
+        self._history = collections.deque(maxlen = history_length)
+
+        self.iterations = 0
+        self.number_of_measurements = 0
+        self.busy_time = 0.
+        self.error = None
+        self._start_time = None
+
+    @property
+    def position(self):
+        """
+            Current best mirror positions, as a dict
+        """
+        with self._lock:
+            return dict(zip(self._axes, self._position.tolist()))
+
+    @property
+    def history(self):
+        """
+            List of (time, dict of positions, mean photon number at the
+            dither points) per iteration, most recent last
+        """
+        with self._lock:
+            return list(self._history)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def paused(self):
+        return not self._resume_event.is_set()
+
+    @property
+    def overhead(self):
+        """
+            Fraction of the time since the start spent tracking
+        """
+        if self._start_time is None:
+            return 0.
+        return self.busy_time/max(time.perf_counter() - self._start_time, 1e-12)
+
+    def start(self):
+        """
+            Start tracking in a background thread
+        """
+        if self.running:
+            m = "tracker is already running"
+            raise RuntimeError(m)
+
+        self._stop_event.clear()
+        self._resume_event.set()
+        self.error = None
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target = self._run, name = "BeamTracker", daemon = True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """
+            Stop tracking, and wait for the current iteration to finish; the
+            mirrors are left at the best position
+        """
+        self._stop_event.set()
+        self._resume_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def pause(self):
+        """
+            Pause tracking after the current iteration
+        """
+        self._resume_event.clear()
+
+    def resume(self):
+        self._resume_event.set()
+
+    @contextlib.contextmanager
+    def hold(self):
+        """
+            Context manager during which the tracker does not move the
+            mirrors, which stay at the best position
+        """
+        with self._lock:
+            yield self.position
+
+    def step(self):
+        """
+            Run one tracking iteration in the calling thread; returns the new
+            positions as a dict
+        """
+        with self._lock:
+            position = self._position.copy()
+            gradient = np.zeros(len(self._axes))
+            responses = []
+
+            for index in range(len(self._axes)):
+                plus, minus = position.copy(), position.copy()
+                plus[index] = min(position[index] + self.dither, 1)
+                minus[index] = max(position[index] - self.dither, -1)
+                response_plus = self._measure(plus)
+                response_minus = self._measure(minus)
+                responses += [response_plus, response_minus]
+                # log counts, offset so that zero counts stay finite
+                gradient[index] = (np.log(response_plus + 1) - np.log(response_minus + 1))/max(plus[index] - minus[index], 1e-12)
+
+            move = np.clip(self.gain*self._width**2/2*gradient, -self.max_step, self.max_step)
+            self._position = np.clip(position + move, -1, 1)
+            self._laser_syst.move_mirrors_vector(self._position, self._indices)
+
+            self.iterations += 1
+            self._history.append((time.time(), dict(zip(self._axes, self._position.tolist())), float(np.mean(responses))))
+            return dict(zip(self._axes, self._position.tolist()))
+
+    def _measure(self, position):
+        self.number_of_measurements += self.samples
+        return np.mean([self._laser_syst.move_and_measure_vector(position, self._indices) for sample_number in range(self.samples)])
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._resume_event.wait()
+            if self._stop_event.is_set():
+                break
+
+            start_time = time.perf_counter()
+            try:
+                self.step()
+            except Exception as error:
+                self.error = error
+                print("\33[0;49;31mTracking stopped:\33[0;49;38m "+repr(error))
+                break
+            busy_time = time.perf_counter() - start_time
+            self.busy_time += busy_time
+
+            # idle long enough to keep to the duty cycle
+            self._stop_event.wait(busy_time*(1 - self.duty_cycle)/self.duty_cycle)
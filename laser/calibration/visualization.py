@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: markjhku
+
+Plots of the calibration routines. The routines only import this module
+(and with it matplotlib) when asked to plot, so that headless use does not
+load the plotting stack.
+"""
+
+import numpy as np
+from matplotlib import pyplot as plt
+
+
+def plot_sweep_1d(grid_values: np.ndarray, response: np.ndarray, model, popt):
+    """
+        Plot the response of a 1D sweep, and the fitted model(x, *popt)
+    """
+    plt.figure()
+    plt.plot(grid_values,response,'o')
+    x_fit = np.linspace(-1,1,101)
+    plt.plot(x_fit,model(x_fit,*popt))
+    plt.xlabel("x")
+    plt.ylabel("Photon number")
+
+
+def plot_sweep_2d(x: np.ndarray, y: np.ndarray, response: np.ndarray, model, popt):
+    """
+        Plot the response of a 2D sweep on the meshgrid x, y, with contours
+        of the fitted model((x, y), *popt)
+    """
+    plt.figure()
+    response = np.reshape(response, x.shape)
+    plt.pcolormesh(x,y,response)
+
+    fit_model_z_values = model((x,y),*popt)
+    fit_model_z_values = fit_model_z_values.reshape(x.shape)
+    plt.contour(x,y,fit_model_z_values, cmap=plt.cm.copper)
+    plt.pcolormesh(x,y,np.array(response))
+    plt.xlabel("x")
+    plt.ylabel("y")
+    cbar = plt.colorbar()
+    cbar.set_label("Photon number")
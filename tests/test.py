@@ -6,10 +6,32 @@
 Unit test using simulated Gaussian response
 """
 import unittest
-from laser_calibration.ion_response_simulation import GaussianIonResponseSimulation
-from laser_calibration.laser_calibration_system import LaserCalibrationSystem
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from laser_calibration.ion_response_simulation import GaussianIonResponseSimulation, IonResponseSimulation, DriftingGaussianIonResponseSimulation, simulated_calibration_system
+from laser_calibration.laser_calibration_system import LaserCalibrationSystem, MirrorMoveError
+from laser_calibration.mirror import SimulatedMirror
+from laser_calibration.mirror_transport import ControllerEmulator, MirrorController, TransportMirror, MirrorTransportError
+from laser_calibration.measurement_ledger import MeasurementLedger
+from laser_calibration.spsa_optimize import spsa_optimize
+from laser_calibration.bayesian_optimize import bayesian_optimize
+from laser_calibration.benchmark import run_benchmark, compare_results, ALGORITHMS
+from laser_calibration.instrumentation import instrumentation
 
-from laser_calibration.grid_sweep_optimize import grid_sweep_optimize
+from laser_calibration.grid_sweep_optimize import grid_sweep_optimize, gaussian_1d, gaussian_2d, gaussian_1d_jacobian, gaussian_2d_jacobian
+from laser_calibration.grid_sweep_optimize_ND import grid_sweep_optimize_ND, gaussian_ND, GaussianNDModel, SeparableGrid, fit_stored_sweep, fit_roi
+from laser_calibration.sweep_store import SweepStore
+from laser_calibration.calibration_scheduler import CalibrationScheduler
+from laser_calibration.tracking import BeamTracker
+from laser_calibration.psf_models import GaussianPSF, AiryPSF, Background
+from laser_calibration.monte_carlo import run_monte_carlo, summarize_monte_carlo
+from laser_calibration import grid_sweep_optimize_ND as grid_sweep_optimize_ND_module
+from laser_calibration.sweep_order import sweep_order, SWEEP_ORDERS
 
 class LaserCalibrationTest(unittest.TestCase):
     
@@ -49,6 +71,878 @@ class LaserCalibrationTest(unittest.TestCase):
         
         self.assertTrue(x_result_withitn_tolerance and y_result_withitn_tolerance)
 
+    def test_simulation_seed(self):
+        photon_distribution = lambda x,y: 50*np.exp(-x**2/0.3**2-y**2/0.3**2)
+        positions = np.random.uniform(-1, 1, (100, 2))
+        
+        sim = IonResponseSimulation(photon_distribution, measurement_noise=2, seed=1, block_size=16)
+        first = [sim.measure_ion_response(x, y) for x, y in positions] + sim.measure_batch(positions).tolist()
+        
+        # the same seed replays the same measurements, across noise blocks
+        sim.reseed()
+        second = [sim.measure_ion_response(x, y) for x, y in positions] + sim.measure_batch(positions).tolist()
+        self.assertEqual(first, second)
+        
+        other = IonResponseSimulation(photon_distribution, measurement_noise=2, seed=1, block_size=16)
+        self.assertEqual([other.measure_ion_response(x, y) for x, y in positions[:10]], first[:10])
+        self.assertNotEqual(IonResponseSimulation(photon_distribution, measurement_noise=2, seed=2).measure_batch(positions).tolist(), first[100:])
+        
+        # the subclasses draw their noise in blocks of block_size too
+        for sim in [GaussianIonResponseSimulation(50, 0.1, 0.2, 0.3, 0.3, measurement_noise=2, seed=1, block_size=16), DriftingGaussianIonResponseSimulation(50, [0.1, 0.2], 0.3, [0, 0], measurement_noise=2, seed=1, block_size=16)]:
+            sim.measure_ion_response(0, 0)
+            self.assertEqual(len(sim._noise), 16)
+        
+        # without a seed, simulations follow the global random state
+        np.random.seed(3)
+        first = IonResponseSimulation(photon_distribution).measure_batch(positions)
+        np.random.seed(3)
+        np.testing.assert_array_equal(IonResponseSimulation(photon_distribution).measure_batch(positions), first)
+
+    def test_psf_models(self):
+        x, y = np.meshgrid(np.linspace(-1, 1, 21), np.linspace(-1, 1, 11), indexing="ij")
+        
+        # axis-aligned Gaussians are those of the fits
+        gaussian = GaussianPSF.from_widths(100, [0.1, 0.2], [0.3, 0.4])
+        np.testing.assert_allclose(gaussian(x, y).ravel(), gaussian_ND((x, y), 100, 0.1, 0.3, 0.2, 0.4))
+        
+        # rotating by 90 degrees swaps the widths
+        rotated = GaussianPSF.from_widths(100, [0.1, 0.2], [0.4, 0.3], rotation=np.pi/2)
+        np.testing.assert_allclose(rotated(x, y), gaussian(x, y))
+        rotated = GaussianPSF.from_widths(100, [0, 0], [0.4, 0.2], rotation=np.pi/4)
+        self.assertAlmostEqual(rotated(0.4/np.sqrt(2), 0.4/np.sqrt(2)), 100*np.exp(-1))
+        with self.assertRaises(ValueError):
+            GaussianPSF(100, [0, 0], [[1, 2], [2, 1]])
+        
+        # the tabulated Airy pattern matches the Bessel function
+        from scipy.special import j1
+        airy = AiryPSF(100, [0.1, 0.2], 0.2)
+        v = AiryPSF.FIRST_ZERO*np.hypot(x - 0.1, y - 0.2)/0.2
+        np.testing.assert_allclose(airy(x, y), 100*np.where(v > 0, (2*j1(v)/np.where(v > 0, v, 1))**2, 1), atol=1e-3)
+        self.assertAlmostEqual(airy(0.3, 0.2), 0, places=3)
+        
+        # sums with background, evaluated on whole grids and by simulations
+        model = airy + gaussian + 2
+        np.testing.assert_allclose(model(x, y), airy(x, y) + gaussian(x, y) + 2)
+        self.assertEqual(Background(2)(x, y).shape, x.shape)
+        sim = IonResponseSimulation(model, use_poisson_distribution=False, seed=0)
+        np.testing.assert_allclose(sim.measure_batch(np.stack([x.ravel(), y.ravel()], axis=1)), model(x, y).ravel())
+
+    def test_measure_batch(self):
+        # noiseless response, so batch and point-by-point paths must agree
+        photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y-0.2)**2/0.4**2)
+        sim = IonResponseSimulation(photon_distribution, use_poisson_distribution=False)
+        
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        self.assertTrue(syst.supports_batch_measurement)
+        
+        positions = np.array([[0.1, 0.2], [-0.5, 0.3], [0.9, -0.9]])
+        batch_response = syst.measure_batch(positions)
+        single_response = [syst.move_mirrors_and_measure(x=x_val, y=y_val) for x_val, y_val in positions]
+        
+        np.testing.assert_allclose(batch_response, single_response)
+        self.assertEqual(syst.get_mirror_position("x"), 0.9)
+        
+        # a single swept axis leaves the other mirror where it is
+        syst.move_mirror("y", 0.2)
+        np.testing.assert_allclose(syst.measure_batch(np.array([0.1]), ["x"]), [100])
+        
+        with self.assertRaises(ValueError):
+            syst.measure_batch(np.array([[1.5, 0.]]))
+
+    def test_sweep_order(self):
+        for order in SWEEP_ORDERS:
+            indices = sweep_order((4,3,5), order)
+            # every grid cell is visited exactly once
+            self.assertEqual(len({tuple(index) for index in indices}), 4*3*5)
+        
+        # serpentine and hilbert (on a power of two grid) only take unit steps
+        steps = np.sum(np.abs(np.diff(sweep_order((4,3,5), "serpentine"), axis=0)), 1)
+        self.assertEqual(np.max(steps), 1)
+        steps = np.sum(np.abs(np.diff(sweep_order((8,8), "hilbert"), axis=0)), 1)
+        self.assertEqual(np.max(steps), 1)
+        
+        photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y-0.2)**2/0.4**2)
+        sim = IonResponseSimulation(photon_distribution, use_poisson_distribution=False)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        outputs = {}
+        for order in SWEEP_ORDERS:
+            syst.batch_move_mirrors(x=0, y=0)
+            outputs[order] = grid_sweep_optimize_ND(laser_syst=syst, plot=False, order=order, full_output=True)
+        
+        # same fit regardless of order, with less travel than raster
+        for order in ("serpentine", "hilbert"):
+            self.assertAlmostEqual(outputs[order][0]['x'], outputs["raster"][0]['x'])
+            self.assertAlmostEqual(outputs[order][0]['y'], outputs["raster"][0]['y'])
+            self.assertLess(outputs[order][1]["travel"], outputs["raster"][1]["travel"])
+
+    def test_coarse_to_fine(self):
+        np.random.seed(0)
+        centers = [0.1, -0.2, 0.3]
+        photon_distribution = lambda x,y,z: 100*np.exp(-(x-centers[0])**2/0.3**2-(y-centers[1])**2/0.25**2-(z-centers[2])**2/0.35**2)
+        sim = IonResponseSimulation(photon_distribution)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        for mirror_name in ["x","y","z"]:
+            syst.add_mirror(mirror_name, None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y","z"]
+        
+        output, info = grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.4, target_precision=0.01, full_output=True)
+        
+        for index, mirror_name in enumerate(["x","y","z"]):
+            self.assertLess(abs(output[mirror_name] - centers[index]), 0.03)
+        
+        # far fewer points than a full sweep at the finest step reached
+        self.assertGreater(len(info["levels"]), 1)
+        self.assertEqual(info["number_of_measurements"], sum(level["number_of_measurements"] for level in info["levels"]))
+        finest_step = min(info["levels"][-1]["step"])
+        self.assertLess(info["number_of_measurements"], (2/finest_step)**3)
+        
+        # the coarse level can still be a grid sweep, e.g. to store it
+        output, info = grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.4, target_precision=0.01, coarse_grid=True, full_output=True)
+        self.assertEqual(info["levels"][0]["number_of_measurements"], 5**3)
+        for index, mirror_name in enumerate(["x","y","z"]):
+            self.assertLess(abs(output[mirror_name] - centers[index]), 0.03)
+        with self.assertRaises(ValueError):
+            grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.4, target_precision=0.01, roi=3)
+        
+        # the number of measurements grows linearly with the number of axes
+        rng = np.random.default_rng(0)
+        measurements = {}
+        for dimension in [2, 4, 6]:
+            centers = rng.uniform(-0.3, 0.3, dimension)
+            sim = IonResponseSimulation(lambda *r: 100*np.exp(-sum((r[index]-centers[index])**2/0.3**2 for index in range(dimension))), seed=dimension)
+            syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+            mirror_names = ["x"+str(index+1) for index in range(dimension)]
+            for mirror_name in mirror_names:
+                syst.add_mirror(mirror_name, None)
+            syst.simulation = True
+            syst.simulation_mirror_set = mirror_names
+            
+            output, info = grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.4, target_precision=0, max_levels=3, full_output=True)
+            measurements[dimension] = info["number_of_measurements"]
+            for index, mirror_name in enumerate(mirror_names):
+                self.assertLess(abs(output[mirror_name] - centers[index]), 0.03)
+        
+        self.assertLess(measurements[6]/6, 1.25*measurements[2]/2)
+        self.assertLess(measurements[6], 5**4)
+
+    def test_refinement_fit_failure(self):
+        np.random.seed(0)
+        photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y+0.2)**2/0.25**2)
+        sim = IonResponseSimulation(photon_distribution)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        fit = grid_sweep_optimize_ND_module._fit_gaussian_ND
+        fits = []
+        
+        def failing_fit(meshgrid_arg, *args, **kwargs):
+            # after the coarse line fits, the refinement line fit of the
+            # second axis fails, after the first one moved its center
+            popt, pcov = fit(meshgrid_arg, *args, **kwargs)
+            fits.append(np.copy(popt))
+            return (None, None) if len(fits) == 4 else (popt, pcov)
+        
+        try:
+            grid_sweep_optimize_ND_module._fit_gaussian_ND = failing_fit
+            output, info = grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.2, target_precision=0.01, full_output=True)
+            
+            # the centers of the coarse level are kept
+            self.assertEqual(len(info["levels"]), 1)
+            self.assertEqual([output["x"], output["y"]], [fits[0][1], fits[1][1]])
+            self.assertNotEqual(output["x"], fits[2][1])
+            self.assertEqual(syst.get_mirror_position("x"), output["x"])
+            
+            # a center outside of the mirror range is never moved to
+            grid_sweep_optimize_ND_module._fit_gaussian_ND = lambda meshgrid_arg, response, p0, sigma=None: (np.array([100, 5, 0.3, np.nan, 0.3]), np.eye(5))
+            self.assertIsNone(grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.2))
+        finally:
+            grid_sweep_optimize_ND_module._fit_gaussian_ND = fit
+
+    def test_streaming_sweep(self):
+        # noiseless response, so sweeping in small chunks must give the same
+        # result as sweeping in a single chunk
+        photon_distribution = lambda x,y,z: 100*np.exp(-(x-0.1)**2/0.4**2-(y+0.2)**2/0.3**2-(z-0.3)**2/0.35**2)
+        sim = IonResponseSimulation(photon_distribution, use_poisson_distribution=False)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        for mirror_name in ["x","y","z"]:
+            syst.add_mirror(mirror_name, None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y","z"]
+        
+        outputs = []
+        chunk_size = grid_sweep_optimize_ND_module.SWEEP_CHUNK_SIZE
+        try:
+            for grid_sweep_optimize_ND_module.SWEEP_CHUNK_SIZE in (chunk_size, 7):
+                for order in SWEEP_ORDERS:
+                    syst.batch_move_mirrors(x=0, y=0, z=0)
+                    outputs.append(grid_sweep_optimize_ND(laser_syst=syst, plot=False, step=0.2, order=order, full_output=True))
+        finally:
+            grid_sweep_optimize_ND_module.SWEEP_CHUNK_SIZE = chunk_size
+        
+        for output, info in outputs:
+            for mirror_name in ["x","y","z"]:
+                self.assertAlmostEqual(output[mirror_name], outputs[0][0][mirror_name], places=6)
+        # travel only depends on the order
+        for index in range(len(SWEEP_ORDERS)):
+            self.assertAlmostEqual(outputs[index][1]["travel"], outputs[index+len(SWEEP_ORDERS)][1]["travel"])
+        self.assertAlmostEqual(outputs[0][0]["x"], 0.1, places=6)
+
+    def test_jacobians(self):
+        def finite_difference_jacobian(model, r, params, h=1e-6):
+            columns = []
+            for index in range(len(params)):
+                step = np.zeros(len(params))
+                step[index] = h
+                # copies, as GaussianNDModel overwrites its output
+                plus = np.array(model(r, *(params + step)))
+                minus = np.array(model(r, *(params - step)))
+                columns.append((plus - minus)/(2*h))
+            return np.column_stack(columns)
+        
+        x = np.linspace(-1, 1, 9)
+        y = np.linspace(-1, 1, 7)
+        grid = np.meshgrid(x, y, indexing="ij")
+        params_1d = np.array([80., 0.1, 0.3])
+        params_2d = np.array([80., 0.1, 0.3, -0.2, 0.4])
+        
+        np.testing.assert_allclose(gaussian_1d_jacobian(x, *params_1d), finite_difference_jacobian(gaussian_1d, x, params_1d), rtol=1e-6, atol=1e-6)
+        np.testing.assert_allclose(gaussian_2d_jacobian(grid, *params_2d), finite_difference_jacobian(gaussian_2d, grid, params_2d), rtol=1e-6, atol=1e-6)
+        
+        for r in [grid, SeparableGrid([x, y])]:
+            model = GaussianNDModel(r)
+            np.testing.assert_allclose(model.jacobian(r, *params_2d), finite_difference_jacobian(gaussian_ND, grid, params_2d), rtol=1e-6, atol=1e-6)
+            
+            # buffers are updated when the parameters change
+            for params in [params_2d, np.array([50., -0.3, 0.2, 0.5, 0.25]), params_2d]:
+                np.testing.assert_allclose(model(r, *params), gaussian_ND(grid, *params))
+                np.testing.assert_allclose(model.jacobian(r, *params), finite_difference_jacobian(gaussian_ND, grid, params), rtol=1e-6, atol=1e-6)
+
+    def test_separable_grid(self):
+        axes = [np.arange(-1, 1, 0.2), np.arange(-0.5, 0.5, 0.25), np.arange(0, 1, 0.1)]
+        grid = SeparableGrid(axes)
+        dense = grid.dense()
+        params = [90, 0.1, 0.3, -0.2, 0.4, 0.5, 0.35]
+        
+        self.assertEqual(grid.size, 10*4*10)
+        np.testing.assert_array_equal(gaussian_ND(grid, *params), gaussian_ND(dense, *params))
+        
+        # outer product of 1D factors agrees with the dense model to rounding
+        separable_model = GaussianNDModel(grid)
+        dense_model = GaussianNDModel(dense)
+        np.testing.assert_allclose(separable_model(grid, *params), dense_model(dense, *params), rtol=1e-12)
+        np.testing.assert_allclose(separable_model.jacobian(grid, *params), dense_model.jacobian(dense, *params), rtol=1e-12, atol=1e-12)
+
+    def test_sweep_store(self):
+        photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y-0.2)**2/0.4**2)
+        sim = IonResponseSimulation(photon_distribution, use_poisson_distribution=False)
+        calls = []
+        
+        def batch_ion_response_function(positions):
+            # the controller fails on the third block of measurements
+            calls.append(len(positions))
+            if len(calls) == 3:
+                raise RuntimeError("controller glitch")
+            return sim.measure_batch(positions)
+        
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response, batch_ion_response_function=batch_ion_response_function)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sweep")
+            with self.assertRaises(RuntimeError):
+                grid_sweep_optimize_ND(syst, plot=False, order="serpentine", store=SweepStore(path, checkpoint_interval=50))
+            self.assertEqual(SweepStore(path).completed, 100)
+            
+            # resuming only measures the remaining points
+            output, info = grid_sweep_optimize_ND(syst, plot=False, order="serpentine", store=path, full_output=True)
+            self.assertEqual(info["number_of_measurements"], 300)
+            self.assertEqual(sum(calls), 400 + 50)
+            self.assertAlmostEqual(output["x"], 0.1, places=6)
+            self.assertAlmostEqual(output["y"], 0.2, places=6)
+            
+            store = SweepStore(path, read_only=True)
+            self.assertTrue(store.finished)
+            self.assertEqual(store.metadata["configuration"]["simulation_mirror_set"], ["x","y"])
+            self.assertFalse(np.any(np.isnan(store.response)))
+            
+            # offline fit of the stored sweep
+            centers = fit_stored_sweep(path)
+            self.assertAlmostEqual(centers["x"], output["x"])
+            
+            with self.assertRaises(ValueError):
+                grid_sweep_optimize_ND(syst, plot=False, order="raster", store=path)
+
+    def test_calibration_scheduler(self):
+        shared_mirror = SimulatedMirror()
+        systems = []
+        for mirrors in [[SimulatedMirror(), shared_mirror], [SimulatedMirror(), SimulatedMirror()], [shared_mirror, SimulatedMirror()]]:
+            syst = LaserCalibrationSystem(ion_response_function=lambda: 0)
+            syst.add_mirror("x", mirrors[0])
+            syst.add_mirror("y", mirrors[1])
+            systems.append(syst)
+        
+        intervals = {}
+        def routine(laser_syst, optimize_over_axes=None, label=None):
+            start_time = time.perf_counter()
+            laser_syst.batch_move_mirrors(x=0.5, y=0.5)
+            time.sleep(0.1)
+            intervals[label] = (start_time, time.perf_counter())
+            return label
+        
+        scheduler = CalibrationScheduler()
+        for name, syst in zip(["a", "b", "c"], systems):
+            scheduler.add_job(syst, routine, name=name, label=name)
+        self.assertEqual(scheduler.conflicts(), {"a": ["c"], "b": [], "c": ["a"]})
+        
+        report = scheduler.run()
+        self.assertEqual(report["errors"], {})
+        self.assertEqual(report["results"], {"a": "a", "b": "b", "c": "c"})
+        # a and b run together, c waits for the mirror it shares with a
+        self.assertLess(intervals["b"][0], intervals["a"][1])
+        self.assertGreaterEqual(intervals["c"][0], intervals["a"][1])
+        self.assertLess(report["makespan"], 0.8*report["serial_time"])
+
+    def test_adaptive_sampling(self):
+        np.random.seed(1)
+        photon_distribution = lambda x,y: 20*np.exp(-(x-0.1)**2/0.25**2-(y+0.2)**2/0.25**2)
+        sim = IonResponseSimulation(photon_distribution)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        # a dark point is decided after a single sample, a bright one is not
+        syst.batch_move_mirrors(x=-0.9, y=0.9)
+        self.assertEqual(syst.measure_adaptive(threshold=5, max_samples=10)[1], 1)
+        syst.batch_move_mirrors(x=0.1, y=-0.2)
+        self.assertEqual(syst.measure_adaptive(threshold=5, max_samples=10, stop_above=False)[1], 10)
+        
+        output, info = grid_sweep_optimize_ND(syst, plot=False, samples=10, threshold=2, full_output=True)
+        self.assertLess(abs(output["x"] - 0.1), 0.02)
+        self.assertLess(abs(output["y"] + 0.2), 0.02)
+        # most of the grid is background, sampled once
+        self.assertLess(info["number_of_samples"], 0.4*10*info["number_of_measurements"])
+
+    def test_beam_tracker(self):
+        np.random.seed(0)
+        sim = DriftingGaussianIonResponseSimulation(100, [0.1, -0.1], 0.3, [0.1, -0.05])
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", SimulatedMirror(latency=0.001))
+        syst.add_mirror("y", SimulatedMirror(latency=0.001))
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        syst.batch_move_mirrors(x=0.1, y=-0.1)
+        
+        tracker = BeamTracker(syst, width=0.3, dither=0.1, duty_cycle=0.25)
+        tracker.start()
+        time.sleep(1)
+        with tracker.hold() as position:
+            # the center moved by 0.1 in x; the tracker follows it
+            center = sim.center
+            self.assertLess(abs(position["x"] - center[0]), 0.05)
+            self.assertLess(abs(position["y"] - center[1]), 0.05)
+            self.assertEqual(syst.get_mirror_position("x"), position["x"])
+        self.assertLess(tracker.overhead, 0.5)
+        
+        tracker.pause()
+        time.sleep(0.1)
+        iterations = tracker.iterations
+        time.sleep(0.1)
+        self.assertEqual(tracker.iterations, iterations)
+        
+        tracker.resume()
+        tracker.stop()
+        self.assertFalse(tracker.running)
+        self.assertIsNone(tracker.error)
+
+    def test_monte_carlo(self):
+        results = run_monte_carlo("grid_sweep_optimize", number_of_runs=6, photon_number=(0.5, 50), noise=(0, 2), processes=1, step=0.2)
+        
+        self.assertEqual(results["found"].shape, (6, 2))
+        self.assertEqual(results["number_of_measurements"].tolist(), [100]*6)
+        np.testing.assert_array_equal(results["error"], results["found"] - results["center"])
+        self.assertTrue(np.all(np.isnan(results["found"][~results["success"]])))
+        
+        # runs are seeded individually, so the number of processes does not
+        # change the results
+        parallel_results = run_monte_carlo("grid_sweep_optimize", number_of_runs=6, photon_number=(0.5, 50), noise=(0, 2), processes=2, runs_per_task=2, step=0.2)
+        np.testing.assert_array_equal(results["found"], parallel_results["found"])
+        np.testing.assert_array_equal(results["photon_number"], parallel_results["photon_number"])
+        
+        summary = summarize_monte_carlo(results)
+        self.assertEqual(summary["failure_rate"], 1 - np.mean(results["success"]))
+        self.assertEqual(len(summary["rms_error"]), 2)
+        self.assertLessEqual(summary["percentiles"][50], summary["percentiles"][90])
+        
+        with self.assertRaises(ValueError):
+            run_monte_carlo("grid_sweep_optimize", number_of_runs=0)
+        
+        # the simulated system both harnesses run on counts measurements, and
+        # moves that change a mirror's position
+        syst, mirror_names, counts = simulated_calibration_system([0.1, -0.2], 0.3, 100, rng=np.random.default_rng(0))
+        self.assertEqual(mirror_names, ["x1", "x2"])
+        syst.move_mirrors_and_measure(x1=0.5, x2=0)
+        syst.move_mirrors_and_measure(x1=0.5, x2=0.5)
+        syst.measure_batch(np.array([[0.5, 0.5], [0.5, 0.6], [0.7, 0.8]]))
+        self.assertEqual(counts, {"measurements": 5, "mirror_moves": 5})
+
+    def test_roi_fit(self):
+        centers = [0.2, -0.1, 0.3]
+        widths = [0.2, 0.25, 0.15]
+        photon_distribution = lambda *r: 50*np.exp(-sum(((r[index]-centers[index])/widths[index])**2 for index in range(3))) + 1
+        sim = IonResponseSimulation(photon_distribution, seed=0)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        for mirror_name in ["x","y","z"]:
+            syst.add_mirror(mirror_name, None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y","z"]
+        
+        output, info = grid_sweep_optimize_ND(syst, step=0.05, plot=False, roi=3, full_output=True)
+        
+        # the background of most of the grid is left out of the fit
+        self.assertLess(info["fit_points"], info["number_of_measurements"]/5)
+        for index, mirror_name in enumerate(["x","y","z"]):
+            self.assertLess(abs(output[mirror_name] - centers[index]), 0.02)
+        
+        # grid_sweep_optimize shares the region of interest fit, with the
+        # width convention of gaussian_1d/2d
+        sim = IonResponseSimulation(lambda x, y: photon_distribution(x, y, centers[2]), seed=0)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        for mirror_name in ["x","y"]:
+            syst.add_mirror(mirror_name, None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        output = grid_sweep_optimize(syst, step=0.05, plot=False, roi=3)
+        for index, mirror_name in enumerate(["x","y"]):
+            self.assertLess(abs(output[mirror_name] - centers[index]), 0.02)
+        
+        # windows keep a minimum number of points within the grid
+        values = np.arange(-1, 1, 0.1)
+        slices = grid_sweep_optimize_ND_module._roi_slices([values, values], [0.95, 0], [0.01, 0.2], 3)
+        self.assertEqual(slices[0], slice(13, 20))
+        self.assertEqual(slices[1], slice(4, 17))
+        
+        # the response of a point is the mean of its samples, so its weight
+        # follows the number of samples it took
+        grid = np.meshgrid(values, values, indexing="ij")
+        response = gaussian_ND(grid, 20, 0.1, 0.3, -0.2, 0.3)
+        sample_counts = np.random.default_rng(0).integers(1, 5, response.size)
+        sigmas = []
+        def fit(axes, fit_response, p0, sigma=None):
+            sigmas.append(sigma)
+            return None, None
+        self.assertIsNone(fit_roi([values, values], response, [20, 0.1, 0.3, -0.2, 0.3], 3, fit, sample_counts=sample_counts)[0])
+        slices = grid_sweep_optimize_ND_module._roi_slices([values, values], *grid_sweep_optimize_ND_module._profile_moments([values, values], response.reshape(20, 20)), 3)
+        np.testing.assert_allclose(sigmas[0], np.sqrt(np.maximum(response.reshape(20, 20)[slices], 1)/sample_counts.reshape(20, 20)[slices]).ravel())
+        self.assertIsNone(sigmas[1])
+        
+        # with adaptive sampling
+        for routine in (grid_sweep_optimize, grid_sweep_optimize_ND):
+            output = routine(syst, step=0.1, plot=False, roi=3, samples=4, threshold=2)
+            for index, mirror_name in enumerate(["x","y"]):
+                self.assertLess(abs(output[mirror_name] - centers[index]), 0.05)
+
+    def test_import_time(self):
+        # a headless sweep must not load the plotting stack or scipy until it
+        # fits or plots; run in a fresh interpreter, as this one has already
+        # imported them
+        code = ("import sys, time\n"
+                "start_time = time.perf_counter()\n"
+                "import laser_calibration\n"
+                "laser_calibration.LaserCalibrationSystem\n"
+                "import laser_calibration.grid_sweep_optimize, laser_calibration.grid_sweep_optimize_ND, laser_calibration.generic_optimize\n"
+                "import laser_calibration.bayesian_optimize, laser_calibration.benchmark, laser_calibration.monte_carlo\n"
+                "print(time.perf_counter() - start_time)\n"
+                "print(' '.join(module for module in ['matplotlib', 'scipy'] if module in sys.modules))")
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.splitlines()
+        
+        self.assertEqual(output[1:], [""])
+        self.assertLess(float(output[0]), 1)
+        
+        import laser_calibration
+        self.assertIs(laser_calibration.SweepStore, SweepStore)
+        self.assertIn("BeamTracker", dir(laser_calibration))
+        with self.assertRaises(AttributeError):
+            laser_calibration.missing_attribute
+
+    def test_live_view(self):
+        from laser_calibration.live_view import LiveView
+        sim = GaussianIonResponseSimulation(photon_number=100, x_center=0.1, y_center=0.2, x_width=0.3, y_width=0.4, seed=0)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        with tempfile.TemporaryDirectory() as directory:
+            with LiveView(os.path.join(directory, "frame_{}.png"), max_frame_rate=50, chunk_size=50) as live_view:
+                output = grid_sweep_optimize_ND(syst, step=0.1, plot=False, live_view=live_view)
+            
+            # every chunk reached the renderer, and the last frame shows the fit
+            self.assertIsNone(live_view.error)
+            self.assertEqual(live_view.updates_received, 8)
+            self.assertEqual(len(os.listdir(directory)), live_view.frames_rendered)
+            self.assertGreater(live_view.frames_rendered, 0)
+            np.testing.assert_allclose(live_view._popt[1::2], [output["x"], output["y"]])
+        
+        # without a renderer, updates are dropped instead of blocking
+        live_view = LiveView(queue_size=2)
+        start_time = time.perf_counter()
+        sent = [live_view.update(np.arange(10), np.ones(10)) for update in range(100)]
+        self.assertLess(time.perf_counter() - start_time, 0.1)
+        self.assertEqual(sum(sent), 2)
+        self.assertEqual(live_view.updates_dropped, 98)
+
+    def test_concurrent_moves(self):
+        syst = LaserCalibrationSystem(ion_response_function=lambda: 0, concurrent_moves=True)
+        for mirror_name in ["x1","x2","x3","x4"]:
+            syst.add_mirror(mirror_name, SimulatedMirror(latency=0.05))
+        
+        start_time = time.perf_counter()
+        syst.batch_move_mirrors(x1=0.1, x2=0.2, x3=0.3, x4=0.4)
+        elapsed = time.perf_counter() - start_time
+        
+        # four 50 ms settles overlap instead of adding up
+        self.assertLess(elapsed, 0.15)
+        self.assertEqual(syst.get_mirror_position("x4"), 0.4)
+        
+        def broken_mirror(position):
+            raise RuntimeError("controller not responding")
+        syst.add_mirror("x5", broken_mirror)
+        
+        with self.assertRaises(MirrorMoveError) as context:
+            syst.batch_move_mirrors(x1=-0.1, x2=2, x5=0.5)
+        
+        # errors from all mirrors are reported, and the others still moved
+        self.assertEqual(set(context.exception.errors), {"x2","x5"})
+        self.assertEqual(syst.get_mirror_position("x1"), -0.1)
+
+    def test_mirror_registry(self):
+        moves = []
+        syst = LaserCalibrationSystem(ion_response_function=lambda y, x: 10*x + y)
+        for mirror_name in ["x","y","z"]:
+            syst.add_mirror(mirror_name, lambda position, mirror_name=mirror_name: moves.append((mirror_name, position)))
+        syst.simulation = True
+        syst.simulation_mirror_set = ["y","x"]
+        
+        # mirrors have no __dict__
+        with self.assertRaises(AttributeError):
+            syst.get_mirror("x").offset = 0.1
+        
+        indices = syst.mirror_indices(["z","x"])
+        np.testing.assert_array_equal(indices, [2, 0])
+        
+        # the vector and the dict API move the same mirrors and measure the same
+        self.assertEqual(syst.move_and_measure_vector(np.array([0.3, 0.5]), indices), 5.)
+        np.testing.assert_array_equal(syst.positions, [0.5, 0., 0.3])
+        self.assertEqual(syst.move_mirrors_and_measure(z=-0.3, x=0.4, y=0.2), 4.2)
+        self.assertEqual(syst.move_and_measure_vector([0.1, 0.2, 0.3]), 1.2)
+        self.assertEqual([syst.get_mirror_position(mirror) for mirror in ["x","y","z"]], [0.1, 0.2, 0.3])
+        self.assertEqual(moves[-3:], [("x", 0.1), ("y", 0.2), ("z", 0.3)])
+        
+        # an out-of-range position leaves all mirrors in place
+        number_of_moves = len(moves)
+        with self.assertRaises(ValueError):
+            syst.move_mirrors_vector([0.5, 1.5], indices)
+        with self.assertRaises(ValueError):
+            syst.move_mirrors_vector([0.5], indices)
+        with self.assertRaises(ValueError):
+            syst.mirror_indices(["w"])
+        self.assertEqual(len(moves), number_of_moves)
+        np.testing.assert_array_equal(syst.positions, [0.1, 0.2, 0.3])
+
+    def test_mirror_transport(self):
+        latency = 0.02
+        with ControllerEmulator(latency=latency, axes=["x","y","z"]) as emulator, MirrorController(*emulator.address) as controller:
+            syst = LaserCalibrationSystem(ion_response_function=lambda x, y: x + y)
+            for axis in ["x","y","z"]:
+                syst.add_mirror(axis, TransportMirror(controller, axis))
+            syst.simulation = True
+            syst.simulation_mirror_set = ["x","y"]
+            
+            # a multi-axis move is one request
+            self.assertAlmostEqual(syst.move_mirrors_and_measure(x=0.1, y=0.2, z=0.3), 0.3)
+            self.assertEqual(emulator.requests_received, 1)
+            self.assertEqual(emulator.positions, {"x": 0.1, "y": 0.2, "z": 0.3})
+            syst.move_mirror("z", -0.3)
+            self.assertEqual(emulator.requests_received, 2)
+            np.testing.assert_array_equal(syst.positions, [0.1, 0.2, -0.3])
+            
+            # pipelined requests overlap their round trips
+            start_time = time.perf_counter()
+            futures = [controller.submit({"x": step/10}) for step in range(10)]
+            [future.result(1) for future in futures]
+            self.assertLess(time.perf_counter() - start_time, 5*latency)
+            self.assertEqual(emulator.positions["x"], 0.9)
+            
+            # errors of a request fail the moves of all its mirrors
+            with self.assertRaises(MirrorTransportError):
+                controller.move({"w": 0})
+            syst.add_mirror("w", TransportMirror(controller, "w"))
+            with self.assertRaises(MirrorMoveError) as context:
+                syst.batch_move_mirrors(x=0.5, w=0.5)
+            self.assertEqual(set(context.exception.errors), {"x","w"})
+            self.assertEqual(syst.get_mirror_position("x"), 0.1)
+            
+            # the connection is reopened after it is closed
+            controller.close()
+            syst.batch_move_mirrors(x=0.4, y=0.4)
+            self.assertEqual(emulator.positions["y"], 0.4)
+            
+            # other mirrors still move in parallel with concurrent_moves,
+            # while the request is in flight
+            syst = LaserCalibrationSystem(ion_response_function=lambda: 0, concurrent_moves=True)
+            syst.add_mirror("x", TransportMirror(controller, "x"))
+            for mirror_name in ["u","v","w"]:
+                syst.add_mirror(mirror_name, SimulatedMirror(latency=latency))
+            start_time = time.perf_counter()
+            syst.batch_move_mirrors(x=0.2, u=0.1, v=0.2, w=0.3)
+            self.assertLess(time.perf_counter() - start_time, 2.5*latency)
+            np.testing.assert_array_equal(syst.positions, [0.2, 0.1, 0.2, 0.3])
+            
+            # every mirror moved counts as one mirror move event
+            with instrumentation.isolated():
+                syst.batch_move_mirrors(x=0.3, u=0.3, v=0.3, w=0.3)
+                self.assertEqual(instrumentation.data()["mirror_move"]["calls"], 4)
+            
+            # a controller that cannot be reached fails the moves of its
+            # mirrors only
+            with socket.create_server(("127.0.0.1", 0)) as server:
+                port = server.getsockname()[1]
+            unreachable = MirrorController("127.0.0.1", port, timeout=1)
+            syst.add_mirror("y", TransportMirror(unreachable, "y"))
+            with self.assertRaises(MirrorMoveError) as context:
+                syst.batch_move_mirrors(x=0.4, y=0.4, u=0.4, v=0.4)
+            self.assertEqual(set(context.exception.errors), {"y"})
+            self.assertIsInstance(context.exception.errors["y"], OSError)
+            np.testing.assert_array_equal(syst.positions, [0.4, 0.4, 0.4, 0.3, 0])
+        
+        # a request that times out drops the connection, which is reopened
+        # by the next request
+        with ControllerEmulator(settle_time=0.2) as emulator, MirrorController(*emulator.address, timeout=0.05) as controller:
+            with self.assertRaises(TimeoutError):
+                controller.move({"x": 0.5})
+            self.assertEqual(controller._pending, {})
+            controller.timeout = 1
+            controller.move({"x": 0.6})
+            self.assertEqual(emulator.positions["x"], 0.6)
+
+    def test_pipelined_readout(self):
+        latency = 0.005
+        positions = np.column_stack([np.linspace(-0.9, 0.9, 20), np.linspace(0.5, -0.5, 20)])
+        
+        def acquire(x, y):
+            return (x, y)
+        
+        def readout(raw):
+            # readouts of varying duration, each tagged with its position
+            time.sleep(latency*(1 + (raw[0] > 0)))
+            return 10*raw[0] + raw[1]
+        
+        elapsed = {}
+        for overlap_readout in [False, True]:
+            syst = LaserCalibrationSystem(ion_response_function=acquire, readout_function=readout, overlap_readout=overlap_readout, readout_buffers=1)
+            syst.add_mirror("x", SimulatedMirror(latency=latency))
+            syst.add_mirror("y", None)
+            syst.simulation = True
+            syst.simulation_mirror_set = ["x","y"]
+            self.assertFalse(syst.supports_batch_measurement)
+            
+            start_time = time.perf_counter()
+            response = syst.measure_batch(positions)
+            elapsed[overlap_readout] = time.perf_counter() - start_time
+            
+            # every count is attributed to the position it was acquired at
+            np.testing.assert_allclose(response, 10*positions[:, 0] + positions[:, 1])
+            self.assertEqual(syst.get_mirror_position("x"), 0.9)
+            self.assertAlmostEqual(syst.measure_ion_response(), 8.5)
+        
+        # moves overlap readouts
+        self.assertLess(elapsed[True], 0.8*elapsed[False])
+        
+        # an error in a readout is raised once the pipeline is drained
+        syst.readout_function = lambda raw: 1/(raw[0] - 0.9)
+        with self.assertRaises(ZeroDivisionError):
+            syst.measure_batch(positions)
+
+    def test_measurement_ledger(self):
+        now = [0.]
+        ledger = MeasurementLedger(resolution=1e-3, min_samples=2, max_entries=2, time_to_live=10, clock=lambda: now[0])
+        
+        self.assertIsNone(ledger.lookup([0.1, 0.2]))
+        ledger.record([0.1, 0.2], 4)
+        self.assertIsNone(ledger.lookup([0.1, 0.2]))
+        # nearly the same position shares the entry
+        ledger.record([0.1, 0.2001], 6)
+        self.assertEqual(ledger.lookup([0.1, 0.2]), 5)
+        self.assertEqual(ledger.statistics([0.1, 0.2]), (2, 5, 2))
+        self.assertEqual((ledger.hits, ledger.misses), (1, 2))
+        
+        # least recently used entry is evicted beyond max_entries
+        ledger.record([0.3, 0.3], 1)
+        ledger.lookup([0.1, 0.2])
+        ledger.record([0.5, 0.5], 1)
+        self.assertIsNone(ledger.statistics([0.3, 0.3]))
+        self.assertIsNotNone(ledger.statistics([0.1, 0.2]))
+        
+        # entries expire after time_to_live
+        now[0] = 11.
+        self.assertIsNone(ledger.lookup([0.1, 0.2]))
+        self.assertEqual(ledger.evictions, 2)
+        
+        # repeated measurements through the system are answered by the ledger
+        calls = []
+        def ion_response_function(x):
+            calls.append(x)
+            return 10
+        syst = LaserCalibrationSystem(ion_response_function=ion_response_function, ledger=MeasurementLedger(min_samples=3))
+        syst.add_mirror("x", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x"]
+        
+        [syst.move_mirrors_and_measure(x=0.1) for sample in range(5)]
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((syst.ledger.hits, syst.ledger.misses), (2, 3))
+
+    def test_spsa_optimize(self):
+        np.random.seed(0)
+        centers = [0.1, -0.2, 0.15, 0.05, -0.1, 0.2]
+        photon_distribution = lambda *r: 100*np.exp(-sum((r[index]-centers[index])**2/0.3**2 for index in range(6)))
+        sim = IonResponseSimulation(photon_distribution)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        mirror_names = ["x"+str(index) for index in range(6)]
+        for mirror_name in mirror_names:
+            syst.add_mirror(mirror_name, None)
+        syst.simulation = True
+        syst.simulation_mirror_set = mirror_names
+        
+        output, info = spsa_optimize(laser_syst=syst, budget=2000, seed=0, full_output=True)
+        
+        self.assertEqual(info["number_of_measurements"], 2000)
+        for index, mirror_name in enumerate(mirror_names):
+            self.assertLess(abs(output[mirror_name] - centers[index]), 0.05)
+
+    def test_bayesian_optimize(self):
+        np.random.seed(0)
+        x_center = 0.3
+        y_center = -0.4
+        sim = GaussianIonResponseSimulation(photon_number=100, x_center=x_center, y_center=y_center, x_width=0.3, y_width=0.25)
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", None)
+        syst.add_mirror("y", None)
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        # a tenth of the measurements of the default grid sweep
+        output, info = bayesian_optimize(laser_syst=syst, budget=40, seed=0, full_output=True)
+        
+        self.assertEqual(len(info["responses"]), 40)
+        self.assertLess(abs(output['x'] - x_center), 0.05)
+        self.assertLess(abs(output['y'] - y_center), 0.05)
+        
+        # incremental Cholesky updates agree with a direct solve
+        gp = info["gaussian_process"]
+        K = gp.kernel(gp.X, gp.X) + np.diag(np.maximum(gp.y, 1))
+        X_test = np.random.uniform(-1, 1, (5, 2))
+        direct_mean = gp.kernel(X_test, gp.X)@np.linalg.solve(K, gp.y)
+        np.testing.assert_allclose(gp.predict(X_test)[0], direct_mean, rtol=1e-6, atol=1e-8)
+
+    def test_benchmark(self):
+        results = run_benchmark(algorithms=["grid_sweep_optimize", "grid_sweep_optimize_ND"], dimensions=[1, 2], steps=[0.1, 0.2], verbose=False)
+        
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertTrue(result["success"])
+            self.assertEqual(result["number_of_measurements"], round(2/result["step"])**result["dimension"])
+            # raster sweeps change the inner axis at every point and the
+            # outer ones once per line, then move every mirror to the center
+            points_per_axis = round(2/result["step"])
+            self.assertEqual(result["number_of_mirror_moves"], sum(points_per_axis**(index + 1) for index in range(result["dimension"])) + result["dimension"])
+            self.assertIsNone(result["error"])
+            self.assertGreater(result["fit_time"], 0)
+            self.assertLess(result["center_error"], 0.05)
+        
+        # identical runs do not regress, worse ones do
+        self.assertEqual(compare_results(results, results), [])
+        baseline = [dict(result, number_of_measurements=result["number_of_measurements"]//2) for result in results]
+        self.assertEqual(len(compare_results(results, baseline)), 8)
+        
+        # routines that raise fail with their exception recorded
+        ALGORITHMS["failing"] = (lambda syst, step, seed: syst.batch_move_mirrors(x1=2), None, False)
+        try:
+            result, = run_benchmark(algorithms=["failing"], dimensions=[1], verbose=False)
+        finally:
+            del ALGORITHMS["failing"]
+        self.assertFalse(result["success"])
+        self.assertEqual(result["error"], "ValueError: position must be between -1 and 1")
+        
+        # data collected outside of the benchmark is kept, and callbacks do
+        # not see its events
+        events = []
+        callback = lambda phase, duration, items: events.append(phase)
+        instrumentation.add_callback(callback)
+        instrumentation.record("measurement", 0.5)
+        try:
+            run_benchmark(algorithms=["grid_sweep_optimize_ND"], dimensions=[1], verbose=False)
+            self.assertFalse(instrumentation.enabled)
+            self.assertEqual(set(instrumentation.data()), {"measurement"})
+            self.assertEqual(instrumentation.data()["measurement"]["total"], 0.5)
+            self.assertEqual(events, ["measurement"])
+        finally:
+            instrumentation.remove_callback(callback)
+            instrumentation.reset()
+
+    def test_instrumentation(self):
+        photon_distribution = lambda x,y: 100*np.exp(-(x-0.1)**2/0.3**2-(y-0.2)**2/0.4**2)
+        sim = IonResponseSimulation(photon_distribution)
+        
+        syst = LaserCalibrationSystem(ion_response_function=sim.measure_ion_response)
+        syst.add_mirror("x", SimulatedMirror())
+        syst.add_mirror("y", SimulatedMirror())
+        syst.simulation = True
+        syst.simulation_mirror_set = ["x","y"]
+        
+        events = []
+        callback = lambda phase, duration, items: events.append(phase)
+        instrumentation.add_callback(callback)
+        instrumentation.enabled = True
+        try:
+            grid_sweep_optimize_ND(syst, step=0.2, plot=False)
+            syst.move_mirrors_and_measure(x=0.1, y=0.2)
+            data = instrumentation.data()
+        finally:
+            instrumentation.enabled = False
+            instrumentation.remove_callback(callback)
+            instrumentation.reset()
+        
+        self.assertEqual(set(data), {"mirror_move", "measurement", "batch_measurement", "fit"})
+        self.assertEqual(data["batch_measurement"]["items"], 100)
+        self.assertEqual(data["measurement"]["calls"], 1)
+        self.assertEqual(sum(data["fit"]["histogram"]["counts"]), data["fit"]["calls"])
+        self.assertEqual(len(events), sum(statistics["calls"] for statistics in data.values()))
+        
+        # nothing is collected while disabled
+        syst.move_mirrors_and_measure(x=0.1, y=0.2)
+        self.assertEqual(instrumentation.data(), {})
+
 
 if __name__ == "__main__":
     